@@ -1,7 +1,13 @@
 import google.generativeai as genai
+import datetime
+import hashlib
 import logging
+import json
 import os
+import re
+import threading
 import time
+from typing import Callable
 from google.api_core import exceptions as google_exceptions # Import specific exceptions
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,12 +26,132 @@ DEFAULT_SAFETY_SETTINGS = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
 
+DEFAULT_CONTEXT_CACHE_TTL = 3600.0 # seconds a cached prefix lives on the server
+CONTEXT_CACHE_REFRESH_MARGIN = 300.0 # extend the TTL when less than this remains
+CONTEXT_CACHE_RETRY_AFTER = 3600.0 # after a failed cache creation, don't retry for this long
+# Smallest prefix (in tokens) the API accepts for explicit context caching, by model-name prefix.
+CONTEXT_CACHE_MIN_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+}
+DEFAULT_CONTEXT_CACHE_MIN_TOKENS = 32768 # Gemini 1.5 / 2.0 and anything unknown
+# Conservative characters-per-token for English prose and code (typical is ~4); a prefix whose
+# length divided by this is under the minimum cannot be cached, so count_tokens is not called.
+CONTEXT_CACHE_CHARS_PER_TOKEN = 3
+
+AI_BACKEND_GEMINI = "gemini"
+AI_BACKEND_STUB = "stub" # offline canned responses, for load tests and development without an API key
+DEFAULT_STUB_LATENCY = 1.0 # seconds the stub takes per response, spread over its streamed chunks
+STUB_STREAM_CHUNKS = 20
+
 class AIClientError(Exception):
     pass
 
 
 _gemini_configured = False
 
+# --- Context Cache Registry
+# (model_name, prefix_hash) -> {'cache': CachedContent, 'expires_at': float}
+_context_caches: dict[tuple[str, str], dict] = {}
+# (model_name, prefix_hash) -> time before which caching is not attempted again
+_context_cache_unsupported: dict[tuple[str, str], float] = {}
+# keys whose cache is being created or extended; the network call runs outside the lock
+_context_cache_in_flight: set[tuple[str, str]] = set()
+_context_cache_lock = threading.Lock()
+
+
+def _context_cache_key(model_name: str, system_instruction: str) -> tuple[str, str]:
+    return model_name, hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()
+
+
+def _context_cache_min_tokens(model_name: str) -> int:
+    name = model_name.removeprefix("models/")
+    for prefix, min_tokens in CONTEXT_CACHE_MIN_TOKENS.items():
+        if name.startswith(prefix):
+            return min_tokens
+    return DEFAULT_CONTEXT_CACHE_MIN_TOKENS
+
+
+def _create_cached_context(model_name: str, system_instruction: str, key: tuple[str, str], ttl: datetime.timedelta):
+    """Creates the server-side cache, or returns None when the prefix is too small to be cached."""
+    min_tokens = _context_cache_min_tokens(model_name)
+    token_count = genai.GenerativeModel(model_name, system_instruction=system_instruction).count_tokens("").total_tokens
+    if token_count < min_tokens:
+        logging.info(
+            f"System instruction has {token_count} tokens, below the {min_tokens}-token minimum for context caching "
+            f"on {model_name}; using uncached prompts."
+        )
+        return None
+    return genai.caching.CachedContent.create(
+        model=model_name,
+        display_name=f"nbgen-{key[1][:16]}",
+        system_instruction=system_instruction,
+        ttl=ttl,
+    )
+
+
+def get_cached_context(model_name: str, system_instruction: str, ttl_seconds: float = DEFAULT_CONTEXT_CACHE_TTL):
+    """
+    Returns a server-side cached-content handle for `system_instruction` on
+    `model_name`, creating it or extending its TTL as needed. Returns None when
+    caching is unavailable (e.g. model unsupported, prefix below the minimum
+    cacheable size); that outcome is remembered for a while so callers fall
+    back to an uncached request without paying for repeated attempts.
+    """
+    min_tokens = _context_cache_min_tokens(model_name)
+    if len(system_instruction) < min_tokens * CONTEXT_CACHE_CHARS_PER_TOKEN:
+        # Clearly too short to reach the minimum; skip the count_tokens round-trip.
+        return None
+
+    key = _context_cache_key(model_name, system_instruction)
+    now = time.time()
+    with _context_cache_lock:
+        if _context_cache_unsupported.get(key, 0) > now:
+            return None
+
+        entry = _context_caches.get(key)
+        if entry and entry['expires_at'] - now > CONTEXT_CACHE_REFRESH_MARGIN:
+            return entry['cache']
+        if key in _context_cache_in_flight:
+            # Another request is creating or extending this cache; don't wait on its network call.
+            return entry['cache'] if entry and entry['expires_at'] > now else None
+        _context_cache_in_flight.add(key)
+
+    ttl = datetime.timedelta(seconds=ttl_seconds)
+    try:
+        if entry and entry['expires_at'] > now:
+            try:
+                entry['cache'].update(ttl=ttl)
+                with _context_cache_lock:
+                    entry['expires_at'] = now + ttl_seconds
+                logging.info(f"Extended context cache TTL for model {model_name}.")
+                return entry['cache']
+            except Exception as e:
+                logging.warning(f"Could not extend context cache, creating a new one: {e}")
+
+        try:
+            cache = _create_cached_context(model_name, system_instruction, key, ttl)
+        except Exception as e:
+            logging.info(f"Context caching unavailable for model {model_name}, using uncached prompts: {e}")
+            cache = None
+
+        with _context_cache_lock:
+            if cache is None:
+                _context_caches.pop(key, None)
+                _context_cache_unsupported[key] = now + CONTEXT_CACHE_RETRY_AFTER
+                return None
+            _context_caches[key] = {'cache': cache, 'expires_at': now + ttl_seconds}
+        logging.info(f"Created context cache {cache.name} for model {model_name}.")
+        return cache
+    finally:
+        with _context_cache_lock:
+            _context_cache_in_flight.discard(key)
+
+
+def invalidate_cached_context(model_name: str, system_instruction: str) -> None:
+    with _context_cache_lock:
+        _context_caches.pop(_context_cache_key(model_name, system_instruction), None)
+
 def get_gemini_response(
     prompt: str,
     api_key: str,
@@ -33,8 +159,23 @@ def get_gemini_response(
     generation_config_override: dict | None = None,
     safety_settings_override: list | None = None,
     max_retries: int = 2,
-    initial_delay: float = 1.0
+    initial_delay: float = 1.0,
+    system_instruction: str | None = None,
+    use_context_cache: bool = False,
+    context_cache_ttl: float = DEFAULT_CONTEXT_CACHE_TTL,
+    cancel_event: threading.Event | None = None,
+    on_text_chunk: Callable[[str], None] | None = None
     ) -> str:
+    """
+    Sends `prompt` to Gemini and returns the response text. A stable
+    `system_instruction` is sent separately from the prompt; with
+    `use_context_cache` it is served from a server-side context cache when the
+    model supports it, falling back transparently to an uncached request.
+    Setting `cancel_event` (e.g. when a hedged duplicate already won) stops
+    any further attempts; an in-flight HTTP call cannot be interrupted.
+    With `on_text_chunk` the response is streamed and each text chunk is
+    passed to it as it arrives; the full text is still returned at the end.
+    """
     
     global _gemini_configured
 
@@ -62,25 +203,55 @@ def get_gemini_response(
     safety_settings = safety_settings_override if safety_settings_override is not None else DEFAULT_SAFETY_SETTINGS
 
     # --- Instantiate Model
-    try:
-        logging.info(f"Instantiating Gemini model: {model_name}")
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            generation_config=gen_config,
-            safety_settings=safety_settings
-        )
-        logging.info("Model instantiated successfully.")
-    except Exception as e:
-        logging.exception(f"Failed to instantiate model: {model_name}")
-        raise AIClientError(f"Failed to create GenerativeModel instance: {e}") from e
+    def instantiate_model(cached_content=None):
+        try:
+            if cached_content is not None:
+                logging.info(f"Instantiating Gemini model {model_name} from context cache {cached_content.name}")
+                model = genai.GenerativeModel.from_cached_content(
+                    cached_content=cached_content,
+                    generation_config=gen_config,
+                    safety_settings=safety_settings
+                )
+            else:
+                logging.info(f"Instantiating Gemini model: {model_name}")
+                model = genai.GenerativeModel(
+                    model_name=model_name,
+                    generation_config=gen_config,
+                    safety_settings=safety_settings,
+                    system_instruction=system_instruction
+                )
+            logging.info("Model instantiated successfully.")
+            return model
+        except Exception as e:
+            logging.exception(f"Failed to instantiate model: {model_name}")
+            raise AIClientError(f"Failed to create GenerativeModel instance: {e}") from e
+
+    cached_content = None
+    if system_instruction and use_context_cache:
+        cached_content = get_cached_context(model_name, system_instruction, context_cache_ttl)
+    model = instantiate_model(cached_content)
 
     # --- Call API with Retries
     current_retry = 0
     delay = initial_delay
     while current_retry <= max_retries:
+        if cancel_event is not None and cancel_event.is_set():
+            logging.info("Gemini request cancelled before sending.")
+            raise AIClientError("Request cancelled.")
+        streamed = False
         try:
             logging.info(f"Sending prompt to Gemini model (Attempt {current_retry + 1}/{max_retries + 1})...")
-            response = model.generate_content(prompt)
+            if on_text_chunk is None:
+                response = model.generate_content(prompt)
+            else:
+                response = model.generate_content(prompt, stream=True)
+                for chunk in response:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise AIClientError("Request cancelled.")
+                    chunk_text = _chunk_text(chunk)
+                    if chunk_text:
+                        streamed = True
+                        on_text_chunk(chunk_text)
 
             logging.info("Received response from Gemini.")
 
@@ -123,11 +294,17 @@ def get_gemini_response(
                 google_exceptions.ServiceUnavailable,
                 google_exceptions.InternalServerError,
                 google_exceptions.ResourceExhausted) as e: # ResourceExhausted could be rate limits
+            if streamed:
+                # The consumer already saw part of this response; a retry would hand it a second, different one.
+                raise AIClientError(f"Streamed response interrupted: {e}") from e
             logging.warning(f"API call failed with retryable error: {type(e).__name__}. Retrying in {delay:.2f}s...")
             if current_retry == max_retries:
                 logging.error(f"API call failed after {max_retries} retries: {e}", exc_info=True)
                 raise AIClientError(f"API call failed after {max_retries} retries: {e}") from e
-            time.sleep(delay)
+            if cancel_event is not None:
+                cancel_event.wait(delay)
+            else:
+                time.sleep(delay)
             current_retry += 1
             delay *= 2 # Exponential backoff
 
@@ -138,6 +315,13 @@ def get_gemini_response(
              logging.error(f"API call failed due to invalid argument: {e}", exc_info=True) # Log trace here, might be bad prompt/config
              raise AIClientError(f"Invalid Argument Error: {e}. Check model name, prompt, or generation config.") from e
         except google_exceptions.NotFound as e:
+             if cached_content is not None:
+                 # The cache expired or was deleted server-side; drop it and retry uncached.
+                 logging.warning(f"Context cache no longer available, retrying without it: {e}")
+                 invalidate_cached_context(model_name, system_instruction)
+                 cached_content = None
+                 model = instantiate_model()
+                 continue
              logging.error(f"API call failed because resource (e.g., model) was not found: {e}", exc_info=False)
              raise AIClientError(f"Model or resource not found: {e}. Check model name: '{model_name}'.") from e
 
@@ -150,3 +334,79 @@ def get_gemini_response(
 
     raise AIClientError("Exited retry loop unexpectedly without success or specific error.")
 
+
+def _chunk_text(chunk) -> str:
+    # chunk.text raises when a chunk carries no text part (e.g. the final chunk holding only the finish reason).
+    try:
+        return chunk.text
+    except (ValueError, AttributeError, IndexError):
+        return ""
+
+
+# --- Stub backend ---
+
+_STUB_FILE_NAME_PATTERN = re.compile(r"^- \*\*File Name:\*\* `(.+?)`$", re.MULTILINE)
+_STUB_LOAD_CALL_PATTERN = re.compile(r"^- \*\*Load With \(detected format\):\*\* `(.+?)`$", re.MULTILINE)
+
+
+def _stub_load_call(file_name: str, prompt: str) -> str:
+    for load_call in _STUB_LOAD_CALL_PATTERN.findall(prompt):
+        if load_call.startswith(f"pd.read_csv({file_name!r}"):
+            return load_call
+    lowered = file_name.lower()
+    if lowered.endswith(('.parquet', '.pq')):
+        return f"pd.read_parquet({file_name!r})"
+    if lowered.endswith(('.feather', '.arrow', '.ipc')):
+        return f"pd.read_feather({file_name!r})"
+    return f"pd.read_csv({file_name!r})"
+
+
+def _stub_cells(prompt: str) -> list[dict]:
+    file_names = list(dict.fromkeys(_STUB_FILE_NAME_PATTERN.findall(prompt)))
+    cells = [
+        {'cell_type': 'markdown', 'source': "# Exploratory Data Analysis\nGenerated by the stub backend."},
+        {'cell_type': 'code', 'source': "import pandas as pd"},
+    ]
+    for i, file_name in enumerate(file_names):
+        cells += [
+            {'cell_type': 'markdown', 'source': f"## Load `{file_name}`"},
+            {'cell_type': 'code', 'source': f"df_{i} = {_stub_load_call(file_name, prompt)}\ndf_{i}.head()"},
+            {'cell_type': 'code', 'source': f"df_{i}.describe(include='all')"},
+        ]
+    cells.append({'cell_type': 'markdown', 'source': "## Next Steps\nReplace the stub backend with a real model."})
+    return cells
+
+
+def get_stub_response(
+    prompt: str,
+    generation_config_override: dict | None = None,
+    latency: float = DEFAULT_STUB_LATENCY,
+    cancel_event: threading.Event | None = None,
+    on_text_chunk: Callable[[str], None] | None = None
+    ) -> str:
+    """
+    Offline stand-in for get_gemini_response (AI_BACKEND='stub'): returns a
+    small deterministic notebook that loads the data files named in the prompt,
+    in JSON or tag form to match the requested output. The response takes
+    `latency` seconds and is streamed to `on_text_chunk` in pieces like a real
+    model's, so the service around it can be load-tested without an API key.
+    """
+    schema = (generation_config_override or {}).get('response_schema') or {}
+    if 'replace' in schema.get('properties', {}):
+        text = json.dumps({'replace': [], 'append': []})
+    elif (generation_config_override or {}).get('response_mime_type') == 'application/json':
+        text = json.dumps({'cells': _stub_cells(prompt)}, indent=1)
+    else:
+        tags = {'markdown': "[MARKDOWN]", 'code': "[CODE]"}
+        text = "\n".join(f"{tags[cell['cell_type']]}\n{cell['source']}" for cell in _stub_cells(prompt))
+
+    chunk_size = max(1, -(-len(text) // STUB_STREAM_CHUNKS))
+    pause = latency / max(1, -(-len(text) // chunk_size))
+    for start in range(0, len(text), chunk_size):
+        if cancel_event is not None and cancel_event.wait(pause):
+            raise AIClientError("Request cancelled.")
+        if cancel_event is None:
+            time.sleep(pause)
+        if on_text_chunk is not None:
+            on_text_chunk(text[start:start + chunk_size])
+    return text
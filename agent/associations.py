@@ -0,0 +1,249 @@
+import logging
+import warnings
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ASSOCIATION_SAMPLE_ROWS = 10000  # rows sampled for correlation statistics
+CRAMERS_V_SAMPLE_ROWS = 5000  # smaller sample for the one-hot contingency products
+ASSOCIATION_TOP_K = 15  # strongest pairs reported per method
+COLUMN_BLOCK_SIZE = 256  # columns per block in the blocked matrix products
+CRAMERS_V_MAX_LEVELS = 50  # categoricals with more distinct values are treated as identifiers and skipped
+CRAMERS_V_MAX_TOTAL_LEVELS = 4000  # bounds the one-hot width (and so the cost) of the Cramér's V pass
+MIN_PAIRWISE_ROWS = 10  # correlations over fewer rows where both columns are present are not reported
+
+
+def _select_top_k(values: np.ndarray, rows: np.ndarray, cols: np.ndarray, k: int):
+    """Keeps the k entries with the largest absolute value."""
+    if len(values) <= k:
+        return values, rows, cols
+    keep = np.argpartition(-np.abs(values), k - 1)[:k]
+    return values[keep], rows[keep], cols[keep]
+
+
+def _collect_upper_triangle(block: np.ndarray, row_offset: int, col_offset: int, k: int):
+    """
+    Takes a block of a symmetric association matrix (rows `row_offset...`,
+    columns `col_offset...`) and returns its top-k entries strictly above the
+    diagonal, skipping NaNs.
+    """
+    rows = np.arange(block.shape[0])[:, None] + row_offset
+    cols = np.arange(block.shape[1])[None, :] + col_offset
+    mask = (cols > rows) & ~np.isnan(block)
+    values = block[mask]
+    row_idx = np.broadcast_to(rows, block.shape)[mask]
+    col_idx = np.broadcast_to(cols, block.shape)[mask]
+    return _select_top_k(values, row_idx, col_idx, k)
+
+
+def _merge_candidates(candidates, new, k: int):
+    values = np.concatenate([candidates[0], new[0]])
+    rows = np.concatenate([candidates[1], new[1]])
+    cols = np.concatenate([candidates[2], new[2]])
+    return _select_top_k(values, rows, cols, k)
+
+
+def _empty_candidates():
+    return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+
+def _standardize_columns(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Centers and scales each column by its own non-missing values (which
+    leaves correlations unchanged but keeps the sums below well conditioned),
+    then splits it into values with NaNs zeroed and a 0/1 presence mask.
+    """
+    matrix = matrix.astype(np.float64, copy=True)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns
+        matrix -= np.nanmean(matrix, axis=0)
+        stds = np.nanstd(matrix, axis=0)
+        matrix /= np.where(stds > 0, stds, 1.0)
+    mask = ~np.isnan(matrix)
+    return np.where(mask, matrix, 0.0), mask.astype(np.float64)
+
+
+def _pairwise_correlation_block(x_a, m_a, x_b, m_b) -> np.ndarray:
+    """
+    Pearson correlation of every column of block a with every column of block
+    b over the rows where both are present (pandas' pairwise-complete
+    semantics), from matrix products of the zero-filled values and their masks.
+    """
+    n = m_a.T @ m_b
+    sum_a = x_a.T @ m_b
+    sum_b = m_a.T @ x_b
+    sum_aa = (x_a * x_a).T @ m_b
+    sum_bb = m_a.T @ (x_b * x_b)
+    sum_ab = x_a.T @ x_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sum_ab - sum_a * sum_b / n
+        var_a = sum_aa - sum_a ** 2 / n
+        var_b = sum_bb - sum_b ** 2 / n
+        corr = cov / np.sqrt(var_a * var_b)
+    # Constant (on the shared rows) or barely overlapping pairs have no meaningful correlation.
+    tolerance = 1e-9 * n
+    corr[(n < MIN_PAIRWISE_ROWS) | (var_a <= tolerance) | (var_b <= tolerance)] = np.nan
+    return np.clip(corr, -1.0, 1.0).astype(np.float32)
+
+
+def _blocked_top_correlations(matrix: np.ndarray, k: int, block_size: int):
+    """Top-k |pairwise-complete correlation| pairs without materializing the full matrix."""
+    values, mask = _standardize_columns(matrix)
+    n_cols = values.shape[1]
+    candidates = _empty_candidates()
+    for start in range(0, n_cols, block_size):
+        stop = min(start + block_size, n_cols)
+        # Only the columns from `start` onwards can sit above the diagonal for this row block.
+        block = _pairwise_correlation_block(
+            values[:, start:stop], mask[:, start:stop], values[:, start:], mask[:, start:]
+        )
+        candidates = _merge_candidates(candidates, _collect_upper_triangle(block, start, start, k), k)
+    return candidates
+
+
+def _blocked_top_cramers_v(codes: np.ndarray, n_levels: np.ndarray, k: int, block_size: int):
+    """
+    Top-k Cramér's V pairs for integer-coded categoricals. The contingency
+    tables of a whole column block against every other column come from one
+    one-hot matrix product; phi² = sum(n_ij² / (n_i n_j)) - 1 is then reduced
+    per column pair with `np.add.reduceat`.
+    """
+    n_rows, n_cols = codes.shape
+    level_offsets = np.concatenate([[0], np.cumsum(n_levels)[:-1]])
+    total_levels = int(n_levels.sum())
+
+    one_hot = np.zeros((n_rows, total_levels), dtype=np.float32)
+    one_hot[np.arange(n_rows)[:, None], level_offsets[None, :] + codes] = 1.0
+    level_counts = one_hot.sum(axis=0)
+
+    candidates = _empty_candidates()
+    for start in range(0, n_cols, block_size):
+        stop = min(start + block_size, n_cols)
+        lvl_start = level_offsets[start]
+        lvl_stop = level_offsets[stop] if stop < n_cols else total_levels
+        col_lvl_start = lvl_start
+
+        contingency = one_hot[:, lvl_start:lvl_stop].T @ one_hot[:, col_lvl_start:]
+        weighted = contingency ** 2 / np.outer(level_counts[lvl_start:lvl_stop], level_counts[col_lvl_start:])
+        per_row_col = np.add.reduceat(weighted, level_offsets[start:stop] - lvl_start, axis=0)
+        phi2 = np.add.reduceat(per_row_col, level_offsets[start:] - col_lvl_start, axis=1) - 1.0
+
+        min_dim = np.minimum(n_levels[start:stop, None], n_levels[None, start:]) - 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cramers_v = np.sqrt(np.clip(phi2, 0.0, None) / np.where(min_dim > 0, min_dim, np.nan))
+        candidates = _merge_candidates(candidates, _collect_upper_triangle(cramers_v, start, start, k), k)
+    return candidates
+
+
+def _to_pairs(candidates, columns: list, method: str) -> list[dict]:
+    values, rows, cols = candidates
+    order = np.argsort(-np.abs(values))
+    return [
+        {
+            'column_a': columns[rows[i]],
+            'column_b': columns[cols[i]],
+            'method': method,
+            'value': round(float(values[i]), 4),
+        }
+        for i in order
+    ]
+
+
+def compute_association_summary(
+    df: pd.DataFrame,
+    top_k: int = ASSOCIATION_TOP_K,
+    sample_rows: int = ASSOCIATION_SAMPLE_ROWS,
+    block_size: int = COLUMN_BLOCK_SIZE,
+) -> dict:
+    """
+    Finds the strongest column relationships on a bounded row sample:
+    Pearson and Spearman for numeric columns (over pairwise-complete rows),
+    Cramér's V for low-cardinality categoricals. Only the top-k pairs per
+    method are kept, so memory stays O(rows x columns) instead of O(columns²).
+
+    Returns a dict with 'pearson', 'spearman' and 'cramers_v' lists of
+    {'column_a', 'column_b', 'method', 'value'} plus a 'notes' list.
+    """
+    notes = []
+    if len(df) > sample_rows:
+        df = df.sample(n=sample_rows, random_state=0)
+        notes.append(f"Computed on a random sample of {sample_rows} rows.")
+
+    numeric_columns = [
+        c for c in df.columns
+        if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])
+    ]
+    result = {'pearson': [], 'spearman': [], 'cramers_v': [], 'notes': notes}
+
+    # --- Numeric: Pearson on raw values, Spearman on ranks
+    if len(numeric_columns) >= 2:
+        values = df[numeric_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        result['pearson'] = _to_pairs(_blocked_top_correlations(values, top_k, block_size), numeric_columns, 'pearson')
+
+        # Each column is ranked once over its own values; pandas re-ranks every pair's shared rows,
+        # so with missing values Spearman here is a close approximation rather than exact.
+        ranks = df[numeric_columns].rank(method='average').to_numpy(dtype=np.float64, na_value=np.nan)
+        result['spearman'] = _to_pairs(_blocked_top_correlations(ranks, top_k, block_size), numeric_columns, 'spearman')
+        if np.isnan(values).any():
+            notes.append("Correlations use the rows where both columns are present (pairwise-complete).")
+
+    # --- Categorical: Cramér's V on a smaller sample
+    cat_sample = df if len(df) <= CRAMERS_V_SAMPLE_ROWS else df.sample(n=CRAMERS_V_SAMPLE_ROWS, random_state=0)
+    numeric_set = set(numeric_columns)
+    categorical_columns = []
+    codes = []
+    n_levels = []
+    for column in df.columns:
+        if column in numeric_set:
+            continue
+        column_codes, uniques = pd.factorize(cat_sample[column], use_na_sentinel=True)
+        levels = len(uniques)
+        if (column_codes < 0).any():
+            # Missing values form their own level.
+            column_codes = np.where(column_codes < 0, levels, column_codes)
+            levels += 1
+        if 2 <= levels <= CRAMERS_V_MAX_LEVELS:
+            categorical_columns.append(column)
+            codes.append(column_codes)
+            n_levels.append(levels)
+
+    if len(categorical_columns) >= 2:
+        # Spend the level budget on the columns with fewest levels first.
+        order = np.argsort(n_levels, kind='stable')
+        within_budget = order[np.cumsum(np.asarray(n_levels)[order]) <= CRAMERS_V_MAX_TOTAL_LEVELS]
+        within_budget = np.sort(within_budget)
+        if len(within_budget) < len(categorical_columns):
+            notes.append(
+                f"Cramér's V limited to {len(within_budget)} of {len(categorical_columns)} categorical columns."
+            )
+        categorical_columns = [categorical_columns[i] for i in within_budget]
+        codes_matrix = np.column_stack([codes[i] for i in within_budget]) if len(within_budget) else None
+        levels_array = np.asarray([n_levels[i] for i in within_budget], dtype=np.int64)
+        if codes_matrix is not None and codes_matrix.shape[1] >= 2:
+            # Keep column blocks small enough that a block's one-hot slice stays modest.
+            cat_block = max(1, min(block_size, CRAMERS_V_MAX_TOTAL_LEVELS // CRAMERS_V_MAX_LEVELS))
+            result['cramers_v'] = _to_pairs(
+                _blocked_top_cramers_v(codes_matrix, levels_array, top_k, cat_block),
+                categorical_columns,
+                'cramers_v',
+            )
+
+    return result
+
+
+def format_association_summary(associations: dict) -> str:
+    sections = []
+    for method, label in (('pearson', 'Pearson'), ('spearman', 'Spearman'), ('cramers_v', "Cramér's V")):
+        pairs = associations.get(method) or []
+        if not pairs:
+            continue
+        lines = [f"{label} (strongest {len(pairs)}):"]
+        value_format = '.3f' if method == 'cramers_v' else '+.3f'  # V is unsigned
+        lines += [f"  {p['column_a']} ~ {p['column_b']}: {p['value']:{value_format}}" for p in pairs]
+        sections.append("\n".join(lines))
+    if not sections:
+        return "No notable column associations computed."
+    sections += associations.get('notes') or []
+    return "\n".join(sections)
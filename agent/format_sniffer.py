@@ -0,0 +1,256 @@
+import bz2
+import codecs
+import csv
+import gzip
+import logging
+import lzma
+import os
+import re
+import zipfile
+from collections import Counter
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SNIFF_BYTES = 16 * 1024  # decompressed bytes inspected per file
+SNIFF_MAX_LINES = 100  # csv.Sniffer's quote detection is superlinear; a hundred lines is plenty
+CANDIDATE_DELIMITERS = ',;\t|'
+DELIMITER_CONSISTENCY = 0.9  # share of sampled lines that must agree on a delimiter's field count
+DECIMAL_COMMA_MIN_SHARE = 0.8  # share of fractional numbers written as '1,5' that switches to decimal=','
+_COMMA_DECIMAL_PATTERN = re.compile(r"^[-+]?\d+,\d+$")
+_POINT_DECIMAL_PATTERN = re.compile(r"^[-+]?\d*\.\d+$")
+
+# Leading bytes identifying compressed streams and binary columnar formats.
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+)
+FORMAT_MAGIC = (
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'feather'),  # Feather v2 / Arrow IPC file
+    (b'FEA1', 'feather'),  # Feather v1
+)
+# What pandas' compression='infer' picks from the file name; other suffixes (.gzip, .zstd) read as uncompressed.
+PANDAS_INFERRED_COMPRESSION = {'.gz': 'gzip', '.bz2': 'bz2', '.zip': 'zip', '.xz': 'xz', '.zst': 'zstd'}
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),  # before UTF-16 LE, whose BOM is its prefix
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def detect_magic(file_path: str) -> tuple[str | None, str | None]:
+    """Returns (format, compression) from the file's leading bytes; either may be None."""
+    with open(file_path, 'rb') as f:
+        head = f.read(8)
+    for magic, data_format in FORMAT_MAGIC:
+        if head.startswith(magic):
+            return data_format, None
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return None, compression
+    return None, None
+
+
+def _open_decompressed(file_path: str, compression: str | None):
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(file_path, 'rb')
+    if compression == 'xz':
+        return lzma.open(file_path, 'rb')
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.open(file_path, 'rb')
+    return open(file_path, 'rb')
+
+
+def read_head(file_path: str, compression: str | None, num_bytes: int = SNIFF_BYTES) -> bytes:
+    """Reads up to `num_bytes` of decompressed content; streaming readers stop early, so this is cheap for any file size."""
+    if compression == 'zip':
+        # Like pandas, read the archive's single (first) member.
+        with zipfile.ZipFile(file_path) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if not members:
+                raise ValueError(f"Zip archive {file_path} contains no files.")
+            with archive.open(members[0]) as f:
+                return f.read(num_bytes)
+    with _open_decompressed(file_path, compression) as f:
+        return f.read(num_bytes)
+
+
+def detect_encoding(head: bytes) -> tuple[str, bool]:
+    """
+    Returns (encoding, has_bom). Without a BOM, UTF-8 is accepted if the sample
+    decodes cleanly (ignoring a sequence cut at the sample's end); otherwise
+    Windows-1252, the usual encoding of "Latin-1" exports, or Latin-1 itself
+    for bytes cp1252 leaves undefined.
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if head.startswith(bom):
+            return encoding, True
+
+    if len(head) >= 4 and head[1::2].count(0) > len(head) // 4 and head[0::2].count(0) == 0:
+        return 'utf-16-le', False
+    if len(head) >= 4 and head[0::2].count(0) > len(head) // 4 and head[1::2].count(0) == 0:
+        return 'utf-16-be', False
+
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8', False
+    except UnicodeDecodeError:
+        pass
+    try:
+        head.decode('cp1252')
+        return 'cp1252', False
+    except UnicodeDecodeError:
+        return 'latin-1', False
+
+
+def _complete_lines(text: str, truncated: bool) -> list[str]:
+    lines = text.splitlines()
+    if truncated and len(lines) > 1:
+        lines = lines[:-1]  # the last line was cut by the sample size
+    return [line for line in lines if line.strip()][:SNIFF_MAX_LINES]
+
+
+def _consistent_field_count(lines: list[str], delimiter: str) -> int:
+    """The number of fields `delimiter` splits nearly every line into, or 0 if the lines disagree."""
+    counts = Counter(len(row) for row in csv.reader(lines, delimiter=delimiter))
+    fields, agreeing = counts.most_common(1)[0]
+    return fields if agreeing >= DELIMITER_CONSISTENCY * len(lines) else 0
+
+
+def _consistent_delimiter(lines: list[str]) -> str | None:
+    """Fallback when csv.Sniffer gives up: the candidate splitting lines consistently into the most fields."""
+    best, best_fields = None, 1
+    for delimiter in CANDIDATE_DELIMITERS:
+        fields = _consistent_field_count(lines, delimiter)
+        if fields > best_fields:
+            best, best_fields = delimiter, fields
+    return best
+
+
+def _looks_numeric(value: str) -> bool:
+    try:
+        float(value.replace(',', '.'))
+        return True
+    except ValueError:
+        return False
+
+
+def _uses_decimal_comma(rows: list[list[str]]) -> bool:
+    """True when fractional numbers are mostly written European-style ('1,5'), which needs a non-comma delimiter."""
+    comma = point = 0
+    for row in rows:
+        for value in row:
+            value = value.strip()
+            comma += bool(_COMMA_DECIMAL_PATTERN.match(value))
+            point += bool(_POINT_DECIMAL_PATTERN.match(value))
+    return comma > 0 and comma >= DECIMAL_COMMA_MIN_SHARE * (comma + point)
+
+
+def sniff_csv_text(text: str, truncated: bool = False) -> dict:
+    """Detects delimiter, quoting and header presence from a decoded text sample."""
+    lines = _complete_lines(text, truncated)
+    dialect = {
+        'delimiter': ',', 'quotechar': '"', 'escapechar': None, 'decimal': '.', 'has_header': True, 'num_fields': 0,
+    }
+    if not lines:
+        return dialect
+    sample = "\n".join(lines)
+
+    sniffer = csv.Sniffer()
+    delimiter = None
+    try:
+        sniffed = sniffer.sniff(sample, delimiters=CANDIDATE_DELIMITERS)
+        # Sniffer can pick a delimiter that only appears inside quoted text; require it to split rows consistently.
+        if _consistent_field_count(lines, sniffed.delimiter) > 1:
+            delimiter = sniffed.delimiter
+            # Sniffer's doublequote is False whenever no doubled quote appears in the sample, so only the escape char is kept.
+            dialect.update({'quotechar': sniffed.quotechar or '"', 'escapechar': sniffed.escapechar})
+    except csv.Error:
+        pass
+    dialect['delimiter'] = delimiter or _consistent_delimiter(lines) or ','
+    dialect['num_fields'] = _consistent_field_count(lines, dialect['delimiter'])
+    if dialect['delimiter'] != ',':
+        rows = list(csv.reader(lines[1:], delimiter=dialect['delimiter'], quotechar=dialect['quotechar']))
+        if _uses_decimal_comma(rows):
+            dialect['decimal'] = ','
+
+    if len(lines) > 1:
+        try:
+            has_header = sniffer.has_header(sample)
+        except csv.Error:
+            has_header = True
+        if not has_header:
+            # Only trust "no header" when the first row itself looks like data; a wrong guess loses the column names.
+            first_row = next(csv.reader([lines[0]], delimiter=dialect['delimiter'], quotechar=dialect['quotechar']))
+            has_header = not any(_looks_numeric(value) for value in first_row if value.strip())
+        dialect['has_header'] = has_header
+    return dialect
+
+
+def sniff_file(file_path: str, num_bytes: int = SNIFF_BYTES) -> dict:
+    """
+    Inspects only the first `num_bytes` (decompressed) of a data file and
+    returns a dict with 'format' ('csv', 'parquet' or 'feather'),
+    'compression', and for CSVs 'encoding', 'bom', 'delimiter', 'quotechar',
+    'escapechar', 'decimal', 'has_header' and 'num_fields'.
+    """
+    data_format, compression = detect_magic(file_path)
+    if data_format is not None:
+        return {'format': data_format, 'compression': None}
+
+    head = read_head(file_path, compression, num_bytes)
+    encoding, has_bom = detect_encoding(head)
+    truncated = len(head) >= num_bytes
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(head, final=not truncated)
+    result = {'format': 'csv', 'compression': compression, 'encoding': encoding, 'bom': has_bom}
+    result.update(sniff_csv_text(text.lstrip('\ufeff'), truncated))
+    logging.info(
+        f"Sniffed {os.path.basename(file_path)}: compression={compression}, encoding={encoding}, "
+        f"delimiter={result['delimiter']!r}, header={result['has_header']}"
+    )
+    return result
+
+
+def csv_read_kwargs(sniffed: dict) -> dict:
+    """
+    pandas.read_csv keyword arguments matching a sniffed CSV. Header-less
+    files get `column_1`, `column_2`, ... names so summaries and generated
+    code never deal with integer column labels.
+    """
+    kwargs = {
+        'sep': sniffed.get('delimiter', ','),
+        'encoding': sniffed.get('encoding', 'utf-8'),
+        'compression': sniffed.get('compression') or None,
+        'quotechar': sniffed.get('quotechar', '"'),
+        'decimal': sniffed.get('decimal', '.'),
+        'header': 0,
+    }
+    if not sniffed.get('has_header', True) and sniffed.get('num_fields'):
+        kwargs['header'] = None
+        kwargs['names'] = [f"column_{i + 1}" for i in range(sniffed['num_fields'])]
+    if sniffed.get('escapechar'):
+        kwargs['escapechar'] = sniffed['escapechar']
+    return kwargs
+
+
+def format_read_call(file_name: str, read_kwargs: dict) -> str:
+    """
+    The pandas call that loads the file, with only the non-default options
+    spelled out. Compression is included only when it differs from what
+    pandas infers from the file name (e.g. a gzip file named data.csv).
+    """
+    defaults = {'sep': ',', 'encoding': 'utf-8', 'quotechar': '"', 'decimal': '.', 'header': 0}
+    defaults['compression'] = PANDAS_INFERRED_COMPRESSION.get(os.path.splitext(file_name.lower())[1])
+    options = [
+        f"{key}={value!r}" for key, value in read_kwargs.items()
+        if defaults.get(key, object()) != value and not (key == 'compression' and value == 'infer')
+    ]
+    return f"pd.read_csv({', '.join([repr(file_name)] + options)})"
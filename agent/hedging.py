@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_HEDGE_PERCENTILE = 95.0  # hedge once the primary is slower than this share of past calls
+DEFAULT_HEDGE_DELAY = 30.0  # seconds; used until enough latencies have been observed
+MIN_HEDGE_DELAY = 2.0  # never hedge sooner than this, even for very fast models
+LATENCY_WINDOW = 200  # most recent latencies kept per model
+MIN_LATENCY_SAMPLES = 10  # observations required before trusting the percentile
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per model, including lower bounds for cancelled hedge losers."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._latencies: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(model_name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model_name: str, pct: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._latencies.get(model_name, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        index = min(len(samples) - 1, max(0, round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgeStats:
+    """Counters describing how often hedging fires and which request wins."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.failures = 0
+
+    def record(self, hedged: bool, winner: str | None) -> None:
+        with self._lock:
+            self.requests += 1
+            self.hedges_fired += int(hedged)
+            if winner == 'hedge':
+                self.hedge_wins += 1
+            elif winner == 'primary':
+                self.primary_wins += 1
+            else:
+                self.failures += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges_fired': self.hedges_fired,
+                'hedge_rate': self.hedges_fired / self.requests if self.requests else 0.0,
+                'hedge_wins': self.hedge_wins,
+                'primary_wins': self.primary_wins,
+                'failures': self.failures,
+            }
+
+
+_latency_tracker = LatencyTracker()
+_hedge_stats = HedgeStats()
+
+
+def get_hedge_stats() -> dict:
+    return _hedge_stats.snapshot()
+
+
+def compute_hedge_delay(
+    model_name: str,
+    percentile: float = DEFAULT_HEDGE_PERCENTILE,
+    default_delay: float = DEFAULT_HEDGE_DELAY,
+    min_delay: float = MIN_HEDGE_DELAY,
+) -> float:
+    observed = _latency_tracker.percentile(model_name, percentile)
+    if observed is None:
+        return default_delay
+    return max(min_delay, observed)
+
+
+def run_hedged(
+    primary: tuple[str, Callable[[threading.Event], Any]],
+    hedge: tuple[str, Callable[[threading.Event], Any]],
+    delay: float,
+) -> tuple[Any, str]:
+    """
+    Runs `primary` and, if it has not produced an accepted result within
+    `delay` seconds (or has already failed), also runs `hedge`. Each side is a
+    (model_name, fn) pair; `fn(cancel_event)` must return an accepted result
+    or raise. The first accepted result wins and the other side's cancel event
+    is set so it stops as soon as it can.
+
+    Returns (result, 'primary' | 'hedge'). If both sides fail, the primary's
+    exception is re-raised.
+    """
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedged-request")
+    cancel_events = {'primary': threading.Event(), 'hedge': threading.Event()}
+    models = {'primary': primary[0], 'hedge': hedge[0]}
+    started = {}
+    futures = {}
+    errors = {}
+
+    def launch(label: str, fn: Callable[[threading.Event], Any]):
+        started[label] = time.monotonic()
+        futures[executor.submit(fn, cancel_events[label])] = label
+
+    try:
+        launch('primary', primary[1])
+        done, _ = wait(futures, timeout=delay)
+        hedged = False
+        while True:
+            for future in done:
+                label = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.warning(f"Hedged request '{label}' ({models[label]}) failed: {e}")
+                    errors[label] = e
+                    continue
+                finished = time.monotonic()
+                _latency_tracker.record(models[label], finished - started[label])
+                for other in cancel_events:
+                    if other != label:
+                        cancel_events[other].set()
+                for other in futures.values():
+                    # The cancelled loser would have taken at least this long. Recording that censored
+                    # sample keeps slow calls in the window; otherwise only winners are sampled and the
+                    # percentile (and so the hedge delay) drifts down toward MIN_HEDGE_DELAY.
+                    elapsed = finished - started[other]
+                    if elapsed >= delay:
+                        _latency_tracker.record(models[other], elapsed)
+                _hedge_stats.record(hedged, label)
+                if hedged:
+                    logging.info(f"Hedged generation won by '{label}' ({models[label]}).")
+                return result, label
+
+            if not hedged:
+                hedged = True
+                logging.info(f"No accepted result from {models['primary']} within {delay:.1f}s; hedging with {models['hedge']}.")
+                launch('hedge', hedge[1])
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+        _hedge_stats.record(hedged, None)
+        raise errors.get('primary') or errors['hedge']
+    finally:
+        # Don't block on the losing request; it observes its cancel event and exits on its own.
+        executor.shutdown(wait=False, cancel_futures=True)
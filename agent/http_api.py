@@ -0,0 +1,530 @@
+import argparse
+import email.parser
+import email.policy
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from . import ai_client
+from . import job_queue
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_MODEL_NAME = "gemini-2.0-flash"
+DEFAULT_MAX_CONNECTIONS = 64  # concurrent connections (one handler thread each); more are answered 503
+DEFAULT_MAX_PENDING_JOBS = 32  # queued + running jobs before /generate answers 503
+DEFAULT_MAX_REQUEST_MB = 100  # request bodies above this are answered 413 without being read
+KEEPALIVE_TIMEOUT = 15.0  # idle seconds before a persistent connection is closed
+RETRY_AFTER_SECONDS = 5
+EVENTS_POLL_INTERVAL = 0.25  # seconds between job database checks while streaming events
+EVENTS_HEARTBEAT_INTERVAL = 15.0  # comment line sent when nothing happened, so proxies keep the stream open
+
+# Non-secret settings a client may choose per request; everything else comes from the server's environment.
+# Validation executes the generated code, so VALIDATE_NOTEBOOK and REPAIR_ON_VALIDATION_FAILURE are server settings.
+CLIENT_CONFIG_KEYS = (
+    'GEMINI_MODEL_NAME', 'OUTPUT_MODE', 'HEDGE_ENABLED', 'HEDGE_MODEL_NAME',
+    'SCHEMA_CACHE_ENABLED', 'SCHEMA_CACHE_MIN_SIMILARITY', 'SCHEMA_CACHE_DELTA',
+)
+FINISHED_JOB_STATUSES = (job_queue.JOB_SUCCEEDED, job_queue.JOB_FAILED)
+JOB_PATH_PATTERN = re.compile(r"^/jobs/([0-9a-f]{32})(/events|/notebook)?$")
+
+
+class HTTPAPIError(Exception):
+    """Raised by request handlers to answer with an error status and JSON message."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("1", "true", "yes")
+
+
+def server_config_from_env() -> dict:
+    """Base pipeline config for API requests, read from the environment (and .env) like the Streamlit app."""
+    config = {
+        'GEMINI_API_KEY': os.environ.get("GEMINI_API_KEY", ""),
+        'GEMINI_MODEL_NAME': os.environ.get("GEMINI_MODEL_NAME", DEFAULT_MODEL_NAME),
+        'AI_BACKEND': os.environ.get("AI_BACKEND", ai_client.AI_BACKEND_GEMINI),
+        'OUTPUT_MODE': 'json',
+        'SANDBOX_INPUT_PROCESSING': _env_flag("SANDBOX_INPUT_PROCESSING"),
+        'USE_CONTEXT_CACHE': _env_flag("USE_CONTEXT_CACHE"),
+        'VALIDATE_NOTEBOOK': _env_flag("VALIDATE_NOTEBOOK"),
+        'REPAIR_ON_VALIDATION_FAILURE': _env_flag("VALIDATE_NOTEBOOK") and _env_flag("REPAIR_ON_VALIDATION_FAILURE"),
+    }
+    if os.environ.get("AI_STUB_LATENCY"):
+        config['AI_STUB_LATENCY'] = float(os.environ["AI_STUB_LATENCY"])
+    return config
+
+
+def _safe_file_name(file_name: str | None) -> str:
+    name = os.path.basename((file_name or "").replace('\\', '/'))
+    if not name or name in ('.', '..'):
+        raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"Invalid upload file name: {file_name!r}")
+    return name
+
+
+# --- Server ---
+
+class NotebookAPIServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer with a hard cap on concurrent connections: a connection
+    beyond `max_connections` gets an immediate 503 instead of another thread.
+    Generation requests go through the job queue, so a request thread only
+    parses input and streams results; the queue's workers bound the actual
+    generation concurrency.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        queue: job_queue.JobQueue,
+        base_config: dict,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_pending_jobs: int = DEFAULT_MAX_PENDING_JOBS,
+        max_request_bytes: int = DEFAULT_MAX_REQUEST_MB * 1024 * 1024,
+        input_roots: list[str] | None = None,
+    ):
+        super().__init__(server_address, _RequestHandler)
+        self.queue = queue
+        self.base_config = base_config
+        self.max_pending_jobs = max_pending_jobs
+        self.max_request_bytes = max_request_bytes
+        self.input_roots = [os.path.realpath(root) for root in input_roots or []]
+        self.stopping = threading.Event()
+        self._connection_slots = threading.BoundedSemaphore(max_connections)
+
+    def process_request(self, request, client_address):
+        if not self._connection_slots.acquire(blocking=False):
+            self._reject_busy(request)
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connection_slots.release()
+
+    def _reject_busy(self, request) -> None:
+        body = json.dumps({'error': "Server busy, retry later."}).encode('utf-8')
+        head = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Retry-After: {RETRY_AFTER_SECONDS}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            request.sendall(head.encode('ascii') + body)
+        except OSError:
+            pass
+
+    def server_close(self):
+        self.stopping.set()  # ends open event streams
+        super().server_close()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # persistent connections; every response carries a Content-Length
+    server_version = "NotebookGeneratorAPI/1.0"
+    timeout = KEEPALIVE_TIMEOUT
+
+    server: NotebookAPIServer
+    _streaming = False
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method: str) -> None:
+        path = urlsplit(self.path).path.rstrip('/') or '/'
+        try:
+            if method == 'POST' and path == '/generate':
+                return self._handle_generate()
+            if method == 'GET' and path == '/health':
+                return self._send_json(HTTPStatus.OK, {
+                    'status': 'ok', 'active_jobs': self.server.queue.count_active_jobs(),
+                })
+            match = JOB_PATH_PATTERN.match(path)
+            if method == 'GET' and match:
+                job_id, action = match.groups()
+                if action == '/events':
+                    return self._handle_events(job_id)
+                if action == '/notebook':
+                    return self._handle_notebook(job_id)
+                return self._handle_job_status(job_id)
+            raise HTTPAPIError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+        except HTTPAPIError as e:
+            if method == 'POST':
+                self.close_connection = True  # the request body may not have been read
+            headers = {'Retry-After': str(RETRY_AFTER_SECONDS)} if e.status == HTTPStatus.SERVICE_UNAVAILABLE else None
+            self._send_json(e.status, {'error': str(e)}, headers)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            logging.error(f"Unhandled error serving {method} {path}: {e}", exc_info=True)
+            self.close_connection = True
+            if not self._streaming:  # an event stream has already sent its headers
+                self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal server error."})
+
+    # --- Responses ---
+
+    def _send_body(self, status: HTTPStatus, body: bytes, content_type: str, headers: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: HTTPStatus, payload: dict, headers: dict | None = None) -> None:
+        self._send_body(status, json.dumps(payload).encode('utf-8'), "application/json", headers)
+
+    # --- Generate ---
+
+    def handle_expect_100(self):
+        # Clients that send "Expect: 100-continue" (e.g. curl, for large uploads) learn about a 413 before uploading.
+        try:
+            self._checked_content_length()
+        except HTTPAPIError as e:
+            self.close_connection = True
+            self._send_json(e.status, {'error': str(e)})
+            return False
+        return super().handle_expect_100()
+
+    def _checked_content_length(self) -> int:
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            raise HTTPAPIError(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported; send Content-Length.")
+        length = self.headers.get('Content-Length')
+        if length is None:
+            raise HTTPAPIError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required.")
+        try:
+            length = int(length)
+        except ValueError:
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.") from None
+        if length < 0:
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+        if length > self.server.max_request_bytes:
+            raise HTTPAPIError(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                f"Request body exceeds the {self.server.max_request_bytes // (1024 * 1024)} MB limit.",
+            )
+        return length
+
+    def _read_body(self) -> bytes:
+        length = self._checked_content_length()
+        body = self.rfile.read(length)
+        if len(body) != length:
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "Request body ended early.")
+        return body
+
+    def _handle_generate(self) -> None:
+        if self.server.queue.count_active_jobs() >= self.server.max_pending_jobs:
+            raise HTTPAPIError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many generation jobs in flight, retry later.")
+        content_type = self.headers.get('Content-Type', '')
+        body = self._read_body()
+
+        upload_dir = tempfile.mkdtemp(prefix="nbgen-api-")
+        try:
+            if content_type.lower().startswith('multipart/form-data'):
+                request = self._parse_multipart(content_type, body, upload_dir)
+                # Uploads are this request's temp files: hand them to the job instead of copying.
+                input_mode = job_queue.INPUT_MOVE
+            elif content_type.lower().startswith('application/json'):
+                request = self._parse_json_request(body)
+                # Server-side files can be large; the worker reads them in place, nothing is hashed or copied here.
+                input_mode = job_queue.INPUT_REFERENCE
+            else:
+                raise HTTPAPIError(
+                    HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Use multipart/form-data uploads or an application/json body."
+                )
+
+            config = dict(self.server.base_config)
+            client_config = request['config']
+            if not isinstance(client_config, dict):
+                raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "'config' must be a JSON object.")
+            unsupported = sorted(set(client_config) - set(CLIENT_CONFIG_KEYS))
+            if unsupported:
+                raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"Unsupported config keys: {unsupported}")
+            config.update(client_config)
+
+            data_files = request['data_files']
+            if not data_files:
+                raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "At least one data file is required.")
+            if not request['pdf_file']:
+                raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "A PDF data description is required.")
+            try:
+                # Uploads are moved into the job, so the upload directory can go right after submission.
+                job_id = self.server.queue.submit(
+                    csv_file_path=data_files if len(data_files) > 1 else data_files[0],
+                    pdf_file_path=request['pdf_file'],
+                    config=config,
+                    ipynb_file_path=request['ipynb_file'],
+                    user_goal=request['user_goal'],
+                    input_mode=input_mode,
+                )
+            except (FileNotFoundError, ValueError) as e:
+                raise HTTPAPIError(HTTPStatus.BAD_REQUEST, str(e)) from e
+        finally:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+        self._send_json(
+            HTTPStatus.ACCEPTED,
+            {
+                'job_id': job_id,
+                'status_url': f"/jobs/{job_id}",
+                'events_url': f"/jobs/{job_id}/events",
+                'notebook_url': f"/jobs/{job_id}/notebook",
+            },
+            {'Location': f"/jobs/{job_id}"},
+        )
+
+    def _parse_multipart(self, content_type: str, body: bytes, upload_dir: str) -> dict:
+        """
+        Form fields: `data` (one or more data files), `pdf`, optional `ipynb`,
+        optional `user_goal` and optional `config` (a JSON object).
+        """
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body
+        )
+        if not message.is_multipart():
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "Malformed multipart body.")
+
+        request = {'data_files': [], 'pdf_file': None, 'ipynb_file': None, 'user_goal': None, 'config': {}}
+        for part in message.iter_parts():
+            field = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            if field in ('data', 'pdf', 'ipynb'):
+                role_dir = os.path.join(upload_dir, field)
+                os.makedirs(role_dir, exist_ok=True)
+                file_path = os.path.join(role_dir, _safe_file_name(part.get_filename()))
+                if os.path.exists(file_path):
+                    raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"Two uploaded files are named '{part.get_filename()}'.")
+                with open(file_path, 'wb') as f:
+                    f.write(payload)
+                if field == 'data':
+                    request['data_files'].append(file_path)
+                elif request[f"{field}_file"] is not None:
+                    raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"Only one '{field}' file is accepted.")
+                else:
+                    request[f"{field}_file"] = file_path
+            elif field == 'user_goal':
+                request['user_goal'] = payload.decode('utf-8').strip() or None
+            elif field == 'config':
+                try:
+                    request['config'] = json.loads(payload.decode('utf-8') or '{}')
+                except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                    raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"'config' is not valid JSON: {e}") from e
+            else:
+                raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"Unknown form field: {field!r}")
+        return request
+
+    def _allowed_input_path(self, path) -> str:
+        if not isinstance(path, str) or not path:
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"Invalid input path: {path!r}")
+        resolved = os.path.realpath(path)
+        if not any(os.path.commonpath([resolved, root]) == root for root in self.server.input_roots):
+            raise HTTPAPIError(HTTPStatus.FORBIDDEN, f"Input path is outside the allowed input roots: {path}")
+        return resolved
+
+    def _parse_json_request(self, body: bytes) -> dict:
+        """
+        Path-based inputs: {"data_files": [...], "pdf_file": ..., "ipynb_file": ...,
+        "user_goal": ..., "config": {...}}. Paths must lie under one of the
+        server's input roots (HTTP_INPUT_ROOTS); without roots this is disabled.
+        """
+        if not self.server.input_roots:
+            raise HTTPAPIError(
+                HTTPStatus.FORBIDDEN, "Path-based inputs are disabled on this server (HTTP_INPUT_ROOTS is not set)."
+            )
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, f"Request body is not valid JSON: {e}") from e
+        if not isinstance(payload, dict):
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object.")
+
+        data_files = payload.get('data_files') or []
+        if isinstance(data_files, str):
+            data_files = [data_files]
+        if not isinstance(data_files, list):
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "'data_files' must be a path or a list of paths.")
+        user_goal = payload.get('user_goal')
+        if user_goal is not None and not isinstance(user_goal, str):
+            raise HTTPAPIError(HTTPStatus.BAD_REQUEST, "'user_goal' must be a string.")
+        return {
+            'data_files': [self._allowed_input_path(path) for path in data_files],
+            'pdf_file': self._allowed_input_path(payload['pdf_file']) if payload.get('pdf_file') else None,
+            'ipynb_file': self._allowed_input_path(payload['ipynb_file']) if payload.get('ipynb_file') else None,
+            'user_goal': user_goal,
+            'config': payload.get('config') or {},
+        }
+
+    # --- Jobs ---
+
+    def _get_job_or_404(self, job_id: str) -> dict:
+        job = self.server.queue.get_job(job_id)
+        if job is None:
+            raise HTTPAPIError(HTTPStatus.NOT_FOUND, f"Unknown job: {job_id}")
+        return job
+
+    def _handle_job_status(self, job_id: str) -> None:
+        job = self._get_job_or_404(job_id)
+        job.pop('result', None)  # served by /notebook
+        job['cells_generated'] = len(self.server.queue.get_cells(job_id))
+        if job['status'] == job_queue.JOB_SUCCEEDED:
+            job['notebook_url'] = f"/jobs/{job_id}/notebook"
+        self._send_json(HTTPStatus.OK, job)
+
+    def _handle_notebook(self, job_id: str) -> None:
+        job = self._get_job_or_404(job_id)
+        if job['status'] != job_queue.JOB_SUCCEEDED:
+            message = f"Job failed: {job['error']}" if job['status'] == job_queue.JOB_FAILED else "Job has not finished yet."
+            raise HTTPAPIError(HTTPStatus.CONFLICT, message)
+        self._send_body(
+            HTTPStatus.OK,
+            job['result'].encode('utf-8'),
+            "application/x-ipynb+json",
+            {'Content-Disposition': f'attachment; filename="{job_id}.ipynb"'},
+        )
+
+    def _write_event(self, event: str | None, data: dict | None = None, event_id: int | None = None) -> None:
+        if event is None:
+            message = ": keep-alive\n\n"
+        else:
+            message = "" if event_id is None else f"id: {event_id}\n"
+            message += f"event: {event}\ndata: {json.dumps(data or {})}\n\n"
+        self.wfile.write(message.encode('utf-8'))
+        self.wfile.flush()
+        self._last_event_at = time.monotonic()
+
+    def _write_new_cells(self, job_id: str, last_index: int) -> int:
+        for cell in self.server.queue.get_cells(job_id, last_index):
+            last_index = cell['cell_index']
+            self._write_event(
+                'cell', {'index': last_index, 'cell_type': cell['cell_type'], 'source': cell['source']}, last_index
+            )
+        return last_index
+
+    def _handle_events(self, job_id: str) -> None:
+        """
+        Server-sent events for a job: `stage` on each pipeline stage, `cell`
+        ({index, cell_type, source}, with the index as event id) for each cell
+        as the notebook is generated, then one `done` with the final status.
+        A reconnecting client's Last-Event-ID resumes after that cell.
+        """
+        self._get_job_or_404(job_id)
+        try:
+            last_index = int(self.headers.get('Last-Event-ID', -1))
+        except ValueError:
+            last_index = -1
+
+        # The stream has no length, so it ends the connection.
+        self._streaming = True
+        self.close_connection = True
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self._last_event_at = time.monotonic()
+
+        stage = None
+        while not self.server.stopping.is_set():
+            job = self.server.queue.get_job(job_id)
+            last_index = self._write_new_cells(job_id, last_index)
+            if job is None:
+                self._write_event('done', {'status': None, 'error': "Job no longer exists."})
+                return
+            if job['status'] in FINISHED_JOB_STATUSES:
+                # Catch cells recorded between the two queries above.
+                self._write_new_cells(job_id, last_index)
+                done = {'status': job['status'], 'error': job['error'], 'error_type': job['error_type']}
+                if job['status'] == job_queue.JOB_SUCCEEDED:
+                    done['notebook_url'] = f"/jobs/{job_id}/notebook"
+                self._write_event('done', done)
+                return
+
+            if (job['stage'] or job['status']) != stage:
+                stage = job['stage'] or job['status']
+                self._write_event('stage', {'stage': stage})
+            elif time.monotonic() - self._last_event_at > EVENTS_HEARTBEAT_INTERVAL:
+                self._write_event(None)
+            self.server.stopping.wait(EVENTS_POLL_INTERVAL)
+
+
+# --- Entry point ---
+
+def create_server(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    queue: job_queue.JobQueue | None = None,
+    base_config: dict | None = None,
+) -> NotebookAPIServer:
+    """
+    Builds the API server around the process-wide job queue. Limits come from
+    the HTTP_MAX_CONNECTIONS, HTTP_MAX_PENDING_JOBS, HTTP_MAX_REQUEST_MB and
+    HTTP_INPUT_ROOTS (os.pathsep-separated directories for path-based inputs)
+    environment variables.
+    """
+    input_roots = [root for root in os.environ.get("HTTP_INPUT_ROOTS", "").split(os.pathsep) if root]
+    return NotebookAPIServer(
+        (host, port),
+        queue=queue or job_queue.get_job_queue(),
+        base_config=base_config or server_config_from_env(),
+        max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+        max_pending_jobs=int(os.environ.get("HTTP_MAX_PENDING_JOBS", DEFAULT_MAX_PENDING_JOBS)),
+        max_request_bytes=int(float(os.environ.get("HTTP_MAX_REQUEST_MB", DEFAULT_MAX_REQUEST_MB)) * 1024 * 1024),
+        input_roots=input_roots,
+    )
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Headless HTTP API for notebook generation.")
+    parser.add_argument("--host", default=os.environ.get("HTTP_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("HTTP_PORT", DEFAULT_PORT)))
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port)
+    logging.info(f"Notebook generation API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.queue.stop(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
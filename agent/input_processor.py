@@ -1,9 +1,14 @@
+import numpy as np
 import pandas as pd
 import logging
 import io
+import os
 
 import nbformat
 import PyPDF2
+from concurrent.futures import ThreadPoolExecutor
+
+from . import associations, format_sniffer, join_keys
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,52 +16,457 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # --- Csv Processing ---
 
-def process_csv(csv_file_path: str, max_row_preview: int = 5) -> dict:
-    logging.info("processing csv!")
+CSV_DTYPE_SAMPLE_ROWS = 10000  # rows read in the first pass to infer column types
+CATEGORY_MAX_UNIQUE = 1000  # string columns with more distinct values stay as strings
+CATEGORY_MAX_UNIQUE_RATIO = 0.5  # ...as do columns whose distinct values exceed this share of the sample
+MEMORY_SUMMARY_MAX_COLUMNS = 20  # largest columns listed individually in the memory summary
+CSV_COMPRESSION_BY_SUFFIX = {
+    '.gz': 'gzip', '.gzip': 'gzip', '.zst': 'zstd', '.zstd': 'zstd', '.bz2': 'bz2', '.xz': 'xz', '.zip': 'zip',
+}
+
+
+def csv_compression(csv_file_path: str) -> str | None:
+    """The file's compression from its magic bytes (None if uncompressed); the suffix is only a fallback."""
     try:
-        df = pd.read_csv(csv_file_path)
-        logging.info("csv processed!")
+        return format_sniffer.detect_magic(csv_file_path)[1]
+    except OSError:
+        return CSV_COMPRESSION_BY_SUFFIX.get(os.path.splitext(csv_file_path.lower())[1], 'infer')
+
+
+def csv_read_options(csv_file_path: str) -> dict:
+    """
+    Sniffs the first few kilobytes of a CSV for compression, encoding,
+    delimiter, quoting and header and returns matching `pd.read_csv` keyword
+    arguments, so the full parse succeeds on the first attempt.
+    """
+    return format_sniffer.csv_read_kwargs(format_sniffer.sniff_file(csv_file_path))
+
+
+def _infer_csv_dtypes(csv_file_path: str, sample_rows: int, read_options: dict | None = None) -> dict:
+    """
+    First pass: reads a sample of the file and picks `category` for string
+    columns with few distinct values. Numeric columns are left to the full
+    read so a value outside the sampled range cannot overflow a narrow type.
+    """
+    read_options = read_options or csv_read_options(csv_file_path)
+    sample = pd.read_csv(csv_file_path, nrows=sample_rows, **read_options)
+    dtypes = {}
+    for column in sample.columns:
+        series = sample[column]
+        if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+            continue
+        non_null = series.dropna()
+        n_unique = non_null.nunique()
+        if n_unique <= CATEGORY_MAX_UNIQUE and n_unique <= len(non_null) * CATEGORY_MAX_UNIQUE_RATIO:
+            dtypes[column] = 'category'
+    return dtypes
+
+
+def _downcast_numeric_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Narrows integer columns to the smallest type holding their range, and floats to float32 when lossless."""
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            downcast = 'unsigned' if len(series) and series.min() >= 0 else 'integer'
+            df[column] = pd.to_numeric(series, downcast=downcast)
+        elif pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+            narrowed = series.astype(np.float32)
+            if np.array_equal(narrowed.to_numpy(dtype=np.float64), series.to_numpy(), equal_nan=True):
+                df[column] = narrowed
+    return df
+
+
+def _read_csv_with_categories(csv_file_path: str, sample_rows: int, read_options: dict) -> pd.DataFrame:
+    dtypes = _infer_csv_dtypes(csv_file_path, sample_rows, read_options)
+    return pd.read_csv(csv_file_path, dtype=dtypes or None, **read_options)
+
+
+def load_csv_optimized(
+    csv_file_path: str, sample_rows: int = CSV_DTYPE_SAMPLE_ROWS, read_options: dict | None = None
+) -> pd.DataFrame:
+    """
+    Two-phase CSV load: infers dtypes from a sample, then reads the whole file
+    with low-cardinality strings as `category` and numerics downcast. Both
+    passes use the sniffed `read_options` (see csv_read_options).
+    """
+    read_options = read_options or csv_read_options(csv_file_path)
+    return _downcast_numeric_columns(_read_csv_with_categories(csv_file_path, sample_rows, read_options))
+
+
+def plain_load_dtypes(df: pd.DataFrame) -> dict:
+    """
+    Column name -> dtype name a plain load (the summary's `load_call`) gives,
+    for a frame read with `category` columns but not yet downcast: the
+    generated notebook never sees the profiling pass's memory-optimized types.
+    """
+    return {
+        str(column): str(dtype.categories.dtype) if isinstance(dtype, pd.CategoricalDtype) else str(dtype)
+        for column, dtype in df.dtypes.items()
+    }
+
+
+def summarize_memory_usage(df: pd.DataFrame, max_columns: int = MEMORY_SUMMARY_MAX_COLUMNS) -> str:
+    """Deep (including string payloads) memory usage of the profiled frame, largest columns first."""
+    usage = df.memory_usage(deep=True, index=False).sort_values(ascending=False)
+    lines = [f"Total: {usage.sum() / 1024 ** 2:.2f} MB (deep)"]
+    for column, n_bytes in usage.head(max_columns).items():
+        lines.append(f"{column}: {n_bytes / 1024:.1f} KB")
+    if len(usage) > max_columns:
+        lines.append(f"... {len(usage) - max_columns} smaller columns omitted")
+    return "\n".join(lines)
+
+
+def summarize_associations(df: pd.DataFrame) -> str:
+    # Relationship hints are a nice-to-have; never fail the whole summary over them.
+    try:
+        return associations.format_association_summary(associations.compute_association_summary(df))
+    except Exception as e:
+        logging.warning(f"Could not compute column associations: {e}", exc_info=True)
+        return "Column associations could not be computed."
+
 
-        # --extract info
+def column_dtypes(df: pd.DataFrame) -> dict:
+    """Column name -> pandas dtype name, in column order."""
+    return {str(column): str(dtype) for column, dtype in df.dtypes.items()}
 
-        shape = df.shape
-        columns = df.columns.tolist()
 
+def summarize_dtypes(df: pd.DataFrame, dtypes: dict) -> str:
+    """A df.info()-style table reporting `dtypes` (e.g. plain_load_dtypes) instead of the frame's own types."""
+    table = pd.DataFrame(
+        {'Non-Null Count': df.notna().sum().to_numpy(), 'Dtype': [dtypes[str(c)] for c in df.columns]},
+        index=pd.Index([str(c) for c in df.columns], name='Column'),
+    )
+    return f"{len(df)} rows, {len(df.columns)} columns\n{table.to_string()}"
 
-        # --get dtypes as string
 
+def summarize_dataframe(
+    df: pd.DataFrame, file_name: str, max_row_preview: int = 5, loaded_dtypes: dict | None = None
+) -> dict:
+    """`loaded_dtypes`, if given, are the types the notebook's load call produces and are reported instead of df's."""
+    # --extract info
+
+    shape = df.shape
+    columns = df.columns.tolist()
+
+
+    # --get dtypes as string
+
+    if loaded_dtypes:
+        dtypes_string = summarize_dtypes(df, loaded_dtypes)
+    else:
         dtypes_buffer = io.StringIO()
-        df.info(buf=dtypes_buffer)
+        df.info(buf=dtypes_buffer, memory_usage='deep')
         dtypes_string = dtypes_buffer.getvalue()
 
-        head_string  = df.head(max_row_preview).to_string()
+    memory_usage_string = summarize_memory_usage(df)
+
+    head_string  = df.head(max_row_preview).to_string()
+
+    description_string = df.describe(include='all').to_string()
+
+    # -- missing value as string
+    missing_values = df.isnull().sum()
+    missing_values_string = missing_values[missing_values > 0].to_string()
+
+    if not missing_values_string.strip() or "Empty" in missing_values_string:
+        missing_values_string = "No missing Values found!"
+
+    associations_string = summarize_associations(df)
+
+    return {
+        'file_name': file_name,
+        'shape': shape,
+        'columns': columns,
+        'column_dtypes': loaded_dtypes or column_dtypes(df),
+        'dtypes_summary': dtypes_string,
+        'memory_usage_summary': memory_usage_string,
+        'head_preview': head_string,
+        'description_stats': description_string,
+        'missing_values_summary': missing_values_string,
+        'associations_summary': associations_string
+    }
+
+
+def _file_name(file_path: str) -> str:
+    return file_path.rstrip('/\\').split('/')[-1].split('\\')[-1]
 
-        description_string = df.describe(include='all').to_string()
 
-        # -- missing value as string
-        missing_values = df.isnull().sum()
-        missing_values_string = missing_values[missing_values > 0].to_string()
+def _table_name(file_path: str) -> str:
+    name = _file_name(file_path)
+    suffix = data_file_suffix(name)
+    return name[:len(name) - len(suffix)] if suffix and name.lower().endswith(suffix) else name
+
+
+def process_csv(csv_file_path: str, max_row_preview: int = 5, sketch_join_keys: bool = False) -> dict:
+    logging.info("processing csv!")
+    try:
+        read_options = csv_read_options(csv_file_path)
+        df = _read_csv_with_categories(csv_file_path, CSV_DTYPE_SAMPLE_ROWS, read_options)
+        loaded_dtypes = plain_load_dtypes(df)
+        df = _downcast_numeric_columns(df)
+        logging.info("csv processed!")
+
+        summary = summarize_dataframe(df, _file_name(csv_file_path), max_row_preview, loaded_dtypes)
+        summary['load_call'] = format_sniffer.format_read_call(summary['file_name'], read_options)
+        if sketch_join_keys:
+            summary['join_key_sketches'] = join_keys.sketch_dataframe(df, _table_name(csv_file_path))
+        logging.info(f"Successfully processed CSV: {csv_file_path}. Shape={summary['shape']}")
+        return summary
+
+    except Exception as e:
+        logging.error(f"An Error occured {csv_file_path}: {e}")
+        raise Exception(f"Error processing {csv_file_path}: {e}") from e
+
 
-        if not missing_values_string.strip() or "Empty" in missing_values_string:
+# --- Feather Processing ---
+
+def process_feather(feather_file_path: str, max_row_preview: int = 5, sketch_join_keys: bool = False) -> dict:
+    logging.info("processing feather!")
+    try:
+        # Feather already stores exact column types; only the numeric downcast applies.
+        df = pd.read_feather(feather_file_path)
+        loaded_dtypes = column_dtypes(df)
+        df = _downcast_numeric_columns(df)
+        summary = summarize_dataframe(df, _file_name(feather_file_path), max_row_preview, loaded_dtypes)
+        summary['load_call'] = f"pd.read_feather({summary['file_name']!r})"
+        if sketch_join_keys:
+            summary['join_key_sketches'] = join_keys.sketch_dataframe(df, _table_name(feather_file_path))
+        logging.info(f"Successfully processed Feather: {feather_file_path}. Shape={summary['shape']}")
+        return summary
+
+    except Exception as e:
+        logging.error(f"An Error occured {feather_file_path}: {e}")
+        raise Exception(f"Error processing {feather_file_path}: {e}") from e
+
+
+# --- Parquet Processing ---
+
+PARQUET_SAMPLE_ROWS = associations.ASSOCIATION_SAMPLE_ROWS  # rows decoded for the preview and associations
+
+
+def _import_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading Parquet files requires pyarrow (pip install pyarrow).") from e
+    return pq
+
+
+def list_parquet_files(parquet_path: str) -> list[str]:
+    if not os.path.isdir(parquet_path):
+        return [parquet_path]
+    files = []
+    for root, _, names in os.walk(parquet_path):
+        files += [os.path.join(root, n) for n in names if n.endswith(PARQUET_EXTENSIONS)]
+    if not files:
+        raise FileNotFoundError(f"No Parquet files found in directory: {parquet_path}")
+    return sorted(files)
+
+
+def _merge_stat(current, value, pick):
+    if value is None:
+        return current
+    if current is None:
+        return value
+    try:
+        return pick(current, value)
+    except TypeError:
+        return current
+
+
+def _collect_parquet_footer_stats(parquet_files: list, pq) -> tuple:
+    """
+    Aggregates schema, row counts and per-column min/max/null counts from the
+    file footers only. Returns (arrow_schema, num_rows, num_row_groups, column_stats).
+    """
+    schema = None
+    num_rows = 0
+    num_row_groups = 0
+    column_stats = {}
+    for path in parquet_files:
+        metadata = pq.read_metadata(path)
+        if schema is None:
+            schema = metadata.schema.to_arrow_schema()
+        num_rows += metadata.num_rows
+        num_row_groups += metadata.num_row_groups
+        for rg_index in range(metadata.num_row_groups):
+            row_group = metadata.row_group(rg_index)
+            for col_index in range(row_group.num_columns):
+                chunk = row_group.column(col_index)
+                stats = column_stats.setdefault(chunk.path_in_schema, {
+                    'min': None, 'max': None, 'null_count': 0, 'stats_complete': True, 'uncompressed_bytes': 0,
+                })
+                stats['uncompressed_bytes'] += chunk.total_uncompressed_size
+                chunk_stats = chunk.statistics
+                if chunk_stats is None:
+                    stats['stats_complete'] = False
+                    continue
+                if chunk_stats.has_null_count:
+                    stats['null_count'] += chunk_stats.null_count
+                else:
+                    stats['stats_complete'] = False
+                if chunk_stats.has_min_max:
+                    stats['min'] = _merge_stat(stats['min'], chunk_stats.min, min)
+                    stats['max'] = _merge_stat(stats['max'], chunk_stats.max, max)
+    return schema, num_rows, num_row_groups, column_stats
+
+
+def read_parquet_sample(parquet_file: str, sample_rows: int) -> pd.DataFrame:
+    """Decodes only the leading row group(s) needed for `sample_rows` rows."""
+    parquet = _import_parquet().ParquetFile(parquet_file)
+    for batch in parquet.iter_batches(batch_size=sample_rows):
+        return batch.to_pandas()
+    return parquet.schema_arrow.empty_table().to_pandas()
+
+
+def process_parquet(parquet_path: str, max_row_preview: int = 5, sketch_join_keys: bool = False) -> dict:
+    """
+    Profiles a Parquet file (or a directory of Parquet files) from the footer
+    metadata, decoding only the first row group(s) for the preview and the
+    association sample. Shape, types, min/max and null counts cover the full
+    dataset without reading it; join-key sketches cover only the sample.
+    """
+    logging.info("processing parquet!")
+    try:
+        pq = _import_parquet()
+        parquet_files = list_parquet_files(parquet_path)
+        schema, num_rows, num_row_groups, column_stats = _collect_parquet_footer_stats(parquet_files, pq)
+        columns = schema.names
+
+        dtypes_string = (
+            f"{len(parquet_files)} file(s), {num_row_groups} row group(s), {num_rows} rows\n{schema.to_string(show_schema_metadata=False)}"
+        )
+
+        stats_rows = {}
+        for column in columns:
+            stats = column_stats.get(column)
+            if stats is None:
+                continue  # nested column; leaf statistics are not mapped back
+            stats_rows[column] = {
+                'min': stats['min'],
+                'max': stats['max'],
+                'null_count': stats['null_count'] if stats['stats_complete'] else 'N/A',
+                'uncompressed_MB': round(stats['uncompressed_bytes'] / 1024 ** 2, 2),
+            }
+        stats_frame = pd.DataFrame.from_dict(stats_rows, orient='index')
+        description_string = "From Parquet footer statistics (full dataset):\n" + stats_frame.to_string()
+
+        memory_usage = stats_frame['uncompressed_MB'].sort_values(ascending=False) if len(stats_frame) else None
+        memory_lines = [f"Total uncompressed: {sum(s['uncompressed_bytes'] for s in column_stats.values()) / 1024 ** 2:.2f} MB"]
+        if memory_usage is not None:
+            memory_lines += [f"{c}: {mb} MB" for c, mb in memory_usage.head(MEMORY_SUMMARY_MAX_COLUMNS).items()]
+        memory_usage_string = "\n".join(memory_lines)
+
+        known_nulls = {
+            c: row['null_count'] for c, row in stats_rows.items()
+            if row['null_count'] != 'N/A' and row['null_count'] > 0
+        }
+        if known_nulls:
+            missing_values_string = pd.Series(known_nulls).to_string()
+        elif all(row['null_count'] != 'N/A' for row in stats_rows.values()):
             missing_values_string = "No missing Values found!"
+        else:
+            missing_values_string = "Null counts not available in the Parquet footer."
+
+        sample = read_parquet_sample(parquet_files[0], PARQUET_SAMPLE_ROWS)
+        head_string = sample.head(max_row_preview).to_string()
+        associations_string = summarize_associations(sample)
+        if len(sample) < num_rows:
+            associations_string += f"\n(Based on the first {len(sample)} rows of the dataset.)"
 
-        
         summary = {
-            'file_name': csv_file_path.split('/')[-1].split('\\')[-1],
-            'shape': shape,
+            'file_name': _file_name(parquet_path),
+            'shape': (num_rows, len(columns)),
             'columns': columns,
-            'dtypes_summary': dtypes_string, 
+            'column_dtypes': column_dtypes(sample),
+            'dtypes_summary': dtypes_string,
+            'memory_usage_summary': memory_usage_string,
             'head_preview': head_string,
             'description_stats': description_string,
-            'missing_values_summary': missing_values_string
+            'missing_values_summary': missing_values_string,
+            'associations_summary': associations_string,
+            'load_call': f"pd.read_parquet({_file_name(parquet_path)!r})",
         }
-        logging.info(f"Successfully processed CSV: {csv_file_path}. Shape={shape}")
+        if sketch_join_keys:
+            summary['join_key_sketches'] = join_keys.sketch_dataframe(sample, _table_name(parquet_path), num_rows)
+        logging.info(f"Successfully processed Parquet: {parquet_path}. Shape={summary['shape']}")
         return summary
-    
+
     except Exception as e:
-        logging.error(f"An Error occured {csv_file_path}: {e}")
-        raise Exception(f"Error processing {csv_file_path}: {e}") from e
-    
+        logging.error(f"An Error occured {parquet_path}: {e}")
+        raise Exception(f"Error processing {parquet_path}: {e}") from e
+
+
+# --- Data file dispatch ---
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+FEATHER_EXTENSIONS = ('.feather', '.arrow', '.ipc')
+CSV_EXTENSIONS = tuple(
+    base + compressed
+    for base in ('.csv', '.tsv', '.txt')
+    for compressed in ('',) + tuple(CSV_COMPRESSION_BY_SUFFIX)
+)
+DATA_FILE_EXTENSIONS = CSV_EXTENSIONS + PARQUET_EXTENSIONS + FEATHER_EXTENSIONS
+
+
+def data_file_suffix(file_name: str) -> str:
+    """Returns the (possibly compound, e.g. '.csv.gz') extension identifying a data file's format."""
+    lowered = file_name.lower()
+    for extension in sorted(DATA_FILE_EXTENSIONS, key=len, reverse=True):
+        if lowered.endswith(extension):
+            return extension
+    return os.path.splitext(lowered)[1]
+
+
+def detect_data_format(data_file_path: str) -> str:
+    """Parquet and Feather are recognised by their magic bytes first, so a misnamed file still loads correctly."""
+    if os.path.isdir(data_file_path):
+        return 'parquet'
+    try:
+        data_format, compression = format_sniffer.detect_magic(data_file_path)
+    except OSError:
+        data_format, compression = None, None
+    if data_format is not None:
+        return data_format
+    if compression is not None:
+        return 'csv'
+    suffix = data_file_suffix(data_file_path)
+    if suffix in PARQUET_EXTENSIONS:
+        return 'parquet'
+    if suffix in FEATHER_EXTENSIONS:
+        return 'feather'
+    return 'csv'
+
+
+def process_data_file(data_file_path: str, max_row_preview: int = 5, sketch_join_keys: bool = False) -> dict:
+    """
+    Builds the data summary for a CSV (optionally gzip/zstd/bz2/xz/zip
+    compressed), Parquet or Feather input. With `sketch_join_keys` the summary
+    also carries 'join_key_sketches' built from the already loaded data.
+    """
+    data_format = detect_data_format(data_file_path)
+    if data_format == 'parquet':
+        return process_parquet(data_file_path, max_row_preview, sketch_join_keys)
+    if data_format == 'feather':
+        return process_feather(data_file_path, max_row_preview, sketch_join_keys)
+    return process_csv(data_file_path, max_row_preview, sketch_join_keys)
+
+
+def process_data_files(
+    data_file_paths: list[str],
+    max_row_preview: int = 5,
+    max_workers: int | None = None,
+    sketch_join_keys: bool = False,
+) -> list[dict]:
+    """Profiles several data files in parallel; summaries are returned in input order."""
+    if len(data_file_paths) == 1:
+        return [process_data_file(data_file_paths[0], max_row_preview, sketch_join_keys)]
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(data_file_paths), os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(process_data_file, path, max_row_preview, sketch_join_keys) for path in data_file_paths]
+        return [future.result() for future in futures]
+
 
 # --- process pdf ---
 
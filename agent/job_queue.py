@@ -0,0 +1,474 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from . import orchestrator
+from . import sandbox
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+ACTIVE_JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "ai_notebook_jobs", "jobs.sqlite3")
+DEFAULT_NUM_WORKERS = 2
+DEFAULT_POLL_INTERVAL = 0.5  # seconds between queue checks for an idle worker
+DEFAULT_LEASE_TIMEOUT = 900.0  # a running job not updated for this long is considered abandoned
+LEASE_HEARTBEATS_PER_TIMEOUT = 3  # a running job's lease is refreshed this many times per lease timeout
+
+# Config keys that must never be written to the job database.
+SECRET_CONFIG_KEYS = ('GEMINI_API_KEY',)
+
+# How submit() takes ownership of the input files.
+INPUT_COPY = "copy"  # copied into the job directory; the caller keeps its files
+INPUT_MOVE = "move"  # moved into the job directory (a rename on the same filesystem); for the caller's temp files
+INPUT_REFERENCE = "reference"  # read in place by the worker; for server-side files that outlive the job
+INPUT_MODES = (INPUT_COPY, INPUT_MOVE, INPUT_REFERENCE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    request TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    error_type TEXT,
+    worker_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_fingerprint_status ON jobs (fingerprint, status);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_cells (
+    job_id TEXT NOT NULL,
+    cell_index INTEGER NOT NULL,
+    cell_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, cell_index)
+);
+"""
+
+
+def _hash_file_identity(path: str, hasher) -> None:
+    """Hashes (resolved path, size, mtime_ns) of a file, or of every file in a directory; never reads the contents."""
+    if os.path.isdir(path):
+        # Partitioned Parquet datasets are directories.
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                _hash_file_identity(os.path.join(root, name), hasher)
+        return
+    stat = os.stat(path)
+    hasher.update(f"{os.path.realpath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode('utf-8'))
+
+
+def _role_paths(path: str | list[str] | None) -> list[str]:
+    if not path:
+        return []
+    return list(path) if isinstance(path, (list, tuple)) else [path]
+
+
+def _take_input(path: str, dest_dir: str, input_mode: str) -> str:
+    if input_mode == INPUT_REFERENCE:
+        return os.path.realpath(path)
+    os.makedirs(dest_dir)
+    dest = os.path.join(dest_dir, os.path.basename(path.rstrip('/\\')))
+    if input_mode == INPUT_MOVE:
+        return shutil.move(path, dest)
+    if os.path.isdir(path):
+        return shutil.copytree(path, dest)
+    return shutil.copy(path, dest)
+
+
+def compute_job_fingerprint(input_files: dict, config: dict, user_goal: str | None) -> str:
+    """
+    Builds a stable identifier for a generation request from the input files'
+    identity (resolved path, size and modification time, so no file is read),
+    the non-secret configuration and the user goal. Two submissions with the
+    same fingerprint would produce equivalent notebooks.
+    """
+    hasher = hashlib.sha256()
+    for role in sorted(input_files):
+        hasher.update(role.encode('utf-8'))
+        for path in _role_paths(input_files[role]):
+            # File names end up in the generated code, so they are part of the request.
+            hasher.update(os.path.basename(path.rstrip('/\\')).encode('utf-8'))
+            _hash_file_identity(path, hasher)
+        hasher.update(b'\0')
+    public_config = {k: v for k, v in config.items() if k not in SECRET_CONFIG_KEYS}
+    hasher.update(json.dumps(public_config, sort_keys=True, default=str).encode('utf-8'))
+    hasher.update((user_goal or '').encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of notebook generation jobs executed by a pool of
+    worker threads.
+
+    Jobs are claimed through the database, so several processes (e.g. server
+    replicas sharing a volume) can point at the same `db_path` and split the
+    work. Input files are copied or moved next to the database (or, for
+    server-side files, referenced in place) so a job outlives the Streamlit
+    script run that submitted it.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        num_workers: int = DEFAULT_NUM_WORKERS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+        pipeline=orchestrator.run_generation_pipeline,
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1.")
+        self.db_path = db_path
+        self.jobs_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), "inputs")
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.pipeline = pipeline
+
+        self._worker_prefix = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._secrets: dict[str, dict] = {}
+        self._secrets_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._workers: list[threading.Thread] = []
+
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    # --- Database helpers ---
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _update_job(self, job_id: str, **fields) -> None:
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    # --- Lifecycle ---
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._stop_event.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                args=(f"{self._worker_prefix}-{i}",),
+                name=f"job-worker-{i}",
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+        logging.info(f"Job queue started with {self.num_workers} workers (db: {self.db_path}).")
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+        logging.info("Job queue stopped.")
+
+    # --- Public API ---
+
+    def submit(
+        self,
+        csv_file_path: str | list[str],
+        pdf_file_path: str,
+        config: dict,
+        ipynb_file_path: str | None = None,
+        user_goal: str | None = None,
+        input_mode: str = INPUT_COPY,
+    ) -> str:
+        """
+        Queues a generation request and returns its job id. If an identical
+        request is already queued or running, the id of that job is returned
+        instead of creating a new one. `csv_file_path` may be a list of data
+        files for multi-table inputs. `input_mode` is one of INPUT_MODES; with
+        INPUT_MOVE or INPUT_REFERENCE no input is read or copied here, so
+        submission time does not grow with the input size.
+        """
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Unknown input mode: {input_mode!r}")
+        input_files = {'csv': csv_file_path, 'pdf': pdf_file_path, 'ipynb': ipynb_file_path}
+        for role, path in input_files.items():
+            for role_path in _role_paths(path):
+                if not os.path.exists(role_path):
+                    raise FileNotFoundError(f"{role.upper()} file not Found!: {role_path}")
+
+        fingerprint = compute_job_fingerprint(input_files, config, user_goal)
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+
+        # Take the inputs before the write lock; the job only becomes visible to workers once inserted.
+        job_files = {}
+        try:
+            for role, path in input_files.items():
+                if isinstance(path, (list, tuple)):
+                    # One sub-directory per file keeps the original names even if two collide.
+                    job_files[role] = [
+                        _take_input(role_path, os.path.join(job_dir, role, str(i)), input_mode)
+                        for i, role_path in enumerate(path)
+                    ]
+                elif path:
+                    job_files[role] = _take_input(path, os.path.join(job_dir, role), input_mode)
+                else:
+                    job_files[role] = None
+
+            request = {
+                'files': job_files,
+                'config': {k: v for k, v in config.items() if k not in SECRET_CONFIG_KEYS},
+                'user_goal': user_goal,
+            }
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    existing = conn.execute(
+                        "SELECT job_id FROM jobs WHERE fingerprint = ? AND status IN (?, ?) "
+                        "ORDER BY created_at LIMIT 1",
+                        (fingerprint, *ACTIVE_JOB_STATUSES),
+                    ).fetchone()
+                    if existing is None:
+                        now = time.time()
+                        conn.execute(
+                            "INSERT INTO jobs (job_id, fingerprint, status, request, created_at, updated_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (job_id, fingerprint, JOB_QUEUED, json.dumps(request), now, now),
+                        )
+                        self._remember_secrets(job_id, config)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        if existing is not None:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            logging.info(f"Deduplicated submission onto in-flight job {existing['job_id']}.")
+            return existing['job_id']
+
+        logging.info(f"Submitted job {job_id}.")
+        return job_id
+
+    def get_job(self, job_id: str) -> dict | None:
+        """Returns the current state of a job, or None if the id is unknown."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT job_id, status, stage, result, error, error_type, created_at, updated_at, "
+                "started_at, finished_at FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_cells(self, job_id: str, after_index: int = -1) -> list[dict]:
+        """Cells generated so far for a job (first draft, in order), starting after `after_index`."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT cell_index, cell_type, source FROM job_cells WHERE job_id = ? AND cell_index > ? "
+                "ORDER BY cell_index",
+                (job_id, after_index),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_active_jobs(self) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", ACTIVE_JOB_STATUSES
+            ).fetchone()
+        return row[0]
+
+    def purge_finished(self, older_than: float) -> int:
+        """Deletes finished jobs (and their streamed cells) whose results are older than `older_than` seconds."""
+        cutoff = time.time() - older_than
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM job_cells WHERE job_id IN "
+                    "(SELECT job_id FROM jobs WHERE status IN (?, ?) AND finished_at < ?)",
+                    (JOB_SUCCEEDED, JOB_FAILED, cutoff),
+                )
+                cursor = conn.execute(
+                    "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                    (JOB_SUCCEEDED, JOB_FAILED, cutoff),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    # --- Workers ---
+
+    def _remember_secrets(self, job_id: str, config: dict) -> None:
+        secrets = {k: config[k] for k in SECRET_CONFIG_KEYS if config.get(k)}
+        if secrets:
+            with self._secrets_lock:
+                self._secrets.setdefault(job_id, secrets)
+
+    def _claim_next_job(self, worker_id: str) -> dict | None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT job_id, request FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED, JOB_RUNNING, now - self.lease_timeout),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, worker_id = ?, started_at = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (JOB_RUNNING, worker_id, now, now, row['job_id']),
+            )
+            # A reclaimed (abandoned) job regenerates its cells from scratch.
+            conn.execute("DELETE FROM job_cells WHERE job_id = ?", (row['job_id'],))
+            conn.execute("COMMIT")
+        return {'job_id': row['job_id'], 'request': json.loads(row['request']), 'worker_id': worker_id}
+
+    def _record_cell(self, job_id: str, index: int, cell_type: str, source: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_cells (job_id, cell_index, cell_type, source, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (job_id, index, cell_type, source, now),
+                )
+                # A streamed cell is progress too; keeps the lease fresh during long generations.
+                conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                # Streamed cells are a preview; losing one must not fail the job.
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logging.warning(f"Could not record cell {index} of job {job_id}: {e}")
+
+    def _heartbeat(self, job_id: str, worker_id: str, stop_event: threading.Event) -> None:
+        """Keeps a running job's lease fresh while a single long stage (profiling, model call, validation) runs."""
+        interval = self.lease_timeout / LEASE_HEARTBEATS_PER_TIMEOUT
+        while not stop_event.wait(interval):
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET updated_at = ? WHERE job_id = ? AND worker_id = ? AND status = ?",
+                        (time.time(), job_id, worker_id, JOB_RUNNING),
+                    )
+            except sqlite3.Error as e:
+                logging.warning(f"Lease heartbeat for job {job_id} failed: {e}")
+
+    def _worker_loop(self, worker_id: str) -> None:
+        while not self._stop_event.is_set():
+            try:
+                job = self._claim_next_job(worker_id)
+            except sqlite3.Error as e:
+                logging.error(f"Worker {worker_id} failed to claim a job: {e}", exc_info=True)
+                job = None
+            if job is None:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: dict) -> None:
+        job_id = job['job_id']
+        request = job['request']
+        files = request['files']
+
+        with self._secrets_lock:
+            secrets = self._secrets.pop(job_id, {})
+        config = dict(request['config'])
+        for key in SECRET_CONFIG_KEYS:
+            # Jobs picked up from another replica fall back to this process's environment.
+            config[key] = secrets.get(key) or os.environ.get(key, "")
+
+        logging.info(f"Running job {job_id}...")
+        heartbeat_stop = threading.Event()
+        threading.Thread(
+            target=self._heartbeat,
+            args=(job_id, job['worker_id'], heartbeat_stop),
+            name=f"job-heartbeat-{job_id[:8]}",
+            daemon=True,
+        ).start()
+        try:
+            result = self.pipeline(
+                csv_file_path=files['csv'],
+                pdf_file_path=files['pdf'],
+                config=config,
+                ipynb_file_path=files.get('ipynb'),
+                user_goal=request.get('user_goal'),
+                progress_callback=lambda stage: self._update_job(job_id, stage=stage),
+                cell_callback=lambda index, cell_type, source: self._record_cell(job_id, index, cell_type, source),
+            )
+            self._update_job(job_id, status=JOB_SUCCEEDED, stage=None, result=result, finished_at=time.time())
+            logging.info(f"Job {job_id} succeeded.")
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self._update_job(
+                job_id,
+                status=JOB_FAILED,
+                error=str(e),
+                error_type=type(e).__name__,
+                finished_at=time.time(),
+            )
+        finally:
+            heartbeat_stop.set()
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+
+_default_queue: JobQueue | None = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Returns the process-wide job queue, creating and starting it on first use.
+    Location and pool size can be set with the JOB_QUEUE_DB_PATH and
+    JOB_QUEUE_WORKERS environment variables.
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            if os.environ.get("SANDBOX_INPUT_PROCESSING", "").lower() in ("1", "true", "yes"):
+                # Fork the sandbox workers before the queue's threads exist.
+                sandbox.get_sandbox_pool().start()
+            _default_queue = JobQueue(
+                db_path=os.environ.get("JOB_QUEUE_DB_PATH", DEFAULT_DB_PATH),
+                num_workers=int(os.environ.get("JOB_QUEUE_WORKERS", DEFAULT_NUM_WORKERS)),
+            )
+            _default_queue.start()
+        return _default_queue
@@ -0,0 +1,314 @@
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SKETCH_SIZE = 1024  # smallest value hashes kept per column (bottom-k MinHash sketch)
+MIN_KEY_DISTINCT = 10  # columns with fewer distinct values are too ambiguous to be join keys
+MIN_SHARED_HASHES = 2  # sketch overlap required before a pair is scored at all
+MAX_POSTING_COLUMNS = 200  # a hash shared by more columns than this is too common to generate candidates
+MIN_CONTAINMENT = 0.8  # share of one column's values that must appear in the other
+UNIQUE_RATIO = 0.95  # distinct/non-null above this marks a column as a likely primary key
+MAX_MATCHES_PER_COLUMN = 3
+MAX_RELATIONSHIPS = 40
+
+_HASH_SPACE = float(2 ** 64)
+_NAME_NORMALIZE_PATTERN = re.compile(r"[^0-9a-z]")
+# Column names that read as identifiers: 'customer_id', 'CustomerID', 'sku_code', 'order_no', 'ref'.
+_KEY_NAME_PATTERN = re.compile(r"(id|key|code|ref|no|nr|num|number|sku|uuid|guid)$")
+
+
+def _hash_distinct_values(series: pd.Series) -> np.ndarray | None:
+    """
+    Hashes the distinct non-null values of a key-like column to uint64. Integers
+    and integer-valued strings hash identically ('42' and 42 join), so tables
+    that store the same key with different types still match. Returns None for
+    columns that cannot be join keys (floats, booleans, dates).
+    """
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return None
+    distinct = pd.unique(series.dropna())
+    if isinstance(distinct, pd.Categorical):
+        distinct = np.asarray(distinct)
+    if len(distinct) == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    if pd.api.types.is_integer_dtype(series):
+        return pd.util.hash_array(np.asarray(distinct, dtype=np.int64))
+    if pd.api.types.is_float_dtype(series):
+        values = np.asarray(distinct, dtype=np.float64)
+        if not np.all(np.mod(values, 1) == 0):
+            return None
+        # Integer ids read as float because of missing values.
+        return pd.util.hash_array(values.astype(np.int64))
+
+    strings = pd.Series(distinct, dtype=object).astype(str).str.strip()
+    numeric = pd.to_numeric(strings, errors='coerce')
+    if numeric.notna().all() and np.all(np.mod(numeric.to_numpy(dtype=np.float64), 1) == 0):
+        return pd.util.hash_array(numeric.to_numpy(dtype=np.float64).astype(np.int64))
+    return pd.util.hash_array(strings.to_numpy(dtype=object))
+
+
+def _new_sketch(table: str, column: str) -> dict:
+    return {
+        'table': table,
+        'column': column,
+        'hashes': np.empty(0, dtype=np.uint64),
+        'complete': True,  # False once some distinct values were dropped from the sketch
+        'non_null': 0,
+        'key_like': True,
+        'numeric': True,  # False for non-numeric columns; small-integer measures are numeric too
+    }
+
+
+def _update_sketch(sketch: dict, series: pd.Series, sketch_size: int) -> None:
+    hashes = _hash_distinct_values(series)
+    if hashes is None:
+        sketch['key_like'] = False
+        return
+    sketch['non_null'] += int(series.notna().sum())
+    sketch['numeric'] = sketch['numeric'] and pd.api.types.is_numeric_dtype(series)
+    if len(hashes) > sketch_size:
+        hashes = np.partition(hashes, sketch_size - 1)[:sketch_size]
+        sketch['complete'] = False
+    merged = np.union1d(sketch['hashes'], hashes)
+    if len(merged) > sketch_size:
+        merged = merged[:sketch_size]
+        sketch['complete'] = False
+    sketch['hashes'] = merged
+
+
+def _distinct_estimate(sketch: dict) -> float:
+    """Exact for complete sketches, otherwise the k-minimum-values estimate."""
+    hashes = sketch['hashes']
+    if sketch['complete']:
+        return float(len(hashes))
+    return (len(hashes) - 1) / (float(hashes[-1]) / _HASH_SPACE)
+
+
+def sketch_dataframe(
+    df: pd.DataFrame,
+    table: str,
+    total_rows: int | None = None,
+    sketch_size: int = SKETCH_SIZE,
+) -> list[dict]:
+    """
+    Builds a bottom-k MinHash sketch of every key-like column of a table
+    already loaded for profiling: the `sketch_size` smallest hashes of its
+    distinct values. Because all columns share one hash function, sketches are
+    coordinated samples and their overlap estimates value containment between
+    columns of different tables without comparing the value sets themselves.
+
+    `total_rows` is the table's full row count when `df` is only a sample of it.
+    """
+    result = []
+    for column in df.columns:
+        sketch = _new_sketch(table, str(column))
+        _update_sketch(sketch, df[column], sketch_size)
+        if not sketch['key_like'] or not sketch['non_null']:
+            continue
+        sketch['distinct'] = _distinct_estimate(sketch)
+        if sketch['distinct'] < MIN_KEY_DISTINCT:
+            continue
+        sketch['unique'] = sketch['distinct'] >= UNIQUE_RATIO * sketch['non_null']
+        sketch['rows_scanned'] = len(df)
+        sketch['rows_total'] = total_rows if total_rows is not None else len(df)
+        result.append(sketch)
+    logging.info(f"Sketched {len(result)} key-like columns of {table} ({len(df)} rows).")
+    return result
+
+
+def _candidate_pairs(sketches: list[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Column pairs (a < b) from different tables sharing at least
+    MIN_SHARED_HASHES sketch values, with the number of shared values. Found
+    through an inverted index over the sketches instead of comparing every
+    pair of columns.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(sketches) < 2:
+        return empty, empty, empty
+    hashes = np.concatenate([s['hashes'] for s in sketches])
+    owners = np.concatenate([np.full(len(s['hashes']), i, dtype=np.int64) for i, s in enumerate(sketches)])
+    tables = np.asarray(pd.factorize(pd.Series([s['table'] for s in sketches]))[0], dtype=np.int64)
+
+    order = np.argsort(hashes, kind='stable')
+    hashes, owners = hashes[order], owners[order]
+    group_starts = np.flatnonzero(np.concatenate([[True], hashes[1:] != hashes[:-1]]))
+    group_sizes = np.diff(np.concatenate([group_starts, [len(hashes)]]))
+
+    usable = (group_sizes >= 2) & (group_sizes <= MAX_POSTING_COLUMNS)
+    starts, sizes = group_starts[usable], group_sizes[usable]
+    if not len(starts):
+        return empty, empty, empty
+
+    # Every (i, j > i) position pair within each posting list, fully vectorized.
+    positions = np.repeat(starts, sizes) + np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    partners_per_position = np.repeat(starts + sizes, sizes) - positions - 1
+    first = np.repeat(positions, partners_per_position)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(partners_per_position) - partners_per_position, partners_per_position)
+    second = first + 1 + offsets
+
+    a, b = owners[first], owners[second]
+    cross_table = tables[a] != tables[b]
+    a, b = np.minimum(a[cross_table], b[cross_table]), np.maximum(a[cross_table], b[cross_table])
+    pair_keys, shared = np.unique(a * len(sketches) + b, return_counts=True)
+    keep = shared >= MIN_SHARED_HASHES
+    pair_keys, shared = pair_keys[keep], shared[keep]
+    return pair_keys // len(sketches), pair_keys % len(sketches), shared
+
+
+def _count_below(sketches: list[dict], columns: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """For each (column, threshold), how many of the column's sketch hashes are <= threshold."""
+    counts = np.empty(len(columns), dtype=np.int64)
+    order = np.argsort(columns, kind='stable')
+    boundaries = np.flatnonzero(np.diff(columns[order])) + 1
+    for group in np.split(order, boundaries):
+        if len(group):
+            counts[group] = np.searchsorted(sketches[columns[group[0]]]['hashes'], thresholds[group], side='right')
+    return counts
+
+
+def _containment_estimates(sketches: list[dict], a: np.ndarray, b: np.ndarray, shared: np.ndarray):
+    """
+    Estimated share of a's distinct values found in b, and of b's found in a.
+    Both sketches hold every value hashing below the smaller of their maximum
+    hashes, so the values below that threshold are a coordinated sample of
+    both columns; every shared sketch value lies below it by construction.
+    """
+    no_limit = np.iinfo(np.uint64).max
+    limits = np.array([no_limit if s['complete'] else s['hashes'][-1] for s in sketches], dtype=np.uint64)
+    thresholds = np.minimum(limits[a], limits[b])
+    a_sampled = _count_below(sketches, a, thresholds)
+    b_sampled = _count_below(sketches, b, thresholds)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a_in_b = np.where(a_sampled >= MIN_SHARED_HASHES, shared / a_sampled, 0.0)
+        b_in_a = np.where(b_sampled >= MIN_SHARED_HASHES, shared / b_sampled, 0.0)
+    return a_in_b, b_in_a
+
+
+def _normalize_name(name: str) -> str:
+    return _NAME_NORMALIZE_PATTERN.sub('', name.lower())
+
+
+def _names_match(column: str, referenced_column: str, referenced_table: str) -> bool:
+    """'customer_id' matches 'customer_id', and also 'id' in a table named 'customers'."""
+    column, referenced_column = _normalize_name(column), _normalize_name(referenced_column)
+    if column == referenced_column:
+        return True
+    table = _normalize_name(referenced_table)
+    stems = {table, table[:-1] if table.endswith('s') else table}
+    return referenced_column in ('id', 'key') and any(column in (stem + 'id', stem + 'key') for stem in stems)
+
+
+def _key_like_name(column: str) -> bool:
+    return bool(_KEY_NAME_PATTERN.search(_normalize_name(column)))
+
+
+def find_join_candidates(
+    sketches: list[dict],
+    min_containment: float = MIN_CONTAINMENT,
+    max_relationships: int = MAX_RELATIONSHIPS,
+) -> list[dict]:
+    """
+    Scores sketch pairs by containment in both directions and returns likely
+    relationships as dicts with 'from_table', 'from_column' (the referencing
+    side), 'to_table', 'to_column', 'containment', 'to_unique', 'from_unique',
+    'from_distinct' and 'name_match', best first.
+
+    Value overlap alone is weak evidence: counts and ratings are small integers
+    contained in any integer id column. So the referenced side must be unique,
+    and the referencing side must match it by name, have an identifier-like
+    name, or hold non-numeric values. One-to-one matches need a name match, and
+    a column with a name-matched target is not also reported against others.
+    """
+    a, b, shared = _candidate_pairs(sketches)
+    a_in_b, b_in_a = _containment_estimates(sketches, a, b, shared)
+    inner_idx = np.concatenate([a, b])
+    outer_idx = np.concatenate([b, a])
+    containments = np.concatenate([a_in_b, b_in_a])
+    passing = np.flatnonzero(containments >= min_containment)
+
+    relationships = []
+    for k in passing:
+        inner, outer, containment = sketches[inner_idx[k]], sketches[outer_idx[k]], float(containments[k])
+        if not outer['unique']:
+            continue  # a foreign key references a primary key; this also drops the reverse of many-to-one matches
+        name_match = _names_match(inner['column'], outer['column'], outer['table'])
+        if not (name_match or _key_like_name(inner['column']) or not inner['numeric']):
+            continue
+        if inner['unique'] and not name_match:
+            continue  # two surrogate keys numbered 1..n overlap without being related
+        relationships.append({
+            'from_table': inner['table'],
+            'from_column': inner['column'],
+            'to_table': outer['table'],
+            'to_column': outer['column'],
+            'containment': round(containment, 3),
+            'to_unique': bool(outer['unique']),
+            'from_unique': bool(inner['unique']),
+            'from_distinct': int(round(inner['distinct'])),
+            'name_match': name_match,
+        })
+
+    relationships.sort(
+        # Containment is coarsened so that, among near-equal matches, more distinct values (more evidence) win.
+        key=lambda r: (r['name_match'], round(r['containment'], 1), r['from_distinct']),
+        reverse=True,
+    )
+    per_column: dict[tuple[str, str], int] = {}
+    name_matched: set[tuple[str, str]] = set()
+    selected = []
+    for relationship in relationships:
+        source = (relationship['from_table'], relationship['from_column'])
+        if per_column.get(source, 0) >= MAX_MATCHES_PER_COLUMN:
+            continue
+        if source in name_matched and not relationship['name_match']:
+            continue  # name-matched relationships sort first
+        if relationship['name_match']:
+            name_matched.add(source)
+        per_column[source] = per_column.get(source, 0) + 1
+        selected.append(relationship)
+        if len(selected) >= max_relationships:
+            break
+    return selected
+
+
+def discover_join_keys(table_sketches: list[list[dict]]) -> dict:
+    """
+    Takes the `sketch_dataframe` output of every table (built during
+    profiling, so no file is read again) and returns {'relationships': [...],
+    'notes': [...]} with candidate join keys between the tables.
+    """
+    notes = []
+    if len(table_sketches) < 2:
+        return {'relationships': [], 'notes': notes}
+
+    sketches = [sketch for table in table_sketches for sketch in table]
+    for table in table_sketches:
+        if table and table[0]['rows_scanned'] < table[0]['rows_total']:
+            notes.append(
+                f"{table[0]['table']} was sketched from its first {table[0]['rows_scanned']} of "
+                f"{table[0]['rows_total']} rows; containment involving it is a lower bound."
+            )
+    relationships = find_join_candidates(sketches)
+    logging.info(f"Found {len(relationships)} candidate join keys across {len(table_sketches)} tables.")
+    return {'relationships': relationships, 'notes': notes}
+
+
+def format_join_keys(join_keys: dict) -> str:
+    relationships = join_keys.get('relationships') or []
+    if not relationships:
+        return "No join keys were detected between the tables."
+    lines = []
+    for r in relationships:
+        kind = "one-to-one" if r['from_unique'] else "many-to-one"
+        lines.append(
+            f"{r['from_table']}.{r['from_column']} -> {r['to_table']}.{r['to_column']}: "
+            f"{r['containment']:.0%} of values found ({kind}{', names match' if r['name_match'] else ''})"
+        )
+    lines += join_keys.get('notes') or []
+    return "\n".join(lines)
@@ -1,8 +1,10 @@
 # agent/notebook_builder.py
 
 import nbformat
+import json
 import logging
 import re # Using regex for more robust splitting
+from typing import Callable
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -10,6 +12,52 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 MARKDOWN_TAG = "[MARKDOWN]"
 CODE_TAG = "[CODE]"
 
+# Output modes should match those used in prompt_builder.py
+OUTPUT_MODE_TAGS = "tags"
+OUTPUT_MODE_JSON = "json"
+
+# Response schema for OUTPUT_MODE_JSON; the model is constrained to produce exactly this shape.
+NOTEBOOK_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "cells": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "cell_type": {"type": "string", "enum": ["markdown", "code"]},
+                    "source": {"type": "string"},
+                },
+                "required": ["cell_type", "source"],
+            },
+        },
+    },
+    "required": ["cells"],
+}
+
+_CELL_SCHEMA = NOTEBOOK_RESPONSE_SCHEMA["properties"]["cells"]["items"]
+
+# Response schema for notebook deltas (edits to a reused notebook).
+NOTEBOOK_DELTA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "replace": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"cell_index": {"type": "integer"}, **_CELL_SCHEMA["properties"]},
+                "required": ["cell_index", "cell_type", "source"],
+            },
+        },
+        "append": {"type": "array", "items": _CELL_SCHEMA},
+    },
+    "required": ["replace", "append"],
+}
+
+JSON_FENCE_PATTERN = re.compile(r"^\s*```(?:json)?\s*\n(.*?)\n\s*```\s*$", re.DOTALL)
+TAG_PATTERN = re.compile(r"^\s*(\[(?:MARKDOWN|CODE)\])\s*", re.MULTILINE)
+JSON_CELLS_START_PATTERN = re.compile(r'"cells"\s*:\s*\[')
+
 class NotebookBuilderError(Exception):
     """Custom exception for errors during notebook building."""
     pass
@@ -47,7 +95,7 @@ def create_ipynb_from_ai_response(ai_response_text: str) -> str:
     # \s*             - Optional whitespace
     # (\\[(?:MARKDOWN|CODE)\\]) - Capture group 1: Literal '[' + 'MARKDOWN' or 'CODE' + literal ']'
     # \s*             - Optional whitespace following the tag (including newline)
-    pattern = re.compile(r"^\s*(\[(?:MARKDOWN|CODE)\])\s*", re.MULTILINE)
+    pattern = TAG_PATTERN
     parts = pattern.split(ai_response_text)
 
     # Debug: Print the split parts
@@ -126,3 +174,207 @@ def add_cell(notebook, cell_type: str, content: str):
 
     notebook.cells.append(cell)
 
+
+
+def notebook_to_tagged_text(notebook_json_string: str) -> str:
+    """
+    Inverse of create_ipynb_from_ai_response: renders a notebook back into the
+    [MARKDOWN]/[CODE] text protocol (e.g. to show the model its previous attempt).
+    """
+    notebook = nbformat.reads(notebook_json_string, as_version=4)
+    sections = []
+    for cell in notebook.cells:
+        if cell.cell_type == 'markdown':
+            sections.append(f"{MARKDOWN_TAG}\n{cell.source}")
+        elif cell.cell_type == 'code':
+            sections.append(f"{CODE_TAG}\n{cell.source}")
+    return "\n".join(sections)
+
+
+def notebook_to_response_text(notebook_json_string: str, output_mode: str = OUTPUT_MODE_TAGS) -> str:
+    """Renders a notebook in the same shape the model is asked to produce for `output_mode`."""
+    if output_mode != OUTPUT_MODE_JSON:
+        return notebook_to_tagged_text(notebook_json_string)
+    notebook = nbformat.reads(notebook_json_string, as_version=4)
+    cells = [
+        {'cell_type': cell.cell_type, 'source': cell.source}
+        for cell in notebook.cells if cell.cell_type in ('markdown', 'code')
+    ]
+    return json.dumps({'cells': cells}, indent=1)
+
+
+def create_ipynb_from_json_response(ai_response_text: str) -> str:
+    """
+    Parses a schema-constrained JSON response ({"cells": [{"cell_type", "source"}, ...]})
+    and creates a Jupyter Notebook (.ipynb) JSON string.
+
+    Raises:
+        NotebookBuilderError: If the response is not valid JSON of that shape or has no cells.
+    """
+    logging.info("Starting notebook construction from JSON AI response...")
+
+    if not ai_response_text or not ai_response_text.strip():
+        raise NotebookBuilderError("Cannot build notebook from empty AI response.")
+
+    # Schema-constrained output is bare JSON, but tolerate a ```json fence just in case.
+    fenced = JSON_FENCE_PATTERN.match(ai_response_text)
+    text = fenced.group(1) if fenced else ai_response_text
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise NotebookBuilderError(f"AI response is not valid JSON: {e}") from e
+
+    cells = payload.get('cells') if isinstance(payload, dict) else payload
+    if not isinstance(cells, list):
+        raise NotebookBuilderError("JSON AI response has no 'cells' list.")
+
+    notebook = nbformat.v4.new_notebook()
+    for cell in cells:
+        if not isinstance(cell, dict):
+            logging.warning(f"Skipping malformed cell in JSON response: {str(cell)[:100]}")
+            continue
+        source = cell.get('source', '')
+        if isinstance(source, list):  # nbformat-style list of lines
+            source = "".join(source)
+        if isinstance(source, str) and source.strip():
+            add_cell(notebook, cell.get('cell_type'), source.strip())
+
+    if not notebook.cells:
+        raise NotebookBuilderError("Failed to parse any valid cells from the JSON AI response.")
+
+    try:
+        notebook_json_string = nbformat.writes(notebook)
+    except Exception as e:
+        logging.error(f"Failed to serialize the notebook object: {e}", exc_info=True)
+        raise NotebookBuilderError(f"Error writing notebook object: {e}") from e
+    logging.info(f"Notebook construction successful. Created {len(notebook.cells)} cells.")
+    return notebook_json_string
+
+
+def create_ipynb_from_response(ai_response_text: str, output_mode: str = OUTPUT_MODE_TAGS) -> str:
+    """
+    Builds the notebook for the given output mode. In JSON mode a response that
+    does not parse as JSON is retried with the tag parser before giving up, so a
+    model that ignores the schema does not cost another generation.
+    """
+    if output_mode != OUTPUT_MODE_JSON:
+        return create_ipynb_from_ai_response(ai_response_text)
+    try:
+        return create_ipynb_from_json_response(ai_response_text)
+    except NotebookBuilderError as e:
+        logging.warning(f"JSON notebook parsing failed ({e}); falling back to the tag parser.")
+        return create_ipynb_from_ai_response(ai_response_text)
+
+
+def apply_notebook_delta(notebook_json_string: str, delta_text: str) -> tuple[str, int]:
+    """
+    Applies a JSON delta ({"replace": [...], "append": [...]}, see
+    NOTEBOOK_DELTA_SCHEMA) to a notebook. Returns the new notebook and the
+    number of cells changed or added.
+
+    Raises:
+        NotebookBuilderError: If the delta is not valid JSON of that shape.
+    """
+    fenced = JSON_FENCE_PATTERN.match(delta_text or '')
+    try:
+        delta = json.loads(fenced.group(1) if fenced else delta_text)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise NotebookBuilderError(f"Notebook delta is not valid JSON: {e}") from e
+    if not isinstance(delta, dict):
+        raise NotebookBuilderError("Notebook delta must be a JSON object.")
+
+    notebook = nbformat.reads(notebook_json_string, as_version=4)
+    changed = 0
+    for edit in delta.get('replace') or []:
+        index = edit.get('cell_index') if isinstance(edit, dict) else None
+        if not isinstance(index, int) or not 0 <= index < len(notebook.cells):
+            logging.warning(f"Skipping delta edit with invalid cell index: {str(edit)[:100]}")
+            continue
+        replacement = nbformat.v4.new_notebook()
+        add_cell(replacement, edit.get('cell_type'), str(edit.get('source', '')).strip())
+        if replacement.cells:
+            notebook.cells[index] = replacement.cells[0]
+            changed += 1
+    for cell in delta.get('append') or []:
+        if isinstance(cell, dict) and str(cell.get('source', '')).strip():
+            before = len(notebook.cells)
+            add_cell(notebook, cell.get('cell_type'), str(cell['source']).strip())
+            changed += len(notebook.cells) - before
+
+    logging.info(f"Applied notebook delta: {changed} cell(s) changed or added.")
+    return nbformat.writes(notebook), changed
+
+
+def notebook_cells(notebook_json_string: str) -> list[tuple[str, str]]:
+    """(cell_type, source) of each markdown and code cell, in order."""
+    notebook = nbformat.reads(notebook_json_string, as_version=4)
+    return [(cell.cell_type, cell.source) for cell in notebook.cells if cell.cell_type in ('markdown', 'code')]
+
+
+class CellStreamParser:
+    """
+    Incremental counterpart of create_ipynb_from_response: `feed` it the
+    response text as it streams in and `on_cell(index, cell_type, source)` is
+    called for each cell as soon as it is complete (in tag mode, when the next
+    tag arrives; in JSON mode, when the cell object closes). Cells are cleaned
+    and skipped by the same rules as the full parsers, so streamed cells match
+    the final notebook's. `close` flushes the last cell.
+    """
+
+    def __init__(self, output_mode: str, on_cell: Callable[[int, str, str], None]):
+        self.output_mode = output_mode
+        self.on_cell = on_cell
+        self.cells_emitted = 0
+        self._text = ""
+        self._cell_start = 0  # tag mode: start of the current (unfinished) cell's tag
+        self._array_pos = None  # JSON mode: position after the last complete cell object
+        self._decoder = json.JSONDecoder()
+
+    def _emit(self, cell_type, source) -> None:
+        if isinstance(source, list):
+            source = "".join(source)
+        if cell_type not in ('markdown', 'code') or not isinstance(source, str) or not source.strip():
+            return
+        self.on_cell(self.cells_emitted, cell_type, source.strip())
+        self.cells_emitted += 1
+
+    def feed(self, text: str) -> None:
+        self._text += text
+        if self.output_mode == OUTPUT_MODE_JSON:
+            self._parse_json_cells()
+        else:
+            self._parse_tagged_cells(final=False)
+
+    def close(self) -> None:
+        if self.output_mode != OUTPUT_MODE_JSON:
+            self._parse_tagged_cells(final=True)
+
+    def _parse_tagged_cells(self, final: bool) -> None:
+        matches = list(TAG_PATTERN.finditer(self._text, self._cell_start))
+        if not matches:
+            return
+        boundaries = [match.start() for match in matches[1:]] + ([len(self._text)] if final else [])
+        for match, end in zip(matches, boundaries):
+            cell_type = 'markdown' if match.group(1) == MARKDOWN_TAG else 'code'
+            self._emit(cell_type, self._text[match.end():end])
+        self._cell_start = len(self._text) if final else matches[-1].start()
+
+    def _parse_json_cells(self) -> None:
+        if self._array_pos is None:
+            match = JSON_CELLS_START_PATTERN.search(self._text)
+            if match is None:
+                return
+            self._array_pos = match.end()
+        while True:
+            pos = self._array_pos
+            while pos < len(self._text) and self._text[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(self._text) or self._text[pos] != '{':
+                return
+            try:
+                cell, end = self._decoder.raw_decode(self._text, pos)
+            except json.JSONDecodeError:
+                return  # the cell object is still incomplete
+            self._array_pos = end
+            if isinstance(cell, dict):
+                self._emit(cell.get('cell_type'), cell.get('source', ''))
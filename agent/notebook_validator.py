@@ -0,0 +1,360 @@
+import logging
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import nbformat
+
+from . import input_processor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_CELL_TIMEOUT = 30.0  # seconds a single cell may run before it counts as failed
+DEFAULT_SAMPLE_ROWS = 1000  # data rows copied into the validation sandbox
+KERNEL_STARTUP_TIMEOUT = 60.0
+KERNEL_ACQUIRE_TIMEOUT = 120.0
+
+ANSI_ESCAPE_PATTERN = re.compile(r"\x1b\[[0-9;]*m")
+
+# Environment variables passed to validation kernels. Generated code runs there, so
+# everything else (API keys and other server secrets) is withheld.
+KERNEL_ENV_ALLOWLIST = (
+    'PATH', 'HOME', 'USER', 'LANG', 'LANGUAGE', 'TZ', 'TMPDIR', 'TEMP', 'TMP',
+    'PYTHONPATH', 'VIRTUAL_ENV', 'CONDA_PREFIX', 'SYSTEMROOT', 'JUPYTER_PATH', 'JUPYTER_RUNTIME_DIR',
+)
+
+# Run before each notebook: sandbox as working directory (first, since the previous
+# sandbox is already deleted and %reset needs a valid cwd), clean namespace, non-interactive plotting.
+_RESET_CODE = """\
+import os as _os
+_os.chdir({workdir!r})
+%reset -f
+try:
+    import matplotlib as _mpl
+    _mpl.use('Agg')
+    import matplotlib.pyplot as _plt
+    _plt.close('all')
+    _plt.show = lambda *args, **kwargs: None
+    del _mpl, _plt
+except ImportError:
+    pass
+"""
+
+
+class NotebookValidationError(Exception):
+    """Raised when the validation infrastructure itself (kernels, sandbox) fails."""
+    pass
+
+
+def kernel_environment() -> dict:
+    """A minimal environment for validation kernels: locale, paths and interpreter settings only."""
+    env = {
+        name: value for name, value in os.environ.items()
+        if name in KERNEL_ENV_ALLOWLIST or name.startswith('LC_')
+    }
+    env['MPLBACKEND'] = 'Agg'
+    return env
+
+
+class KernelPool:
+    """
+    A fixed set of pre-started local Jupyter kernels. Kernels are reused
+    across notebooks (namespace reset in between) so validation does not pay
+    kernel startup and heavy imports such as pandas on every run.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, kernel_name: str = 'python3'):
+        if size < 1:
+            raise ValueError("Kernel pool size must be at least 1.")
+        self.size = size
+        self.kernel_name = kernel_name
+        self._idle: queue.Queue = queue.Queue()
+        self._kernels: list = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _start_kernel(self):
+        try:
+            from jupyter_client.manager import KernelManager
+        except ImportError as e:
+            raise NotebookValidationError("Notebook validation requires jupyter_client and ipykernel.") from e
+
+        manager = KernelManager(kernel_name=self.kernel_name)
+        manager.start_kernel(env=kernel_environment())
+        client = manager.client()
+        client.start_channels()
+        try:
+            client.wait_for_ready(timeout=KERNEL_STARTUP_TIMEOUT)
+        except RuntimeError as e:
+            client.stop_channels()
+            manager.shutdown_kernel(now=True)
+            raise NotebookValidationError(f"Kernel failed to start: {e}") from e
+        # Warm up the libraries generated notebooks almost always import.
+        client.execute_interactive(
+            "try:\n    import pandas, numpy\nexcept ImportError:\n    pass",
+            timeout=KERNEL_STARTUP_TIMEOUT,
+            output_hook=lambda msg: None,
+        )
+        return manager, client
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            logging.info(f"Starting {self.size} validation kernel(s)...")
+            for _ in range(self.size):
+                kernel = self._start_kernel()
+                self._kernels.append(kernel)
+                self._idle.put(kernel)
+            self._started = True
+            logging.info("Validation kernels ready.")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for manager, client in self._kernels:
+                try:
+                    client.stop_channels()
+                    manager.shutdown_kernel(now=True)
+                except Exception as e:
+                    logging.warning(f"Error shutting down kernel: {e}")
+            self._kernels = []
+            self._idle = queue.Queue()
+            self._started = False
+
+    def _replenish(self) -> None:
+        """Replaces kernels that were dropped after a failed restart."""
+        with self._lock:
+            while self._started and len(self._kernels) < self.size:
+                try:
+                    kernel = self._start_kernel()
+                except Exception as e:
+                    if not self._kernels:
+                        raise NotebookValidationError(f"No validation kernel could be started: {e}") from e
+                    logging.warning(f"Could not replace validation kernel, continuing with {len(self._kernels)}: {e}")
+                    return
+                self._kernels.append(kernel)
+                self._idle.put(kernel)
+
+    def acquire(self, timeout: float = KERNEL_ACQUIRE_TIMEOUT):
+        self.start()
+        self._replenish()
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty as e:
+            raise NotebookValidationError("Timed out waiting for a free validation kernel.") from e
+
+    def release(self, kernel, needs_restart: bool = False) -> None:
+        manager, client = kernel
+        if needs_restart:
+            # A cell timed out or the kernel died; its state can't be trusted.
+            try:
+                manager.restart_kernel(now=True)
+                client.wait_for_ready(timeout=KERNEL_STARTUP_TIMEOUT)
+            except Exception as e:
+                # Called from a finally block: never raise here, it would mask the original error.
+                logging.error(f"Failed to restart validation kernel, it is replaced on the next acquire: {e}")
+                with self._lock:
+                    if kernel in self._kernels:
+                        self._kernels.remove(kernel)
+                try:
+                    client.stop_channels()
+                    manager.shutdown_kernel(now=True)
+                except Exception:
+                    pass
+                return
+        self._idle.put(kernel)
+
+
+def _write_csv_sample(data_file_path: str, dest_path: str, sample_rows: int) -> None:
+    """
+    Re-encodes the first `sample_rows` records with the file's sniffed dialect,
+    encoding and compression. Records are counted by the CSV parser, not by
+    lines, so a quoted field spanning lines is never cut; values are read as
+    text and written back unchanged.
+    """
+    import pandas as pd
+    read_options = input_processor.csv_read_options(data_file_path)
+    sample = pd.read_csv(
+        data_file_path, nrows=sample_rows, **{**read_options, 'dtype': str, 'keep_default_na': False}
+    )
+    compression = read_options.get('compression')
+    if compression == 'zip':
+        # Keep the archive member's name; pandas would otherwise name it after the archive.
+        import zipfile
+        with zipfile.ZipFile(data_file_path) as archive:
+            member = next(info.filename for info in archive.infolist() if not info.is_dir())
+        compression = {'method': 'zip', 'archive_name': member}
+    sample.to_csv(
+        dest_path,
+        index=False,
+        header=read_options.get('header') is not None,
+        sep=read_options['sep'],
+        quotechar=read_options['quotechar'],
+        escapechar=read_options.get('escapechar'),
+        encoding=read_options['encoding'],
+        compression=compression,
+    )
+
+
+def _write_data_sample(data_file_path: str, dest_dir: str, sample_rows: int) -> None:
+    """
+    Writes the first `sample_rows` rows of a data file into `dest_dir` under
+    the same name, keeping its format (and for CSVs the delimiter, quoting,
+    encoding and compression) so the notebook's load code works unchanged.
+    """
+    name = os.path.basename(data_file_path.rstrip('/\\'))
+    dest_path = os.path.join(dest_dir, name)
+    data_format = input_processor.detect_data_format(data_file_path)
+
+    if data_format == 'parquet':
+        files = input_processor.list_parquet_files(data_file_path)
+        sample = input_processor.read_parquet_sample(files[0], sample_rows)
+        if os.path.isdir(data_file_path):
+            os.makedirs(dest_path)
+            dest_path = os.path.join(dest_path, 'part-0.parquet')
+        sample.to_parquet(dest_path, index=False)
+    elif data_format == 'feather':
+        import pandas as pd
+        pd.read_feather(data_file_path).head(sample_rows).reset_index(drop=True).to_feather(dest_path)
+    else:
+        _write_csv_sample(data_file_path, dest_path, sample_rows)
+
+
+def _notebook_code_cells(notebook_json: str) -> list[tuple[int, str]]:
+    notebook = nbformat.reads(notebook_json, as_version=4)
+    return [(i, cell.source) for i, cell in enumerate(notebook.cells) if cell.cell_type == 'code' and cell.source.strip()]
+
+
+def validate_notebook(
+    notebook_json: str,
+    data_file_paths: list[str],
+    pool: KernelPool | None = None,
+    cell_timeout: float = DEFAULT_CELL_TIMEOUT,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+) -> dict:
+    """
+    Executes the notebook's code cells, in order, against a downsampled copy
+    of its data files in a pooled kernel and stops at the first failure.
+
+    Returns a report dict: 'ok', 'cells_executed', 'duration' and, on failure,
+    'failed_cell_index' (index into the notebook's cells), 'failed_cell_source',
+    'error_name', 'error_value' and 'traceback'.
+    """
+    pool = pool or get_kernel_pool()
+    started = time.monotonic()
+    code_cells = _notebook_code_cells(notebook_json)
+    workdir = tempfile.mkdtemp(prefix="nb_validation_")
+    report = {'ok': True, 'cells_executed': 0}
+
+    try:
+        for data_file_path in data_file_paths:
+            _write_data_sample(data_file_path, workdir, sample_rows)
+
+        kernel = pool.acquire()
+        needs_restart = False
+        try:
+            _, client = kernel
+            reply = client.execute_interactive(
+                _RESET_CODE.format(workdir=workdir), timeout=cell_timeout, output_hook=lambda msg: None
+            )
+            if reply['content'].get('status') != 'ok':
+                needs_restart = True
+                raise NotebookValidationError(f"Could not reset validation kernel: {reply['content'].get('evalue')}")
+            for cell_index, source in code_cells:
+                try:
+                    reply = client.execute_interactive(
+                        source,
+                        timeout=cell_timeout,
+                        store_history=False,
+                        allow_stdin=False,
+                        output_hook=lambda msg: None,
+                    )
+                except TimeoutError:
+                    needs_restart = True
+                    report.update({
+                        'ok': False,
+                        'failed_cell_index': cell_index,
+                        'failed_cell_source': source,
+                        'error_name': 'TimeoutError',
+                        'error_value': f"Cell did not finish within {cell_timeout:.0f}s on the sampled data.",
+                        'traceback': '',
+                    })
+                    break
+
+                report['cells_executed'] += 1
+                content = reply['content']
+                if content.get('status') == 'error':
+                    report.update({
+                        'ok': False,
+                        'failed_cell_index': cell_index,
+                        'failed_cell_source': source,
+                        'error_name': content.get('ename', ''),
+                        'error_value': content.get('evalue', ''),
+                        'traceback': ANSI_ESCAPE_PATTERN.sub('', "\n".join(content.get('traceback', []))),
+                    })
+                    break
+        except NotebookValidationError:
+            raise
+        except Exception as e:
+            needs_restart = True
+            raise NotebookValidationError(f"Validation kernel error: {e}") from e
+        finally:
+            pool.release(kernel, needs_restart=needs_restart)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report['duration'] = round(time.monotonic() - started, 2)
+    if report['ok']:
+        logging.info(f"Notebook validated: {report['cells_executed']} code cells ran in {report['duration']}s.")
+    else:
+        logging.warning(
+            f"Notebook validation failed at cell {report['failed_cell_index']}: "
+            f"{report['error_name']}: {report['error_value']}"
+        )
+    return report
+
+
+def validate_notebooks(
+    notebooks: list[tuple[str, list[str]]],
+    pool: KernelPool | None = None,
+    cell_timeout: float = DEFAULT_CELL_TIMEOUT,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+) -> list[dict]:
+    """Validates several (notebook_json, data_file_paths) pairs in parallel, one per pooled kernel."""
+    pool = pool or get_kernel_pool()
+    pool.start()
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = [
+            executor.submit(validate_notebook, notebook_json, data_file_paths, pool, cell_timeout, sample_rows)
+            for notebook_json, data_file_paths in notebooks
+        ]
+        return [future.result() for future in futures]
+
+
+def attach_validation_report(notebook_json: str, report: dict) -> str:
+    """Stores the validation report in the notebook metadata so callers can surface it."""
+    notebook = nbformat.reads(notebook_json, as_version=4)
+    notebook.metadata.setdefault('ai_notebook_generator', {})['validation'] = report
+    return nbformat.writes(notebook)
+
+
+_default_pool: KernelPool | None = None
+_default_pool_lock = threading.Lock()
+
+
+def get_kernel_pool() -> KernelPool:
+    """
+    Returns the process-wide kernel pool (size from the VALIDATION_KERNELS
+    environment variable). Kernels start on first use and stay warm.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = KernelPool(size=int(os.environ.get("VALIDATION_KERNELS", DEFAULT_POOL_SIZE)))
+        return _default_pool
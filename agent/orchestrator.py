@@ -1,29 +1,279 @@
+import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 
 from . import input_processor
 from . import notebook_builder
 from . import prompt_builder
 from . import ai_client
+from . import hedging
+from . import notebook_validator
+from . import join_keys
+from . import schema_cache
+from . import sandbox
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class OrchestrationError(Exception):
     pass
 
+
+def output_mode_generation_config(config: dict) -> dict | None:
+    """Generation config overrides for the configured OUTPUT_MODE (schema-constrained JSON or plain text tags)."""
+    if config.get('OUTPUT_MODE', notebook_builder.OUTPUT_MODE_TAGS) != notebook_builder.OUTPUT_MODE_JSON:
+        return None
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': notebook_builder.NOTEBOOK_RESPONSE_SCHEMA,
+    }
+
+
+def request_ai_response(
+        config: dict,
+        prompt: str,
+        model_name: str | None = None,
+        generation_config_override: dict | None = None,
+        system_instruction: str | None = None,
+        cancel_event=None,
+        on_text_chunk: Callable[[str], None] | None = None,
+) -> str:
+    """Sends a prompt to the configured AI_BACKEND: Gemini (default) or the offline stub."""
+    if config.get('AI_BACKEND', ai_client.AI_BACKEND_GEMINI) == ai_client.AI_BACKEND_STUB:
+        return ai_client.get_stub_response(
+            prompt,
+            generation_config_override = generation_config_override,
+            latency = float(config.get('AI_STUB_LATENCY', ai_client.DEFAULT_STUB_LATENCY)),
+            cancel_event = cancel_event,
+            on_text_chunk = on_text_chunk,
+        )
+    return ai_client.get_gemini_response(
+        prompt = prompt,
+        api_key = config['GEMINI_API_KEY'],
+        model_name = model_name or config['GEMINI_MODEL_NAME'],
+        generation_config_override = generation_config_override,
+        system_instruction = system_instruction,
+        use_context_cache = config.get('USE_CONTEXT_CACHE', False),
+        cancel_event = cancel_event,
+        on_text_chunk = on_text_chunk,
+    )
+
+
+def generate_notebook_hedged(prompt: str, system_instruction: str, config: dict) -> str:
+    """
+    Generates the notebook with a hedged duplicate request: if the primary model
+    has no parseable notebook after a latency-percentile based delay, the same
+    request goes to HEDGE_MODEL_NAME (default: the primary model) and the first
+    response that builds into a notebook is used.
+    """
+    primary_model = config['GEMINI_MODEL_NAME']
+    hedge_model = config.get('HEDGE_MODEL_NAME') or primary_model
+    output_mode = config.get('OUTPUT_MODE', notebook_builder.OUTPUT_MODE_TAGS)
+
+    def attempt(model_name: str):
+        def run(cancel_event):
+            raw_ai_response = request_ai_response(
+                config,
+                prompt,
+                model_name = model_name,
+                generation_config_override = output_mode_generation_config(config),
+                system_instruction = system_instruction,
+                cancel_event = cancel_event
+            )
+            return notebook_builder.create_ipynb_from_response(raw_ai_response, output_mode)
+        return run
+
+    delay = hedging.compute_hedge_delay(
+        primary_model,
+        percentile = float(config.get('HEDGE_PERCENTILE', hedging.DEFAULT_HEDGE_PERCENTILE)),
+        default_delay = float(config.get('HEDGE_DEFAULT_DELAY', hedging.DEFAULT_HEDGE_DELAY)),
+    )
+    notebook_json_string, winner = hedging.run_hedged(
+        primary = (primary_model, attempt(primary_model)),
+        hedge = (hedge_model, attempt(hedge_model)),
+        delay = delay,
+    )
+    logging.info(f"Notebook produced by the {winner} request. Hedge stats: {hedging.get_hedge_stats()}")
+    return notebook_json_string
+
+
+def validate_generated_notebook(
+        notebook_json_string: str,
+        prompt: str,
+        system_instruction: str,
+        data_file_paths: list[str],
+        config: dict,
+        report_stage: Callable[[str], None],
+) -> str:
+    """
+    Optional stage: smoke-tests the notebook on sampled data and, if enabled,
+    asks the model once to repair a failing notebook. The validation report is
+    stored in the notebook metadata. Failures of the validation machinery itself
+    never fail the pipeline; the unvalidated notebook is returned instead.
+    """
+    cell_timeout = float(config.get('VALIDATION_CELL_TIMEOUT', notebook_validator.DEFAULT_CELL_TIMEOUT))
+    output_mode = config.get('OUTPUT_MODE', notebook_builder.OUTPUT_MODE_TAGS)
+    try:
+        report_stage("validating_notebook")
+        report = notebook_validator.validate_notebook(notebook_json_string, data_file_paths, cell_timeout=cell_timeout)
+
+        if not report['ok'] and config.get('REPAIR_ON_VALIDATION_FAILURE'):
+            report_stage("repairing_notebook")
+            repair_prompt = prompt_builder.build_repair_prompt(
+                generation_prompt=prompt,
+                previous_notebook_text=notebook_builder.notebook_to_response_text(notebook_json_string, output_mode),
+                validation_report=report,
+                output_mode=output_mode,
+            )
+            raw_repair_response = request_ai_response(
+                config,
+                repair_prompt,
+                generation_config_override = output_mode_generation_config(config),
+                system_instruction = system_instruction,
+            )
+            repaired_json_string = notebook_builder.create_ipynb_from_response(raw_repair_response, output_mode)
+
+            report_stage("validating_notebook")
+            repaired_report = notebook_validator.validate_notebook(
+                repaired_json_string, data_file_paths, cell_timeout=cell_timeout
+            )
+            repaired_report['repair_attempted'] = True
+            if repaired_report['ok']:
+                logging.info("Repaired notebook passed validation.")
+                notebook_json_string, report = repaired_json_string, repaired_report
+            else:
+                logging.warning("Repaired notebook still fails validation; keeping the original.")
+                report['repair_attempted'] = True
+    except Exception as e:
+        logging.warning(f"Notebook validation skipped: {e}", exc_info=True)
+        report = {'ok': None, 'skipped_reason': str(e)}
+
+    return notebook_validator.attach_validation_report(notebook_json_string, report)
+
+def input_processor_runner(config: dict) -> Callable:
+    """
+    Returns `run(fn, *args)` for input processors: a direct call, or with
+    SANDBOX_INPUT_PROCESSING a call in the resource-limited sandbox pool
+    (per-task SANDBOX_CPU_SECONDS / SANDBOX_WALL_TIMEOUT override the pool defaults).
+    """
+    if not config.get('SANDBOX_INPUT_PROCESSING'):
+        return lambda fn, *args: fn(*args)
+    pool = sandbox.get_sandbox_pool()
+    cpu_seconds = config.get('SANDBOX_CPU_SECONDS')
+    wall_timeout = config.get('SANDBOX_WALL_TIMEOUT')
+    return lambda fn, *args: pool.run(fn, *args, cpu_seconds=cpu_seconds, wall_timeout=wall_timeout)
+
+
+def reuse_cached_notebook(
+        csv_summaries: list[dict],
+        user_goal: str,
+        config: dict,
+        report_stage: Callable[[str], None],
+) -> str | None:
+    """
+    Optional stage (SCHEMA_CACHE_ENABLED): looks for a past generation whose
+    schema is at least SCHEMA_CACHE_MIN_SIMILARITY similar and, if found,
+    returns its notebook remapped to the new file and column names. With
+    SCHEMA_CACHE_DELTA, a non-exact match also gets a short model call for the
+    cells that need to change. Returns None on a miss; cache failures are
+    logged and treated as a miss.
+    """
+    min_similarity = float(config.get('SCHEMA_CACHE_MIN_SIMILARITY', schema_cache.DEFAULT_MIN_SIMILARITY))
+    try:
+        report_stage("checking_schema_cache")
+        match = schema_cache.get_schema_cache().lookup(csv_summaries, user_goal, min_similarity)
+    except Exception as e:
+        logging.warning(f"Schema cache lookup failed: {e}", exc_info=True)
+        return None
+    if match is None:
+        logging.info("Schema cache miss.")
+        return None
+
+    logging.info(f"Schema cache hit: entry {match['entry_id']} with similarity {match['similarity']:.3f}.")
+    report_stage("schema_cache_hit")
+    notebook_json_string = schema_cache.remap_notebook(match['notebook'], match)
+    report = {
+        'similarity': match['similarity'],
+        'entry_id': match['entry_id'],
+        'column_renames': match['column_renames'],
+        'added_columns': match['added_columns'],
+        'removed_columns': match['removed_columns'],
+        'delta_cells': None,
+    }
+
+    if match['similarity'] < 1.0 and config.get('SCHEMA_CACHE_DELTA'):
+        try:
+            report_stage("requesting_delta")
+            delta_prompt = prompt_builder.build_delta_prompt(
+                notebook_builder.notebook_to_response_text(notebook_json_string, notebook_builder.OUTPUT_MODE_JSON),
+                csv_summaries,
+                match,
+            )
+            raw_delta = request_ai_response(
+                config,
+                delta_prompt,
+                generation_config_override = {
+                    'response_mime_type': 'application/json',
+                    'response_schema': notebook_builder.NOTEBOOK_DELTA_SCHEMA,
+                },
+            )
+            notebook_json_string, report['delta_cells'] = notebook_builder.apply_notebook_delta(notebook_json_string, raw_delta)
+        except Exception as e:
+            # The remapped notebook is still usable; the delta only refines it.
+            logging.warning(f"Notebook delta failed, using the remapped notebook as is: {e}", exc_info=True)
+
+    return schema_cache.attach_cache_report(notebook_json_string, report)
+
+
+def store_in_schema_cache(csv_summaries: list[dict], user_goal: str, notebook_json_string: str) -> None:
+    """Remembers a freshly generated notebook, unless its smoke test failed."""
+    metadata = json.loads(notebook_json_string).get('metadata', {}).get('ai_notebook_generator', {})
+    if (metadata.get('validation') or {}).get('ok') is False:
+        logging.info("Not caching a notebook that failed validation.")
+        return
+    try:
+        schema_cache.get_schema_cache().store(csv_summaries, user_goal, notebook_json_string)
+    except Exception as e:
+        logging.warning(f"Could not store the notebook in the schema cache: {e}", exc_info=True)
+
 def run_generation_pipeline (
-        csv_file_path : str,
+        csv_file_path : str | list[str],
         pdf_file_path: str,
         config: dict,
 
         ipynb_file_path: str | None = None,
         user_goal: str | None = None,
+        progress_callback: Callable[[str], None] | None = None,
+        cell_callback: Callable[[int, str, str], None] | None = None,
 ) -> str:
+    """
+    `csv_file_path` may be a list of data files for multi-table inputs; the
+    first one is treated as the primary table.
+
+    `cell_callback(index, cell_type, source)` receives the notebook's cells as
+    they are generated (the model response is streamed when it is set). They
+    are the cells of the first draft; validation may still repair the notebook,
+    so the returned notebook is authoritative.
+    """
     
     logging.info("Starting notebook generation pipeline...")
+    data_file_paths = list(csv_file_path) if isinstance(csv_file_path, (list, tuple)) else [csv_file_path]
+
+    def report_stage(stage: str):
+        # Lets callers (e.g. the job queue) surface partial progress while the pipeline runs.
+        if progress_callback:
+            progress_callback(stage)
 
-    if not os.path .exists(csv_file_path):
-        raise FileNotFoundError(f"CSV file not Found!: {csv_file_path}")
+    if not data_file_paths:
+        raise OrchestrationError("At least one data file is required.")
+    for data_file_path in data_file_paths:
+        if not os.path .exists(data_file_path):
+            raise FileNotFoundError(f"Data file not Found!: {data_file_path}")
+    data_file_names = [os.path.basename(path.rstrip('/\\')) for path in data_file_paths]
+    if len(set(data_file_names)) != len(data_file_names):
+        # The notebook refers to the tables by file name, so names must be unambiguous.
+        raise OrchestrationError(f"Data files must have distinct names: {data_file_names}")
     if not os.path .exists(pdf_file_path):
         raise FileNotFoundError(f"PDF file not Found!: {pdf_file_path}")
     if ipynb_file_path and not os.path .exists(ipynb_file_path):
@@ -31,37 +281,69 @@ def run_generation_pipeline (
     
     if not config.get('GEMINI_MODEL_NAME'):
         raise OrchestrationError("Configuration missing 'GEMINI_MODEL_NAME'")
+
+    output_mode = config.get('OUTPUT_MODE', notebook_builder.OUTPUT_MODE_TAGS)
+    if output_mode not in (notebook_builder.OUTPUT_MODE_TAGS, notebook_builder.OUTPUT_MODE_JSON):
+        raise OrchestrationError(f"Unknown OUTPUT_MODE '{output_mode}'")
+    if config.get('AI_BACKEND', ai_client.AI_BACKEND_GEMINI) not in (ai_client.AI_BACKEND_GEMINI, ai_client.AI_BACKEND_STUB):
+        raise OrchestrationError(f"Unknown AI_BACKEND '{config['AI_BACKEND']}'")
     
 
     try:
-        logging.info(f'Processing Csv file : {csv_file_path}')
-        csv_summary = input_processor.process_csv(csv_file_path)
-        logging.info(f'CSV processing successful.')
+        report_stage("processing_inputs")
+        logging.info(f'Processing data file(s) : {data_file_paths}')
+        run_processor = input_processor_runner(config)
+        # Join-key sketches are built from the DataFrames profiling already loaded.
+        sketch_join_keys = len(data_file_paths) > 1
+        if config.get('SANDBOX_INPUT_PROCESSING'):
+            # One sandboxed task per file, so each file gets its own worker and limits.
+            with ThreadPoolExecutor(max_workers=sandbox.get_sandbox_pool().size) as executor:
+                csv_summaries = list(executor.map(
+                    lambda path: run_processor(input_processor.process_data_file, path, 5, sketch_join_keys),
+                    data_file_paths,
+                ))
+        else:
+            csv_summaries = input_processor.process_data_files(data_file_paths, sketch_join_keys=sketch_join_keys)
+        logging.info(f'Data file processing successful.')
+
+        join_keys_summary = None
+        if sketch_join_keys:
+            logging.info("Discovering join keys between the tables...")
+            table_sketches = [summary.pop('join_key_sketches') for summary in csv_summaries]
+            join_keys_summary = join_keys.format_join_keys(join_keys.discover_join_keys(table_sketches))
         
         logging.info(f"Processing PDF: {pdf_file_path}")
-        pdf_text = input_processor.process_pdf(pdf_file_path)
+        pdf_text = run_processor(input_processor.process_pdf, pdf_file_path)
         logging.info("PDF processing successful.")
 
         ipynb_context = None
         if ipynb_file_path:
             logging.info(f'Processing ipynb file: {ipynb_file_path}')
-            ipynb_context = input_processor.process_ipynb(ipynb_file_path)
+            ipynb_context = run_processor(input_processor.process_ipynb, ipynb_file_path)
             logging.info('IPYNB processing successful.')
         else:
             logging.info('No ipynb file provided')
+    except sandbox.ResourceLimitExceeded as e:
+        logging.warning(f"Input processing stopped by the sandbox ({e.limit} limit): {e}")
+        raise OrchestrationError(f"An input file exceeded the {e.limit.replace('_', ' ')} limit: {e}") from e
     except Exception as e:
         logging.info(f"Error during input processing: {e}", exc_info=True)      
         raise OrchestrationError(f"Failed to process input files: {e}") from e
   
     
+    effective_user_goal = user_goal or "Perform standard Exploratory Data Analysis (EDA) and suggest next steps."
+
     #    --Build prompt--
     try:
+        report_stage("building_prompt")
         logging.info("Building prompt for AI model!")
-        prompt = prompt_builder.build_generation_prompt(
-            csv_summary=csv_summary, 
+        system_instruction, prompt = prompt_builder.build_prompt_parts(
+            csv_summary=csv_summaries if len(csv_summaries) > 1 else csv_summaries[0],
             pdf_text=pdf_text,
-            user_goal = user_goal or "Perform standard Exploratory Data Analysis (EDA) and suggest next steps.",
+            user_goal = effective_user_goal,
             ipynb_context = ipynb_context,
+            output_mode = output_mode,
+            join_keys_summary = join_keys_summary,
         )
         logging.info("Prompt built successfully.")
     except Exception as e:
@@ -69,32 +351,71 @@ def run_generation_pipeline (
         raise OrchestrationError(f"Failed to build prompt: {e}") from e
     
 
-    # --Call Ai--
-    try:
-        logging.info(f"calling Ai model in our case we use gemini {config['GEMINI_MODEL_NAME']}")
-        raw_ai_response = ai_client.get_gemini_response(
-            prompt = prompt,
-            api_key =config['GEMINI_API_KEY'],
-            model_name = config['GEMINI_MODEL_NAME']  
-        )
+    cell_stream = notebook_builder.CellStreamParser(output_mode, cell_callback) if cell_callback else None
 
-        if not raw_ai_response:
-            raise OrchestrationError("Received empty response from AI model.")
-        logging.info("AI response received successfully.")
+    # --Reuse a notebook for a same-shaped dataset (optional)--
+    cached_notebook = None
+    if config.get('SCHEMA_CACHE_ENABLED'):
+        cached_notebook = reuse_cached_notebook(csv_summaries, effective_user_goal, config, report_stage)
 
-    except Exception as e:
-        logging.info(f"Error during AI call: {e}", exc_info=True)
-        raise OrchestrationError(f"Failed to get response from AI: {e}") from e
+    if cached_notebook is not None:
+        notebook_json_string = cached_notebook
+    elif config.get('HEDGE_ENABLED'):
+        # --Call Ai (hedged) + Build Notebook--
+        try:
+            report_stage("calling_ai")
+            notebook_json_string = generate_notebook_hedged(prompt, system_instruction, config)
+        except Exception as e:
+            logging.info(f"Error during hedged AI call: {e}", exc_info=True)
+            raise OrchestrationError(f"Failed to get a valid notebook from AI: {e}") from e
+    else:
+        # --Call Ai--
+        try:
+            report_stage("calling_ai")
+            logging.info(f"calling Ai model in our case we use gemini {config['GEMINI_MODEL_NAME']}")
+            raw_ai_response = request_ai_response(
+                config,
+                prompt,
+                generation_config_override = output_mode_generation_config(config),
+                system_instruction = system_instruction,
+                on_text_chunk = cell_stream.feed if cell_stream else None
+            )
+            if cell_stream:
+                cell_stream.close()
+
+            if not raw_ai_response:
+                raise OrchestrationError("Received empty response from AI model.")
+            logging.info("AI response received successfully.")
+
+        except Exception as e:
+            logging.info(f"Error during AI call: {e}", exc_info=True)
+            raise OrchestrationError(f"Failed to get response from AI: {e}") from e
     
-    # --Build Notebook--
+        # --Build Notebook--
 
-    try:
-        logging.info("Building .ipynb file from AI response!")
-        notebook_json_string = notebook_builder.create_ipynb_from_ai_response(raw_ai_response)
-        logging.info(".ipynb file built successfully.")
-    except Exception as e:
-        logging.error(f"Error during notebook building: {e}", exc_info=True)
-        raise OrchestrationError(f"Failed to construct notebook from AI response: {e}") from e
+        try:
+            report_stage("building_notebook")
+            logging.info("Building .ipynb file from AI response!")
+            notebook_json_string = notebook_builder.create_ipynb_from_response(raw_ai_response, output_mode)
+            logging.info(".ipynb file built successfully.")
+        except Exception as e:
+            logging.error(f"Error during notebook building: {e}", exc_info=True)
+            raise OrchestrationError(f"Failed to construct notebook from AI response: {e}") from e
+
+    if cell_stream:
+        # Cached and hedged notebooks arrive whole, and the final parse may find cells the stream could not.
+        for index, (cell_type, source) in enumerate(notebook_builder.notebook_cells(notebook_json_string)):
+            if index >= cell_stream.cells_emitted:
+                cell_callback(index, cell_type, source)
+
+    # --Validate Notebook (optional)--
+    if config.get('VALIDATE_NOTEBOOK'):
+        notebook_json_string = validate_generated_notebook(
+            notebook_json_string, prompt, system_instruction, data_file_paths, config, report_stage
+        )
+
+    if config.get('SCHEMA_CACHE_ENABLED') and cached_notebook is None:
+        store_in_schema_cache(csv_summaries, effective_user_goal, notebook_json_string)
     
     # --return result--
     logging.info("Notebook generation pipeline completed successfully.")
@@ -5,6 +5,11 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 MARKDOWN_TAG = "[MARKDOWN]"
 CODE_TAG = "[CODE]"
+REPAIR_TRACEBACK_MAX_CHARS = 3000
+
+# Output modes should match those used in notebook_builder.py
+OUTPUT_MODE_TAGS = "tags"
+OUTPUT_MODE_JSON = "json"
 
 def format_csv_summary(csv_summary: dict) -> str:
     if not csv_summary:
@@ -14,32 +19,40 @@ def format_csv_summary(csv_summary: dict) -> str:
         f"- **File Name:** `{csv_summary.get('file_name', 'N/A')}`",
         f"- **Shape:** {csv_summary.get('shape', 'N/A')} (rows, columns)",
         f"- **Columns:** {', '.join(csv_summary.get('columns', []))}",
+    ]
+    if csv_summary.get('load_call'):
+        # Sniffed delimiter/encoding/header; the notebook must load the file the same way.
+        summary_parts.append(f"- **Load With (detected format):** `{csv_summary['load_call']}`")
+    summary_parts += [
         f"- **Data Types Summary:**\n```\n{csv_summary.get('dtypes_summary', 'N/A')}\n```",
+        f"- **Memory Usage (deep, per column):**\n```\n{csv_summary.get('memory_usage_summary', 'N/A')}\n```",
         f"- **Data Preview (First few rows):**\n```\n{csv_summary.get('head_preview', 'N/A')}\n```",
         f"- **Descriptive Statistics:**\n```\n{csv_summary.get('description_stats', 'N/A')}\n```",
-        f"- **Missing Values Summary:**\n```\n{csv_summary.get('missing_values_summary', 'N/A')}\n```"
+        f"- **Missing Values Summary:**\n```\n{csv_summary.get('missing_values_summary', 'N/A')}\n```",
+        f"- **Strongest Column Associations:**\n```\n{csv_summary.get('associations_summary', 'N/A')}\n```"
     ]
     return "\n".join(summary_parts)
 
+def format_data_summaries(csv_summaries: list[dict]) -> str:
+    if len(csv_summaries) == 1:
+        return format_csv_summary(csv_summaries[0])
+    return "\n\n".join(
+        f"*Table {i}: `{summary.get('file_name', 'N/A')}`*\n{format_csv_summary(summary)}"
+        for i, summary in enumerate(csv_summaries, start=1)
+    )
+
 def format_ipynb_context(ipynb_context: dict | None) -> str:
     if not ipynb_context:
         return "No existing notebook context provided."
     return ipynb_context.get('message', 'Could not parse IPYNB context.')
 
 
-def build_generation_prompt(
-    csv_summary: dict,
-    pdf_text: str,
-    ipynb_context: dict | None = None,
-    user_goal: str | None = None
-    ) -> str:
-    
-    logging.info("Building generation prompt...")
-
-    # --- Define the AI's Role and Task ---
-    role_and_task = f"""You are an expert Python data scientist AI assistant. Your task is to generate a complete Jupyter Notebook (.ipynb) file content based on the provided data summary, data description, and user goal.
+# --- Static Instructions ---
+# Identical for every request, so it is rendered once and can be sent as a cached
+# system instruction; everything request-specific goes into the dynamic part.
+_ROLE = "You are an expert Python data scientist AI assistant. Your task is to generate a complete Jupyter Notebook (.ipynb) file content based on the provided data summary, data description, and user goal."
 
-The output MUST be a single block of text containing alternating Markdown and Python code cells, clearly delimited by `{MARKDOWN_TAG}` and `{CODE_TAG}` respectively.
+_TAG_OUTPUT_FORMAT = f"""The output MUST be a single block of text containing alternating Markdown and Python code cells, clearly delimited by `{MARKDOWN_TAG}` and `{CODE_TAG}` respectively.
 Example:
 {MARKDOWN_TAG}
 # Notebook Title
@@ -52,32 +65,103 @@ print("Libraries imported.")
 ## Load Data
 Now, we load the data.
 {CODE_TAG}
-# Code to load data goes here...
+# Code to load data goes here..."""
 
-Follow these instructions precisely:
-1.  **Structure:** Generate a logical flow for a data science task: Setup -> Load Data -> Data Cleaning/Preparation -> Exploratory Data Analysis (EDA) -> Feature Engineering (if applicable/needed) -> Modeling (if requested or appropriate) -> Conclusion/Summary.
+_JSON_OUTPUT_EXAMPLE = json.dumps({"cells": [
+    {"cell_type": "markdown", "source": "# Notebook Title\nThis is an introductory markdown cell."},
+    {"cell_type": "code", "source": "import pandas as pd\nimport numpy as np\nprint(\"Libraries imported.\")"},
+    {"cell_type": "markdown", "source": "## Load Data\nNow, we load the data."},
+    {"cell_type": "code", "source": "# Code to load data goes here..."},
+]}, indent=2)
+
+_JSON_OUTPUT_FORMAT = f"""The output MUST be a single JSON object with a `cells` list. Each cell is an object with `cell_type` ("markdown" or "code") and `source` (the full cell content as one string, using \\n for line breaks).
+Example:
+{_JSON_OUTPUT_EXAMPLE}"""
+
+_COMMON_RULES = """1.  **Structure:** Generate a logical flow for a data science task: Setup -> Load Data -> Data Cleaning/Preparation -> Exploratory Data Analysis (EDA) -> Feature Engineering (if applicable/needed) -> Modeling (if requested or appropriate) -> Conclusion/Summary.
 2.  **Content:** Use the provided CSV Summary and PDF Description to understand the data and guide your analysis. Reference column names accurately.
-3.  **Code:** Write clean, runnable Python code using standard libraries (pandas, numpy, matplotlib, seaborn, scikit-learn). Add comments to explain complex code sections. Assume the primary data file (details below) is available in the execution environment as '{csv_summary.get('file_name', 'data.csv')}'. **Crucially**, make sure the *first* code block imports necessary libraries.
+3.  **Code:** Write clean, runnable Python code using standard libraries (pandas, numpy, matplotlib, seaborn, scikit-learn). Add comments to explain complex code sections. Assume the primary data file is available in the execution environment under the exact name given in the input context below. **Crucially**, make sure the *first* code block imports necessary libraries.
 4.  **Markdown:** Use Markdown cells effectively to explain the steps, observations, and rationale behind the code.
-5.  **Artifacts:** Where appropriate (especially for EDA plots or final datasets/models), include Python code to SAVE the output to a file (e.g., `plt.savefig('plot_name.png')`, `df.to_csv('processed_data.csv')`, `joblib.dump(model, 'model.pkl')`). Print a confirmation message after saving (e.g., `print("Plot saved to plot_name.png")`).
-6.  **Formatting:** Start with a `{MARKDOWN_TAG}` cell for the title. Ensure every Markdown section starts exactly with `{MARKDOWN_TAG}` on a new line and every code section starts exactly with `{CODE_TAG}` on a new line. Do NOT include any other text before or after these tags on their respective lines.
-7.  **Completeness:** Generate the full notebook content in one continuous response. Do not add introductory or concluding remarks outside the tagged cell structure.
+5.  **Artifacts:** Where appropriate (especially for EDA plots or final datasets/models), include Python code to SAVE the output to a file (e.g., `plt.savefig('plot_name.png')`, `df.to_csv('processed_data.csv')`, `joblib.dump(model, 'model.pkl')`). Print a confirmation message after saving (e.g., `print("Plot saved to plot_name.png")`)."""
+
+_TAG_RULES = f"""6.  **Formatting:** Start with a `{MARKDOWN_TAG}` cell for the title. Ensure every Markdown section starts exactly with `{MARKDOWN_TAG}` on a new line and every code section starts exactly with `{CODE_TAG}` on a new line. Do NOT include any other text before or after these tags on their respective lines.
+7.  **Completeness:** Generate the full notebook content in one continuous response. Do not add introductory or concluding remarks outside the tagged cell structure."""
+
+_JSON_RULES = """6.  **Formatting:** The first cell must be a markdown cell with the title. Put raw Markdown or raw Python in `source`; do NOT wrap code in ``` fences and do NOT use cell tags.
+7.  **Completeness:** Return the full notebook as one JSON object and nothing else: no introductory or concluding remarks outside the JSON."""
+
+SYSTEM_INSTRUCTION = f"""{_ROLE}
+
+{_TAG_OUTPUT_FORMAT}
+
+Follow these instructions precisely:
+{_COMMON_RULES}
+{_TAG_RULES}
 """
 
+# Variant for OUTPUT_MODE_JSON, used together with a response schema on the model side.
+JSON_SYSTEM_INSTRUCTION = f"""{_ROLE}
+
+{_JSON_OUTPUT_FORMAT}
+
+Follow these instructions precisely:
+{_COMMON_RULES}
+{_JSON_RULES}
+"""
+
+_OUTPUT_INSTRUCTIONS = {
+    OUTPUT_MODE_TAGS: (SYSTEM_INSTRUCTION, f"Generate the notebook content now, starting with `{MARKDOWN_TAG}`:"),
+    OUTPUT_MODE_JSON: (JSON_SYSTEM_INSTRUCTION, "Generate the notebook JSON object now:"),
+}
+
+
+def build_prompt_parts(
+    csv_summary: dict | list[dict],
+    pdf_text: str,
+    ipynb_context: dict | None = None,
+    user_goal: str | None = None,
+    output_mode: str = OUTPUT_MODE_TAGS,
+    join_keys_summary: str | None = None
+    ) -> tuple[str, str]:
+    """
+    Returns (static_prefix, dynamic_prompt). The prefix is the system instruction
+    for `output_mode` and does not depend on the inputs; the dynamic prompt
+    holds the data context. `csv_summary` may be a list of summaries for
+    multi-table inputs, with the discovered relationships in `join_keys_summary`.
+    """
+    static_prefix, output_request = _OUTPUT_INSTRUCTIONS[output_mode]
+    logging.info("Building generation prompt...")
+
     # --- Format Input Information ---
-    formatted_csv_summary = format_csv_summary(csv_summary)
+    csv_summaries = csv_summary if isinstance(csv_summary, list) else [csv_summary] if csv_summary else []
+    formatted_csv_summary = format_data_summaries(csv_summaries) if csv_summaries else format_csv_summary(None)
     formatted_pdf_text = pdf_text if pdf_text else "No data description provided."
     formatted_ipynb_context = format_ipynb_context(ipynb_context)
     final_user_goal = user_goal if user_goal else "Perform a comprehensive Exploratory Data Analysis (EDA) and provide insights."
+    data_file_name = csv_summaries[0].get('file_name', 'data.csv') if csv_summaries else 'data.csv'
+
+    if len(csv_summaries) > 1:
+        file_list = ", ".join(f"'{summary.get('file_name', 'N/A')}'" for summary in csv_summaries)
+        data_location = f"""The data consists of {len(csv_summaries)} related tables, available in the execution environment as {file_list}. The primary data file is '{data_file_name}'.
+Load every table and merge them using the relationships listed below (check the key columns' types match before merging)."""
+        relationships_section = f"""
+**Table Relationships (candidate join keys, estimated from value overlap):**
+```text
+{join_keys_summary or "No join keys were detected between the tables."}
+```
+"""
+    else:
+        data_location = f"The primary data file is available in the execution environment as '{data_file_name}'."
+        relationships_section = ""
 
-    # --- Assemble the Final Prompt ---
-    prompt = f"""{role_and_task}
+    # --- Assemble the Dynamic Prompt ---
+    dynamic_prompt = f"""--- INPUT DATA CONTEXT ---
 
---- INPUT DATA CONTEXT ---
+{data_location}
 
 **1. CSV Data Summary:**
 {formatted_csv_summary}
-
+{relationships_section}
 **2. Data Description (from PDF):**
 ```text
 {formatted_pdf_text}
@@ -90,8 +174,106 @@ Follow these instructions precisely:
 {final_user_goal}
 
 --- REQUIRED NOTEBOOK OUTPUT ---
-Generate the notebook content now, starting with `{MARKDOWN_TAG}`:
+{output_request}
 """
 
     logging.info("Prompt built successfully.")
+    return static_prefix, dynamic_prompt
+
+
+def build_generation_prompt(
+    csv_summary: dict | list[dict],
+    pdf_text: str,
+    ipynb_context: dict | None = None,
+    user_goal: str | None = None,
+    output_mode: str = OUTPUT_MODE_TAGS,
+    join_keys_summary: str | None = None
+    ) -> str:
+    """Single-string form of build_prompt_parts, for callers that cannot send a system instruction."""
+    static_prefix, dynamic_prompt = build_prompt_parts(
+        csv_summary, pdf_text, ipynb_context, user_goal, output_mode, join_keys_summary
+    )
+    return f"{static_prefix}\n{dynamic_prompt}"
+
+
+def build_repair_prompt(
+    generation_prompt: str,
+    previous_notebook_text: str,
+    validation_report: dict,
+    output_mode: str = OUTPUT_MODE_TAGS,
+    ) -> str:
+    """
+    Asks the model to regenerate a notebook that failed validation, giving it
+    the original request, its previous answer and the failing cell's error.
+    """
+    logging.info("Building repair prompt...")
+
+    prompt = f"""{generation_prompt}
+
+--- PREVIOUS ATTEMPT ---
+{previous_notebook_text}
+
+--- VALIDATION FAILURE ---
+The notebook above was executed top to bottom on a small sample of the data and failed.
+
+**Failing code cell (cell #{validation_report.get('failed_cell_index', '?')}):**
+```python
+{validation_report.get('failed_cell_source', '')}
+```
+
+**Error:** `{validation_report.get('error_name', '')}: {validation_report.get('error_value', '')}`
+```text
+{validation_report.get('traceback', '')[-REPAIR_TRACEBACK_MAX_CHARS:]}
+```
+
+--- REQUIRED NOTEBOOK OUTPUT ---
+Regenerate the COMPLETE notebook with this error fixed (and any similar issues elsewhere), following all the formatting instructions.
+{_OUTPUT_INSTRUCTIONS[output_mode][1]}
+"""
+
+    logging.info("Repair prompt built successfully.")
+    return prompt
+
+
+def build_delta_prompt(
+    cached_notebook_text: str,
+    csv_summary: dict | list[dict],
+    schema_changes: dict,
+    ) -> str:
+    """
+    Asks for a small set of cell edits that adapt a notebook generated for a
+    similar dataset to the new one, instead of a full regeneration.
+    """
+    logging.info("Building delta prompt...")
+    csv_summaries = csv_summary if isinstance(csv_summary, list) else [csv_summary]
+
+    renamed = [
+        f"{old} -> {new}" for renames in schema_changes.get('column_renames', []) for old, new in renames.items()
+    ]
+    change_lines = [
+        f"- Renamed columns (already updated where quoted): {', '.join(renamed) or 'none'}",
+        f"- New columns: {', '.join(f'{f}.{c}' for f, c in schema_changes.get('added_columns', [])) or 'none'}",
+        f"- Removed columns: {', '.join(f'{f}.{c}' for f, c in schema_changes.get('removed_columns', [])) or 'none'}",
+    ]
+    change_text = "\n".join(change_lines)
+
+    prompt = f"""You are an expert Python data scientist AI assistant. The Jupyter notebook below was written for a dataset with almost the same schema as the new one described afterwards. File names and quoted column names have already been updated.
+
+--- EXISTING NOTEBOOK (JSON, cells indexed from 0) ---
+{cached_notebook_text}
+
+--- SCHEMA CHANGES ---
+{change_text}
+
+--- NEW DATA SUMMARY ---
+{format_data_summaries(csv_summaries)}
+
+--- REQUIRED OUTPUT ---
+Return ONLY the edits needed for the notebook to run correctly on the new data and to cover the new columns, as a JSON object:
+- `replace`: list of {{"cell_index", "cell_type", "source"}} giving the full new content of existing cells that must change.
+- `append`: list of {{"cell_type", "source"}} for new cells to add at the end of the notebook.
+Leave unchanged cells out. If nothing needs to change, return empty lists.
+"""
+
+    logging.info("Delta prompt built successfully.")
     return prompt
@@ -0,0 +1,340 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:  # not available on Windows; workers then run without OS limits
+    resource = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MEMORY_LIMIT_MB = 2048  # address space a worker may add to what it inherits from the host (RLIMIT_AS)
+DEFAULT_CPU_SECONDS = 120  # CPU time per task (RLIMIT_CPU)
+DEFAULT_WALL_TIMEOUT = 300.0  # seconds per task, covers tasks that block without using CPU
+WORKER_ACQUIRE_TIMEOUT = 600.0
+WORKER_START_TIMEOUT = 30.0
+
+
+class SandboxError(Exception):
+    """Raised when a sandboxed task cannot be run or its worker dies unexpectedly."""
+    pass
+
+
+class ResourceLimitExceeded(SandboxError):
+    """Raised when a sandboxed task exceeds its memory, CPU or wall-clock limit."""
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit  # 'memory', 'cpu' or 'wall_time'
+
+
+# --- Worker process ---
+
+def _set_cpu_limit(cpu_seconds: float | None) -> None:
+    """RLIMIT_CPU counts the process's total CPU time, so each task's limit is relative to what was used so far."""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if cpu_seconds is None:
+        soft = hard
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _caused_by_memory_error(error: BaseException) -> bool:
+    """Processors wrap their errors, so the MemoryError may sit further down the cause chain."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, MemoryError):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _virtual_memory_size() -> int | None:
+    """The process's current address-space size (VmSize) in bytes, where /proc is available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmSize:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _set_memory_limit(memory_limit_bytes: int | None) -> None:
+    """
+    A forked worker starts with the host's whole address space, which grows
+    as the server runs, so the limit is headroom on top of the worker's own
+    size at startup rather than an absolute RLIMIT_AS.
+    """
+    if resource is None or not memory_limit_bytes:
+        return
+    soft = memory_limit_bytes + (_virtual_memory_size() or 0)
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _worker_main(conn, memory_limit_bytes: int | None) -> None:
+    # Ctrl+C in the parent must not kill idle workers mid-protocol; the parent shuts them down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _set_memory_limit(memory_limit_bytes)
+    conn.send('ready')
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args, kwargs, cpu_seconds = task
+        _set_cpu_limit(cpu_seconds)
+        try:
+            conn.send(('ok', fn(*args, **kwargs)))
+        except Exception as e:
+            if _caused_by_memory_error(e):
+                # The heap may be left fragmented near the limit; report and let the pool respawn the worker.
+                conn.send(('memory', "Task ran out of memory."))
+                return
+            try:
+                conn.send(('error', e))
+            except Exception:
+                # Unpicklable exception: send its text instead.
+                conn.send(('error_text', f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+
+# --- Pool ---
+
+class _Worker:
+    def __init__(self, context, memory_limit_bytes: int | None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit_bytes), daemon=True, name="sandbox-worker"
+        )
+        self.process.start()
+        child_conn.close()
+        try:
+            self._wait_ready()
+        except Exception:
+            self.kill()
+            raise
+
+    def _wait_ready(self) -> None:
+        try:
+            if not self.conn.poll(WORKER_START_TIMEOUT):
+                raise SandboxError("Sandbox worker did not start in time.")
+            self.conn.recv()
+        except (EOFError, ConnectionResetError) as e:
+            raise SandboxError(f"Sandbox worker exited during startup (exit code {self.process.exitcode}).") from e
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    A fixed set of long-lived worker processes running tasks under OS
+    resource limits: RLIMIT_AS for memory (per worker), RLIMIT_CPU for CPU
+    time and a wall-clock timeout (per task). A worker that breaks a limit is
+    killed and replaced; the caller gets ResourceLimitExceeded.
+
+    Workers are forked where the platform allows it, so they start with
+    pandas and the processors already imported and a respawn costs
+    milliseconds. Spawn (which re-imports the host's main module) is only
+    used where fork is unavailable.
+
+    The memory limit is headroom: address space a worker may allocate on
+    top of what it inherits from the host at fork time, so replacements
+    forked later from a grown host get the same budget. Workers that could
+    not be replaced are started again on the next run.
+    """
+
+    def __init__(
+        self,
+        size: int = DEFAULT_POOL_SIZE,
+        memory_limit_mb: int | None = DEFAULT_MEMORY_LIMIT_MB,
+        cpu_seconds: float | None = DEFAULT_CPU_SECONDS,
+        wall_timeout: float | None = DEFAULT_WALL_TIMEOUT,
+    ):
+        if size < 1:
+            raise ValueError("Sandbox pool size must be at least 1.")
+        self.size = size
+        self.memory_limit_bytes = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.cpu_seconds = cpu_seconds
+        self.wall_timeout = wall_timeout
+        if resource is None:
+            logging.warning("The 'resource' module is unavailable; sandbox workers run without memory and CPU limits.")
+
+        start_methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('fork' if 'fork' in start_methods else 'spawn')
+        self._idle: queue.Queue = queue.Queue()
+        self._workers: list[_Worker] = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            logging.info(f"Starting {self.size} sandbox worker(s)...")
+            try:
+                for _ in range(self.size):
+                    worker = _Worker(self._context, self.memory_limit_bytes)
+                    self._workers.append(worker)
+                    self._idle.put(worker)
+            except SandboxError:
+                for worker in self._workers:
+                    worker.kill()
+                self._workers = []
+                self._idle = queue.Queue()
+                raise
+            self._started = True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except (OSError, ValueError):
+                    pass
+                worker.process.join(timeout=5)
+                worker.kill()
+            self._workers = []
+            self._idle = queue.Queue()
+            self._started = False
+
+    def _replenish(self) -> None:
+        """Tops the pool back up to `size` after replacements failed."""
+        with self._lock:
+            while self._started and len(self._workers) < self.size:
+                try:
+                    worker = _Worker(self._context, self.memory_limit_bytes)
+                except SandboxError as e:
+                    if not self._workers:
+                        raise SandboxError(f"No sandbox worker could be started: {e}") from e
+                    logging.warning(f"Could not start sandbox worker, continuing with {len(self._workers)}: {e}")
+                    return
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+    def _replace(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if not self._started:
+                return
+            try:
+                replacement = _Worker(self._context, self.memory_limit_bytes)
+            except SandboxError as e:
+                logging.error(f"Could not replace sandbox worker, retrying on the next run: {e}")
+                return
+            self._workers.append(replacement)
+        self._idle.put(replacement)
+
+    def run(
+        self,
+        fn,
+        *args,
+        cpu_seconds: float | None = None,
+        wall_timeout: float | None = None,
+        **kwargs,
+    ):
+        """
+        Runs `fn(*args, **kwargs)` in a worker and returns its result. `fn`,
+        the arguments and the result must be picklable (module-level
+        functions and plain data). Exceptions raised by `fn` are re-raised
+        here; limit violations raise ResourceLimitExceeded.
+        """
+        self.start()
+        self._replenish()
+        cpu_seconds = cpu_seconds if cpu_seconds is not None else self.cpu_seconds
+        wall_timeout = wall_timeout if wall_timeout is not None else self.wall_timeout
+        try:
+            worker = self._idle.get(timeout=WORKER_ACQUIRE_TIMEOUT)
+        except queue.Empty as e:
+            raise SandboxError("Timed out waiting for a free sandbox worker.") from e
+
+        healthy = False
+        started = time.monotonic()
+        task_name = getattr(fn, '__name__', repr(fn))
+        try:
+            if not worker.process.is_alive():
+                raise SandboxError("Sandbox worker exited while idle.")
+            worker.conn.send((fn, args, kwargs, cpu_seconds))
+            if not worker.conn.poll(wall_timeout):
+                raise ResourceLimitExceeded(
+                    'wall_time', f"{task_name} did not finish within {wall_timeout:g}s and was stopped."
+                )
+            try:
+                status, payload = worker.conn.recv()
+            except (EOFError, ConnectionResetError):
+                worker.process.join(timeout=5)
+                raise self._death_error(worker, task_name) from None
+
+            if status == 'memory':
+                raise ResourceLimitExceeded(
+                    'memory', f"{task_name} exceeded the {self.memory_limit_bytes // (1024 * 1024)} MB memory limit."
+                )
+            healthy = True
+            if status == 'ok':
+                return payload
+            if status == 'error_text':
+                raise SandboxError(payload)
+            raise payload
+        finally:
+            logging.info(f"Sandboxed {task_name} finished in {time.monotonic() - started:.2f}s.")
+            if healthy:
+                self._idle.put(worker)
+            else:
+                self._replace(worker)
+
+    def _death_error(self, worker: _Worker, task_name: str) -> SandboxError:
+        exit_code = worker.process.exitcode
+        if exit_code == -signal.SIGXCPU:
+            return ResourceLimitExceeded('cpu', f"{task_name} exceeded its CPU time limit.")
+        if exit_code == -signal.SIGKILL:
+            # The kernel's OOM killer (or the hard CPU limit) is the usual sender of SIGKILL here.
+            return ResourceLimitExceeded('memory', f"{task_name} was killed by the operating system (out of memory?).")
+        return SandboxError(f"Sandbox worker died while running {task_name} (exit code {exit_code}).")
+
+
+_default_pool: SandboxPool | None = None
+_default_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """
+    Returns the process-wide sandbox pool. Size and limits come from the
+    SANDBOX_WORKERS, SANDBOX_MEMORY_LIMIT_MB, SANDBOX_CPU_SECONDS and
+    SANDBOX_WALL_TIMEOUT environment variables.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SandboxPool(
+                size=int(os.environ.get("SANDBOX_WORKERS", DEFAULT_POOL_SIZE)),
+                memory_limit_mb=int(os.environ.get("SANDBOX_MEMORY_LIMIT_MB", DEFAULT_MEMORY_LIMIT_MB)),
+                cpu_seconds=float(os.environ.get("SANDBOX_CPU_SECONDS", DEFAULT_CPU_SECONDS)),
+                wall_timeout=float(os.environ.get("SANDBOX_WALL_TIMEOUT", DEFAULT_WALL_TIMEOUT)),
+            )
+        return _default_pool
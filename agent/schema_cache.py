@@ -0,0 +1,360 @@
+import contextlib
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+import nbformat
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "ai_notebook_schema_cache", "schema_cache.sqlite3")
+DEFAULT_MIN_SIMILARITY = 0.9
+MINHASH_PERMUTATIONS = 64
+LSH_ROWS_PER_BAND = 2  # 32 bands of 2: schemas with column-set Jaccard >= ~0.4 almost always share a band
+MAX_CANDIDATES = 50  # near-match candidates scored exactly per lookup
+COLUMN_RENAME_MIN_RATIO = 0.6  # name similarity needed to treat a changed column as renamed
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fingerprint TEXT NOT NULL,
+    goal_key TEXT NOT NULL,
+    schema TEXT NOT NULL,
+    notebook TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_generations_fingerprint ON generations (fingerprint, goal_key);
+CREATE TABLE IF NOT EXISTS generation_bands (
+    band_key TEXT NOT NULL,
+    entry_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_generation_bands_key ON generation_bands (band_key);
+"""
+
+
+# --- Schema descriptors ---
+
+def dtype_kind(dtype_name: str) -> str:
+    """Coarse type of a column; exact widths vary between extracts (downcasting, NaNs) and are ignored."""
+    name = dtype_name.lower()
+    if name.startswith(('int', 'uint', 'float')):
+        return 'numeric'
+    if name.startswith('bool'):
+        return 'bool'
+    if name.startswith(('datetime', 'timedelta', 'period')):
+        return 'datetime'
+    return 'string'
+
+
+def loader_signature(summary: dict) -> str | None:
+    """
+    The summary's load call with the file name factored out, e.g.
+    "pd.read_csv({file}, sep=';', encoding='cp1252')". A cached notebook is
+    only valid for inputs read the same way: the format, sniffed CSV options
+    and compression not implied by the suffix all appear in the call.
+    """
+    load_call = summary.get('load_call')
+    if not load_call:
+        return None
+    return load_call.replace(repr(summary.get('file_name', '')), '{file}', 1)
+
+
+def schema_from_summaries(summaries: list[dict]) -> list[dict]:
+    """[{'file_name', 'loader', 'columns': [[name, kind], ...]}, ...] in table order."""
+    schema = []
+    for summary in summaries:
+        dtypes = summary.get('column_dtypes') or {}
+        schema.append({
+            'file_name': summary.get('file_name', ''),
+            'loader': loader_signature(summary),
+            'columns': [[str(c), dtype_kind(dtypes.get(str(c), 'object'))] for c in summary.get('columns', [])],
+        })
+    return schema
+
+
+def schema_fingerprint(schema: list[dict]) -> str:
+    """
+    Identifies a schema by its loaders and column names and kinds, but not file
+    names, so every monthly extract shares one fingerprint.
+    """
+    tables = [[table.get('loader'), table['columns']] for table in schema]
+    return hashlib.sha256(json.dumps(tables).encode('utf-8')).hexdigest()
+
+
+def goal_key(user_goal: str | None) -> str:
+    normalized = " ".join((user_goal or '').lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _schema_tokens(schema: list[dict]) -> set[str]:
+    return {f"{t}\x1f{name}\x1f{kind}" for t, table in enumerate(schema) for name, kind in table['columns']}
+
+
+def minhash_signature(tokens: set[str], num_permutations: int = MINHASH_PERMUTATIONS) -> list[int]:
+    signature = []
+    for seed in range(num_permutations):
+        salt = seed.to_bytes(8, 'little')
+        signature.append(min(
+            (int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8, salt=salt).digest(), 'little')
+             for token in tokens),
+            default=0,
+        ))
+    return signature
+
+
+def _band_keys(signature: list[int]) -> list[str]:
+    keys = []
+    for start in range(0, len(signature), LSH_ROWS_PER_BAND):
+        band = ",".join(str(v) for v in signature[start:start + LSH_ROWS_PER_BAND])
+        keys.append(f"{start // LSH_ROWS_PER_BAND}:{hashlib.sha1(band.encode('utf-8')).hexdigest()[:16]}")
+    return keys
+
+
+# --- Matching and remapping ---
+
+def match_schemas(cached_schema: list[dict], new_schema: list[dict]) -> dict | None:
+    """
+    Aligns a cached schema with a new one, table by table in order. Columns
+    with the same name and kind match exactly; remaining columns of the same
+    kind are paired as renames when their names are similar enough.
+
+    Returns None if the table counts or any table's loader differ (the cached
+    notebook's load calls would not read the new files), otherwise a dict with
+    'similarity' (0..1; renames count by name similarity), 'file_renames',
+    'column_renames' (one dict per table), 'added_columns' and
+    'removed_columns' (lists of (file_name, column)).
+    """
+    if len(cached_schema) != len(new_schema):
+        return None
+    if any(cached.get('loader') != new.get('loader') for cached, new in zip(cached_schema, new_schema)):
+        return None
+
+    matched_score = 0.0
+    union_size = 0
+    file_renames = {}
+    column_renames = []
+    added, removed = [], []
+    for cached_table, new_table in zip(cached_schema, new_schema):
+        if cached_table['file_name'] != new_table['file_name']:
+            file_renames[cached_table['file_name']] = new_table['file_name']
+        cached_columns = {name: kind for name, kind in cached_table['columns']}
+        new_columns = {name: kind for name, kind in new_table['columns']}
+        exact = {name for name in cached_columns if new_columns.get(name) == cached_columns[name]}
+
+        old_only = [name for name in cached_columns if name not in exact]
+        new_only = [name for name in new_columns if name not in exact]
+        scored = sorted(
+            (
+                (difflib.SequenceMatcher(None, old, new).ratio(), old, new)
+                for old in old_only for new in new_only
+                if cached_columns[old] == new_columns[new]
+            ),
+            reverse=True,
+        )
+        renames = {}
+        for ratio, old, new in scored:
+            if ratio < COLUMN_RENAME_MIN_RATIO:
+                break
+            if old in renames or new in renames.values():
+                continue
+            renames[old] = new
+            matched_score += ratio
+
+        matched_score += len(exact)
+        union_size += len(set(cached_columns) | set(new_columns)) - len(renames)
+        column_renames.append(renames)
+        removed += [(cached_table['file_name'], c) for c in old_only if c not in renames]
+        added += [(new_table['file_name'], c) for c in new_only if c not in renames.values()]
+
+    return {
+        'similarity': round(matched_score / union_size, 4) if union_size else 1.0,
+        'file_renames': file_renames,
+        'column_renames': column_renames,
+        'added_columns': added,
+        'removed_columns': removed,
+    }
+
+
+def _alternation(names) -> re.Pattern | None:
+    if not names:
+        return None
+    # Longest first, so a name that is a prefix of another does not win.
+    return re.compile("|".join(re.escape(name) for name in sorted(names, key=len, reverse=True)))
+
+
+def remap_notebook(notebook_json: str, match: dict) -> str:
+    """
+    Rewrites a cached notebook for the new inputs: renamed files and columns
+    are replaced where they are a whole quoted string literal (or `code` span
+    in Markdown), files also as the last component of a quoted path such as
+    'data/old.csv'. Comments, prose, longer names that merely contain an old
+    name, and attribute access such as df.old_name (which could just as well
+    be a method) are left alone.
+    """
+    notebook = nbformat.reads(notebook_json, as_version=4)
+
+    # A column renamed differently in two tables can't be rewritten safely by name.
+    column_renames = {}
+    conflicting = set()
+    for renames in match['column_renames']:
+        for old, new in renames.items():
+            if column_renames.get(old, new) != new:
+                conflicting.add(old)
+            column_renames[old] = new
+    for old in conflicting:
+        column_renames.pop(old)
+
+    # Single-pass substitutions, so swapped names (a -> b, b -> a) are not rewritten twice.
+    file_pattern = _alternation(match['file_renames'])
+    column_pattern = _alternation(column_renames)
+    for cell in notebook.cells:
+        source = cell.source
+        if file_pattern:
+            source = re.sub(
+                r"(['\"`])([^'\"`\n]*[/\\])?(" + file_pattern.pattern + r")\1",
+                lambda m: f"{m.group(1)}{m.group(2) or ''}{match['file_renames'][m.group(3)]}{m.group(1)}",
+                source,
+            )
+        if column_pattern:
+            source = re.sub(
+                r"(['\"`])(" + column_pattern.pattern + r")\1",
+                lambda m: f"{m.group(1)}{column_renames[m.group(2)]}{m.group(1)}",
+                source,
+            )
+        cell.source = source
+
+    # Results from the original run (e.g. its validation) do not describe this notebook.
+    notebook.metadata.pop('ai_notebook_generator', None)
+    return nbformat.writes(notebook)
+
+
+def attach_cache_report(notebook_json: str, report: dict) -> str:
+    """Stores how the notebook was reused (similarity, renames, delta) in its metadata."""
+    notebook = nbformat.reads(notebook_json, as_version=4)
+    notebook.metadata.setdefault('ai_notebook_generator', {})['schema_cache'] = report
+    return nbformat.writes(notebook)
+
+
+# --- Index ---
+
+class SchemaCache:
+    """
+    Local SQLite index of past generations keyed by schema fingerprint, with
+    MinHash LSH bands over column names for near matches.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def store(self, summaries: list[dict], user_goal: str | None, notebook_json: str) -> int:
+        schema = schema_from_summaries(summaries)
+        bands = _band_keys(minhash_signature(_schema_tokens(schema)))
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(
+                    "INSERT INTO generations (fingerprint, goal_key, schema, notebook, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (schema_fingerprint(schema), goal_key(user_goal), json.dumps(schema), notebook_json, time.time()),
+                )
+                entry_id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO generation_bands (band_key, entry_id) VALUES (?, ?)",
+                    [(band, entry_id) for band in bands],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        logging.info(f"Stored notebook for schema {schema_fingerprint(schema)[:12]} in the schema cache.")
+        return entry_id
+
+    def lookup(
+        self,
+        summaries: list[dict],
+        user_goal: str | None,
+        min_similarity: float = DEFAULT_MIN_SIMILARITY,
+    ) -> dict | None:
+        """
+        Finds the most similar past generation for the same goal. An identical
+        schema fingerprint is a similarity-1.0 hit; otherwise MinHash LSH
+        candidates are scored with match_schemas. Returns the match dict plus
+        'entry_id' and 'notebook', or None below `min_similarity`.
+        """
+        schema = schema_from_summaries(summaries)
+        goal = goal_key(user_goal)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT entry_id, schema, notebook FROM generations WHERE fingerprint = ? AND goal_key = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (schema_fingerprint(schema), goal),
+            ).fetchone()
+            candidates = [row] if row is not None else []
+            if row is None and min_similarity < 1.0:
+                bands = _band_keys(minhash_signature(_schema_tokens(schema)))
+                candidates = conn.execute(
+                    f"SELECT g.entry_id, g.schema, g.notebook FROM generations g JOIN ("
+                    f"  SELECT entry_id, COUNT(*) AS shared FROM generation_bands "
+                    f"  WHERE band_key IN ({','.join('?' * len(bands))}) GROUP BY entry_id"
+                    f") b ON b.entry_id = g.entry_id WHERE g.goal_key = ? "
+                    f"ORDER BY b.shared DESC, g.created_at DESC LIMIT ?",
+                    (*bands, goal, MAX_CANDIDATES),
+                ).fetchall()
+
+        best = None
+        for candidate in candidates:
+            match = match_schemas(json.loads(candidate['schema']), schema)
+            if match is None or match['similarity'] < min_similarity:
+                continue
+            if best is None or match['similarity'] > best['similarity']:
+                best = {**match, 'entry_id': candidate['entry_id'], 'notebook': candidate['notebook']}
+        return best
+
+    def purge(self, older_than: float) -> int:
+        """Deletes entries older than `older_than` seconds."""
+        cutoff = time.time() - older_than
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM generation_bands WHERE entry_id IN (SELECT entry_id FROM generations WHERE created_at < ?)",
+                    (cutoff,),
+                )
+                cursor = conn.execute("DELETE FROM generations WHERE created_at < ?", (cutoff,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+
+_default_cache: SchemaCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_schema_cache() -> SchemaCache:
+    """Returns the process-wide schema cache (location from the SCHEMA_CACHE_DB_PATH environment variable)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SchemaCache(os.environ.get("SCHEMA_CACHE_DB_PATH", DEFAULT_DB_PATH))
+        return _default_cache
@@ -1,12 +1,20 @@
 import streamlit as st
 import os
+import json
 import tempfile # To handle uploaded files safely
+import shutil
+import time
 from dotenv import load_dotenv
 import logging
 
-# Import the orchestrator from our agent package
-from agent import orchestrator
-from agent.orchestrator import OrchestrationError # Import specific exception
+# Import the job queue from our agent package; it runs the orchestrator pipeline in the background
+from agent import job_queue
+from agent import input_processor
+from agent import hedging
+
+AVAILABLE_MODELS = ("gemini-2.0-flash", "gemini-2.5-pro-experimental-03-25") # Add other compatible models if desired
+JOB_POLL_INTERVAL = 1.0 # Seconds between status checks while a job is in flight
+PIPELINE_ERROR_TYPES = ('OrchestrationError', 'FileNotFoundError', 'ValueError')
 
 # --- Basic Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,7 +24,7 @@ load_dotenv() # Load environment variables from .env file
 st.set_page_config(layout="wide", page_title="AI Notebook Generator")
 st.title("🤖 AI Data Science Notebook Generator")
 st.markdown("""
-Upload your data (CSV), provide a description (PDF), and optionally an existing notebook for context.
+Upload your data (CSV, compressed CSV, Parquet or Feather), provide a description (PDF), and optionally an existing notebook for context.
 The AI will generate a new Jupyter Notebook (`.ipynb`) to kickstart your analysis.
 """)
 
@@ -28,6 +36,8 @@ if 'error_message' not in st.session_state:
     st.session_state.error_message = None
 if 'api_key_valid' not in st.session_state:
     st.session_state.api_key_valid = False
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
 if 'gemini_api_key' not in st.session_state:
     st.session_state.gemini_api_key = os.environ.get("GEMINI_API_KEY", "") # Initialize from .env
 
@@ -61,12 +71,74 @@ with st.sidebar:
     # Model Selection (Add more models as needed/available)
     model_name = st.selectbox(
         "Select Gemini Model:",
-        ("gemini-2.0-flash", "gemini-2.5-pro-experimental-03-25"), # Add other compatible models if desired
+        AVAILABLE_MODELS,
         index=0 # Default to flash
     )
 
+    structured_output = st.checkbox(
+        "Structured JSON output",
+        value=True,
+        help="Ask the model for schema-constrained JSON cells instead of tagged text. Tagged text is still accepted as a fallback."
+    )
+
+    # Hedging: send a duplicate request if the primary is unusually slow, keep whichever valid notebook arrives first
+    hedge_enabled = st.checkbox(
+        "Hedge slow requests",
+        value=False,
+        help="If the model is slower than usual (95th percentile of recent calls), a second request is sent and the first valid notebook wins."
+    )
+    hedge_model_name = st.selectbox(
+        "Hedge with model:",
+        AVAILABLE_MODELS,
+        index=AVAILABLE_MODELS.index(model_name),
+        disabled=not hedge_enabled
+    )
+    if hedge_enabled:
+        with st.expander("Hedging statistics (this server)"):
+            st.json(hedging.get_hedge_stats())
+
+    # Validation executes generated code on this server, so the operator enables it (VALIDATE_NOTEBOOK,
+    # REPAIR_ON_VALIDATION_FAILURE in .env), as for the HTTP API; users can only opt out
+    validation_allowed = os.environ.get("VALIDATE_NOTEBOOK", "").lower() in ("1", "true", "yes")
+    repair_allowed = validation_allowed and os.environ.get("REPAIR_ON_VALIDATION_FAILURE", "").lower() in ("1", "true", "yes")
+    validate_notebook = st.checkbox(
+        "Smoke-test the notebook on sampled data",
+        value=validation_allowed,
+        disabled=not validation_allowed,
+        help="Runs the generated code cells against a small sample of your data in a local Jupyter kernel."
+        + ("" if validation_allowed else " Disabled on this server (set VALIDATE_NOTEBOOK to enable).")
+    )
+    repair_on_failure = st.checkbox(
+        "Ask the model to fix a failing notebook",
+        value=repair_allowed,
+        disabled=not (repair_allowed and validate_notebook)
+    )
+
+    # Schema cache: reuse an earlier notebook when the new data has (almost) the same columns
+    use_schema_cache = st.checkbox(
+        "Reuse notebooks for same-schema data",
+        value=False,
+        help="If a notebook was generated before for data with the same (or very similar) columns and goal, reuse it with file and column names updated instead of calling the model."
+    )
+    schema_cache_min_similarity = st.slider(
+        "Minimum schema similarity",
+        min_value=0.5, max_value=1.0, value=0.9, step=0.05,
+        disabled=not use_schema_cache
+    )
+    schema_cache_delta = st.checkbox(
+        "Ask the model to adapt near matches",
+        value=True,
+        disabled=not use_schema_cache,
+        help="For non-identical schemas, a short model call updates only the cells that need to change."
+    )
+
     st.header("Inputs")
-    uploaded_csv = st.file_uploader("1. Upload Data File (.csv)", type=['csv'])
+    uploaded_data_files = st.file_uploader(
+        "1. Upload Data File(s) (.csv/.tsv/.txt, optionally .gz/.zst/.bz2/.xz/.zip compressed, .parquet, .feather)",
+        type=['csv', 'tsv', 'txt', 'gz', 'zst', 'bz2', 'xz', 'zip', 'parquet', 'feather'],
+        accept_multiple_files=True,
+        help="Upload several related tables to have them merged; the first file is treated as the primary table."
+    )
     uploaded_pdf = st.file_uploader("2. Upload Data Description (.pdf)", type=['pdf'])
     uploaded_ipynb = st.file_uploader("3. Upload Existing Notebook (Optional, .ipynb)", type=['ipynb'])
 
@@ -78,18 +150,21 @@ with st.sidebar:
 
     # --- Generate Button ---
     # Disable button if essential inputs are missing
-    required_inputs_present = uploaded_csv and uploaded_pdf and st.session_state.api_key_valid
+    required_inputs_present = uploaded_data_files and uploaded_pdf and st.session_state.api_key_valid
+    # One job per session at a time: uploads get fresh temp files, so the queue can't deduplicate a second click
+    session_job = job_queue.get_job_queue().get_job(st.session_state.job_id) if st.session_state.job_id else None
+    session_job_in_flight = session_job is not None and session_job['status'] in job_queue.ACTIVE_JOB_STATUSES
     generate_button = st.button(
         "✨ Generate Notebook",
         type="primary",
-        disabled=not required_inputs_present,
-        help="Requires CSV, PDF, and a valid API Key to be set."
+        disabled=not required_inputs_present or session_job_in_flight,
+        help="Requires a data file, PDF, and a valid API Key to be set."
     )
     if not required_inputs_present:
         if not st.session_state.api_key_valid:
              st.warning("Please enter your Gemini API Key.")
-        if not uploaded_csv:
-             st.warning("Please upload a CSV file.")
+        if not uploaded_data_files:
+             st.warning("Please upload a data file.")
         if not uploaded_pdf:
              st.warning("Please upload a PDF file.")
 
@@ -106,9 +181,17 @@ if generate_button and required_inputs_present:
     # Use temporary files to store uploaded data for the orchestrator
     # Using 'with' ensures files are cleaned up automatically
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_csv:
-            tmp_csv.write(uploaded_csv.getvalue())
-            tmp_csv_path = tmp_csv.name
+        # Keep the original file names: they tell the input processor the format (e.g. '.csv.gz')
+        # and the generated notebook loads the tables by these names
+        tmp_data_dir = tempfile.mkdtemp(prefix="uploaded_data_")
+        tmp_data_paths = []
+        for uploaded_file in uploaded_data_files:
+            tmp_data_path = os.path.join(tmp_data_dir, os.path.basename(uploaded_file.name))
+            if tmp_data_path in tmp_data_paths:
+                raise ValueError(f"Two uploaded data files are named '{uploaded_file.name}'.")
+            with open(tmp_data_path, "wb") as tmp_data_file:
+                tmp_data_file.write(uploaded_file.getvalue())
+            tmp_data_paths.append(tmp_data_path)
 
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_pdf:
             tmp_pdf.write(uploaded_pdf.getvalue())
@@ -123,48 +206,88 @@ if generate_button and required_inputs_present:
         # Prepare configuration for the orchestrator
         config = {
             'GEMINI_API_KEY': st.session_state.gemini_api_key,
-            'GEMINI_MODEL_NAME': model_name
+            'GEMINI_MODEL_NAME': model_name,
+            'OUTPUT_MODE': 'json' if structured_output else 'tags',
+            'HEDGE_ENABLED': hedge_enabled,
+            'HEDGE_MODEL_NAME': hedge_model_name,
+            'VALIDATE_NOTEBOOK': validation_allowed and validate_notebook,
+            'REPAIR_ON_VALIDATION_FAILURE': repair_allowed and validate_notebook and repair_on_failure,
+            'SCHEMA_CACHE_ENABLED': use_schema_cache,
+            'SCHEMA_CACHE_MIN_SIMILARITY': schema_cache_min_similarity,
+            'SCHEMA_CACHE_DELTA': use_schema_cache and schema_cache_delta,
+            # Operator setting rather than a user choice: isolates input parsing in resource-limited workers
+            'SANDBOX_INPUT_PROCESSING': os.environ.get("SANDBOX_INPUT_PROCESSING", "").lower() in ("1", "true", "yes"),
+            'USE_CONTEXT_CACHE': os.environ.get("USE_CONTEXT_CACHE", "").lower() in ("1", "true", "yes"),
         }
 
-        logging.info("Starting orchestrator pipeline via Streamlit...")
-        with st.spinner(f"🚀 Generating notebook using {model_name}... This may take a moment."):
-            try:
-                # Call the main function of the orchestrator
-                generated_json = orchestrator.run_generation_pipeline(
-                    csv_file_path=tmp_csv_path,
-                    pdf_file_path=tmp_pdf_path,
-                    config=config,
-                    ipynb_file_path=tmp_ipynb_path, # Will be None if no file uploaded
-                    user_goal=user_goal
-                )
-                st.session_state.generated_notebook_content = generated_json
-                st.success("✅ Notebook generated successfully!")
-                logging.info("Orchestrator pipeline completed successfully.")
-
-            except (OrchestrationError, FileNotFoundError, ValueError) as e:
-                st.session_state.error_message = f"Pipeline Error: {e}"
-                logging.error(f"Orchestration failed: {e}", exc_info=True)
-            except Exception as e: # Catch any other unexpected errors
-                 st.session_state.error_message = f"An unexpected error occurred: {e}"
-                 logging.error(f"Unexpected error in pipeline: {e}", exc_info=True)
+        logging.info("Submitting generation job via Streamlit...")
+        # The queue moves the temporary files into its own directory (no copy), so submission returns immediately
+        st.session_state.job_id = job_queue.get_job_queue().submit(
+            csv_file_path=tmp_data_paths if len(tmp_data_paths) > 1 else tmp_data_paths[0],
+            pdf_file_path=tmp_pdf_path,
+            config=config,
+            ipynb_file_path=tmp_ipynb_path, # Will be None if no file uploaded
+            user_goal=user_goal,
+            input_mode=job_queue.INPUT_MOVE
+        )
+        logging.info(f"Submitted job {st.session_state.job_id}.")
+
+    except (FileNotFoundError, ValueError, OSError) as e:
+        st.session_state.error_message = f"Could not submit generation job: {e}"
+        logging.error(f"Job submission failed: {e}", exc_info=True)
 
     finally:
         # Ensure temporary files are deleted even if errors occur
         logging.debug("Cleaning up temporary files...")
-        if 'tmp_csv_path' in locals() and os.path.exists(tmp_csv_path):
-            os.remove(tmp_csv_path)
-            logging.debug(f"Removed temp CSV: {tmp_csv_path}")
+        if 'tmp_data_dir' in locals() and os.path.exists(tmp_data_dir):
+            shutil.rmtree(tmp_data_dir, ignore_errors=True)
+            logging.debug(f"Removed temp data directory: {tmp_data_dir}")
         if 'tmp_pdf_path' in locals() and os.path.exists(tmp_pdf_path):
             os.remove(tmp_pdf_path)
             logging.debug(f"Removed temp PDF: {tmp_pdf_path}")
-        if tmp_ipynb_path and os.path.exists(tmp_ipynb_path):
+        if 'tmp_ipynb_path' in locals() and tmp_ipynb_path and os.path.exists(tmp_ipynb_path):
             os.remove(tmp_ipynb_path)
             logging.debug(f"Removed temp IPYNB: {tmp_ipynb_path}")
 
 
+# --- Poll the Background Job ---
+# The job runs outside this script run, so reruns (or a closed browser tab) do not lose it
+job_in_flight = False
+if st.session_state.job_id:
+    job = job_queue.get_job_queue().get_job(st.session_state.job_id)
+    if job is None:
+        st.session_state.error_message = "The generation job could not be found. Please try again."
+        st.session_state.job_id = None
+    elif job['status'] == job_queue.JOB_SUCCEEDED:
+        st.session_state.generated_notebook_content = job['result']
+        st.session_state.job_id = None
+        st.success("✅ Notebook generated successfully!")
+    elif job['status'] == job_queue.JOB_FAILED:
+        if job['error_type'] in PIPELINE_ERROR_TYPES:
+            st.session_state.error_message = f"Pipeline Error: {job['error']}"
+        else:
+            st.session_state.error_message = f"An unexpected error occurred: {job['error']}"
+        st.session_state.job_id = None
+    else:
+        job_in_flight = True
+
+
 # --- Display Results or Errors ---
 st.subheader("Output")
 
+if job_in_flight:
+    stage = (job['stage'] or job['status']).replace('_', ' ')
+    st.info(f"🚀 Generating notebook using {model_name}... Current step: {stage}")
+    # Partial results: cells stream in while the model is still writing the notebook
+    partial_cells = job_queue.get_job_queue().get_cells(st.session_state.job_id)
+    if partial_cells:
+        with st.expander(f"Preview: {len(partial_cells)} cell(s) generated so far", expanded=True):
+            for cell in partial_cells:
+                if cell['cell_type'] == 'code':
+                    st.code(cell['source'], language="python")
+                else:
+                    st.markdown(cell['source'])
+
 # Display errors if they occurred
 if st.session_state.error_message:
     st.error(st.session_state.error_message)
@@ -173,8 +296,10 @@ if st.session_state.error_message:
 if st.session_state.generated_notebook_content:
     # Determine a safe filename based on the uploaded CSV name
     base_filename = "generated_notebook"
-    if uploaded_csv:
-        base_filename = os.path.splitext(uploaded_csv.name)[0] + "_analysis"
+    if uploaded_data_files:
+        primary_name = uploaded_data_files[0].name
+        data_suffix = input_processor.data_file_suffix(primary_name)
+        base_filename = primary_name[:len(primary_name) - len(data_suffix)] + "_analysis"
 
     st.download_button(
         label="⬇️ Download Generated Notebook (.ipynb)",
@@ -182,10 +307,26 @@ if st.session_state.generated_notebook_content:
         file_name=f"{base_filename}.ipynb",
         mime="application/x-ipynb+json", # Standard MIME type for notebooks
     )
-    # Optional: Display a preview (e.g., first few cells - requires parsing the JSON)
-    # For simplicity, we'll just offer the download for now.
+    # Surface the smoke-test outcome stored in the notebook metadata, if validation ran
+    generator_metadata = json.loads(st.session_state.generated_notebook_content).get('metadata', {}).get('ai_notebook_generator', {})
+    reuse = generator_metadata.get('schema_cache')
+    if reuse:
+        delta_note = f", {reuse['delta_cells']} cell(s) adapted by the model" if reuse.get('delta_cells') is not None else ""
+        st.info(f"♻️ Reused an earlier notebook for a similar schema (similarity {reuse['similarity']:.0%}{delta_note}).")
+    validation = generator_metadata.get('validation')
+    if validation:
+        if validation.get('ok'):
+            st.success(f"🧪 Notebook ran cleanly on sampled data ({validation.get('cells_executed')} code cells, {validation.get('duration')}s).")
+        elif validation.get('ok') is False:
+            st.warning(
+                f"🧪 Cell #{validation.get('failed_cell_index')} failed on sampled data: "
+                f"{validation.get('error_name')}: {validation.get('error_value')}"
+            )
+            st.code(validation.get('failed_cell_source', ''), language='python')
+        else:
+            st.info(f"🧪 Validation was skipped: {validation.get('skipped_reason')}")
 
-elif not st.session_state.error_message and not generate_button:
+elif not st.session_state.error_message and not job_in_flight and not generate_button:
     st.info("Upload files and click 'Generate Notebook' to start.")
 
 
@@ -196,4 +337,10 @@ st.markdown("""
 - Ensure your API key is correctly entered or present in your `.env` file.
 - Larger files or complex goals may take longer to process.
 - The quality of the generated notebook depends heavily on the data description quality and the AI model's capabilities. **Always review generated code before execution.**
-""")
\ No newline at end of file
+""")
+
+
+# --- Keep Polling While a Job Is Running ---
+if job_in_flight:
+    time.sleep(JOB_POLL_INTERVAL)
+    st.rerun()
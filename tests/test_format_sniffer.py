@@ -0,0 +1,90 @@
+import gzip
+
+import pytest
+
+from agent import format_sniffer
+
+
+def test_comma_delimited_with_header():
+    dialect = format_sniffer.sniff_csv_text("id,name,price\n1,apple,1.5\n2,pear,2.25\n3,plum,0.75\n")
+    assert dialect['delimiter'] == ','
+    assert dialect['decimal'] == '.'
+    assert dialect['has_header'] is True
+    assert dialect['num_fields'] == 3
+
+
+@pytest.mark.parametrize('delimiter', [';', '\t', '|'])
+def test_other_delimiters(delimiter):
+    rows = [["id", "city", "amount"], ["1", "Lyon", "10"], ["2", "Paris", "20"], ["3", "Nice", "30"]]
+    text = "\n".join(delimiter.join(row) for row in rows) + "\n"
+    dialect = format_sniffer.sniff_csv_text(text)
+    assert dialect['delimiter'] == delimiter
+    assert dialect['num_fields'] == 3
+
+
+def test_semicolon_with_decimal_comma():
+    text = "id;price;weight\n1;1,50;0,25\n2;2,75;1,5\n3;10,00;3,125\n"
+    dialect = format_sniffer.sniff_csv_text(text)
+    assert dialect['delimiter'] == ';'
+    assert dialect['decimal'] == ','
+
+
+def test_delimiter_inside_quotes_is_ignored():
+    text = 'id,comment\n1,"fine; thanks"\n2,"late; again"\n3,"ok; done"\n'
+    dialect = format_sniffer.sniff_csv_text(text)
+    assert dialect['delimiter'] == ','
+    assert dialect['quotechar'] == '"'
+    assert dialect['num_fields'] == 2
+
+
+def test_headerless_numeric_file():
+    dialect = format_sniffer.sniff_csv_text("1,2.5,10\n2,3.5,20\n3,4.5,30\n4,5.5,40\n")
+    assert dialect['has_header'] is False
+    kwargs = format_sniffer.csv_read_kwargs(dialect)
+    assert kwargs['header'] is None
+    assert kwargs['names'] == ['column_1', 'column_2', 'column_3']
+
+
+def test_truncated_last_line_is_dropped():
+    text = "a;b;c\n1;2;3\n4;5;6\n7;8"
+    assert format_sniffer.sniff_csv_text(text, truncated=True)['num_fields'] == 3
+
+
+def test_empty_text_gets_defaults():
+    dialect = format_sniffer.sniff_csv_text("")
+    assert dialect['delimiter'] == ','
+    assert dialect['has_header'] is True
+
+
+@pytest.mark.parametrize('head, expected', [
+    ("id;név\n1;Ádám\n".encode('utf-8-sig'), ('utf-8-sig', True)),
+    ("id,name\n1,x\n".encode('utf-16'), ('utf-16', True)),
+    ("id;ville\n1;Besançon\n".encode('utf-8'), ('utf-8', False)),
+    ("id;ville\n1;Besançon €\n".encode('cp1252'), ('cp1252', False)),
+])
+def test_detect_encoding(head, expected):
+    assert format_sniffer.detect_encoding(head) == expected
+
+
+def test_sniff_file_reads_compressed_latin1_semicolon(tmp_path):
+    path = tmp_path / "export.csv"
+    with gzip.open(path, 'wb') as f:
+        f.write("id;ville;montant\n1;Besançon;1,5\n2;Orléans;2,25\n3;Nîmes;3,0\n".encode('cp1252'))
+    sniffed = format_sniffer.sniff_file(str(path))
+    assert sniffed['compression'] == 'gzip'
+    assert sniffed['encoding'] == 'cp1252'
+    assert sniffed['delimiter'] == ';'
+    assert sniffed['decimal'] == ','
+
+
+def test_format_read_call_spells_out_non_default_options():
+    kwargs = format_sniffer.csv_read_kwargs({
+        'delimiter': ';', 'encoding': 'cp1252', 'compression': 'gzip', 'decimal': ',', 'has_header': True,
+    })
+    # gzip is spelled out only when pandas would not infer it from the name.
+    assert format_sniffer.format_read_call('export.csv.gz', kwargs) == (
+        "pd.read_csv('export.csv.gz', sep=';', encoding='cp1252', decimal=',')"
+    )
+    assert format_sniffer.format_read_call('export.csv', kwargs) == (
+        "pd.read_csv('export.csv', sep=';', encoding='cp1252', compression='gzip', decimal=',')"
+    )
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+
+import pytest
+
+from agent import job_queue
+
+
+def _write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    return {
+        'csv': _write(str(data_dir / "sales.csv"), "a,b\n1,2\n"),
+        'pdf': _write(str(data_dir / "dictionary.pdf"), "%PDF-1.4\n"),
+    }
+
+
+@pytest.fixture
+def queue(tmp_path):
+    # Not started: tests drive claiming and running directly.
+    return job_queue.JobQueue(db_path=str(tmp_path / "queue" / "jobs.sqlite3"), lease_timeout=60.0)
+
+
+def _submit(queue, inputs, **kwargs):
+    return queue.submit(inputs['csv'], inputs['pdf'], {'GEMINI_API_KEY': 'AIza-test-key'}, **kwargs)
+
+
+def _set_updated_at(queue, job_id, updated_at):
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (updated_at, job_id))
+
+
+def test_submit_deduplicates_identical_in_flight_requests(queue, inputs):
+    first = _submit(queue, inputs, input_mode=job_queue.INPUT_REFERENCE)
+    assert _submit(queue, inputs, input_mode=job_queue.INPUT_REFERENCE) == first
+
+
+def test_fingerprint_changes_when_an_input_changes(inputs):
+    before = job_queue.compute_job_fingerprint(inputs, {}, "goal")
+    stat = os.stat(inputs['csv'])
+    os.utime(inputs['csv'], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert job_queue.compute_job_fingerprint(inputs, {}, "goal") != before
+    assert job_queue.compute_job_fingerprint(inputs, {}, "other goal") != before
+
+
+def test_secrets_are_not_stored(queue, inputs):
+    job_id = _submit(queue, inputs)
+    with queue._connect() as conn:
+        request = conn.execute("SELECT request FROM jobs WHERE job_id = ?", (job_id,)).fetchone()['request']
+    assert 'AIza-test-key' not in request
+
+
+def test_input_modes(queue, inputs):
+    _submit(queue, inputs, input_mode=job_queue.INPUT_REFERENCE)
+    referenced = queue._claim_next_job("w")
+    assert referenced['request']['files']['csv'] == os.path.realpath(inputs['csv'])
+
+    copied_id = queue.submit(inputs['csv'], inputs['pdf'], {}, user_goal="copy")
+    copied = queue._claim_next_job("w")
+    assert copied['job_id'] == copied_id
+    assert copied['request']['files']['csv'].startswith(os.path.join(queue.jobs_dir, copied_id))
+    assert os.path.exists(inputs['csv'])
+
+    queue.submit(inputs['csv'], inputs['pdf'], {}, user_goal="move", input_mode=job_queue.INPUT_MOVE)
+    moved = queue._claim_next_job("w")
+    assert os.path.exists(moved['request']['files']['csv'])
+    assert not os.path.exists(inputs['csv'])
+
+
+def test_submit_rejects_missing_files_and_unknown_modes(queue, inputs, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        queue.submit(str(tmp_path / "missing.csv"), inputs['pdf'], {})
+    with pytest.raises(ValueError):
+        _submit(queue, inputs, input_mode="symlink")
+
+
+def test_claim_marks_running_and_is_exclusive(queue, inputs):
+    job_id = _submit(queue, inputs)
+    job = queue._claim_next_job("worker-a")
+    assert job['job_id'] == job_id
+    assert job['worker_id'] == "worker-a"
+    assert queue.get_job(job_id)['status'] == job_queue.JOB_RUNNING
+    assert queue._claim_next_job("worker-b") is None
+
+
+def test_claims_oldest_job_first(queue, inputs):
+    first = _submit(queue, inputs, user_goal="first")
+    second = _submit(queue, inputs, user_goal="second")
+    assert [queue._claim_next_job("w")['job_id'], queue._claim_next_job("w")['job_id']] == [first, second]
+
+
+def test_abandoned_job_is_reclaimed_with_its_cells_cleared(queue, inputs):
+    job_id = _submit(queue, inputs)
+    queue._claim_next_job("worker-a")
+    queue._record_cell(job_id, 0, 'markdown', "# Draft")
+    assert queue._claim_next_job("worker-b") is None  # lease still fresh
+
+    _set_updated_at(queue, job_id, time.time() - queue.lease_timeout - 1)
+    job = queue._claim_next_job("worker-b")
+    assert job['job_id'] == job_id
+    assert job['worker_id'] == "worker-b"
+    assert queue.get_cells(job_id) == []
+
+
+def test_recorded_cell_refreshes_the_lease(queue, inputs):
+    job_id = _submit(queue, inputs)
+    queue._claim_next_job("worker-a")
+    _set_updated_at(queue, job_id, time.time() - queue.lease_timeout - 1)
+    queue._record_cell(job_id, 0, 'code', "import pandas as pd")
+    assert queue._claim_next_job("worker-b") is None
+    assert queue.get_cells(job_id) == [{'cell_index': 0, 'cell_type': 'code', 'source': "import pandas as pd"}]
+
+
+def test_heartbeat_refreshes_only_the_owning_workers_lease(queue, inputs):
+    queue.lease_timeout = 0.3
+    job_id = _submit(queue, inputs)
+    queue._claim_next_job("worker-a")
+    _set_updated_at(queue, job_id, 0)
+
+    stop = threading.Event()
+    stale = threading.Thread(target=queue._heartbeat, args=(job_id, "worker-b", stop))
+    stale.start()
+    time.sleep(0.25)
+    stop.set()
+    stale.join()
+    assert queue.get_job(job_id)['updated_at'] == 0
+
+    stop = threading.Event()
+    owner = threading.Thread(target=queue._heartbeat, args=(job_id, "worker-a", stop))
+    owner.start()
+    time.sleep(0.25)
+    stop.set()
+    owner.join()
+    assert queue.get_job(job_id)['updated_at'] > time.time() - 1
+
+
+def test_long_stage_is_not_stolen_by_another_worker(tmp_path, inputs):
+    runs = []
+
+    def slow_pipeline(**kwargs):
+        runs.append(kwargs['csv_file_path'])
+        time.sleep(1.0)
+        return "{}"
+
+    queue = job_queue.JobQueue(
+        db_path=str(tmp_path / "jobs.sqlite3"), num_workers=2, poll_interval=0.02, lease_timeout=0.3,
+        pipeline=slow_pipeline,
+    )
+    queue.start()
+    try:
+        job_id = _submit(queue, inputs)
+        deadline = time.time() + 5
+        while queue.get_job(job_id)['status'] in job_queue.ACTIVE_JOB_STATUSES and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        queue.stop(timeout=5)
+    assert queue.get_job(job_id)['status'] == job_queue.JOB_SUCCEEDED
+    assert len(runs) == 1
+    assert not os.path.exists(os.path.join(queue.jobs_dir, job_id))
+
+
+def test_failed_pipeline_marks_job_failed(tmp_path, inputs):
+    def failing_pipeline(**kwargs):
+        raise ValueError("bad input")
+
+    queue = job_queue.JobQueue(db_path=str(tmp_path / "jobs.sqlite3"), pipeline=failing_pipeline)
+    job_id = _submit(queue, inputs)
+    queue._run_job(queue._claim_next_job("w"))
+    job = queue.get_job(job_id)
+    assert (job['status'], job['error'], job['error_type']) == (job_queue.JOB_FAILED, "bad input", "ValueError")
+
+
+def test_purge_finished_removes_old_jobs_and_cells(queue, inputs):
+    queue.pipeline = lambda **kwargs: "{}"
+    job_id = _submit(queue, inputs)
+    queue._run_job(queue._claim_next_job("w"))
+    queue._record_cell(job_id, 0, 'code', "x = 1")
+    assert queue.purge_finished(older_than=-1) == 1
+    assert queue.get_job(job_id) is None
+    assert queue.get_cells(job_id) == []
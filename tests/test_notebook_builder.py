@@ -0,0 +1,61 @@
+import json
+
+import nbformat
+import pytest
+
+from agent import notebook_builder
+
+
+def _notebook(*sources):
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells = [nbformat.v4.new_markdown_cell(sources[0])] + [nbformat.v4.new_code_cell(s) for s in sources[1:]]
+    return nbformat.writes(notebook)
+
+
+def _cells(notebook_json):
+    return notebook_builder.notebook_cells(notebook_json)
+
+
+def test_replace_and_append():
+    delta = {
+        'replace': [{'cell_index': 1, 'cell_type': 'code', 'source': "df = pd.read_csv('b.csv')\n"}],
+        'append': [{'cell_type': 'markdown', 'source': '## Next steps'}],
+    }
+    original = _notebook("# Title", "df = pd.read_csv('a.csv')", "df.head()")
+    notebook, changed = notebook_builder.apply_notebook_delta(original, json.dumps(delta))
+    assert changed == 2
+    assert _cells(notebook) == [
+        ('markdown', "# Title"),
+        ('code', "df = pd.read_csv('b.csv')"),
+        ('code', "df.head()"),
+        ('markdown', "## Next steps"),
+    ]
+
+
+def test_fenced_delta_is_accepted():
+    delta = '```json\n{"replace": [{"cell_index": 0, "cell_type": "markdown", "source": "# New"}]}\n```'
+    notebook, changed = notebook_builder.apply_notebook_delta(_notebook("# Old", "x = 1"), delta)
+    assert changed == 1
+    assert _cells(notebook)[0] == ('markdown', "# New")
+
+
+def test_invalid_edits_are_skipped():
+    delta = {
+        'replace': [
+            {'cell_index': 5, 'cell_type': 'code', 'source': "x = 2"},
+            {'cell_index': '0', 'cell_type': 'code', 'source': "x = 2"},
+            {'cell_index': 1, 'cell_type': 'raw', 'source': "x = 2"},
+            "not an edit",
+        ],
+        'append': [{'cell_type': 'code', 'source': "   "}, "not a cell"],
+    }
+    original = _notebook("# Title", "x = 1")
+    notebook, changed = notebook_builder.apply_notebook_delta(original, json.dumps(delta))
+    assert changed == 0
+    assert _cells(notebook) == _cells(original)
+
+
+@pytest.mark.parametrize('delta_text', ["not json", "[1, 2]", None])
+def test_malformed_delta_raises(delta_text):
+    with pytest.raises(notebook_builder.NotebookBuilderError):
+        notebook_builder.apply_notebook_delta(_notebook("# Title"), delta_text)
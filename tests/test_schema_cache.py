@@ -0,0 +1,64 @@
+import nbformat
+
+from agent import schema_cache
+
+
+def _notebook(*sources):
+    notebook = nbformat.v4.new_notebook()
+    for cell_type, source in sources:
+        if cell_type == 'markdown':
+            notebook.cells.append(nbformat.v4.new_markdown_cell(source))
+        else:
+            notebook.cells.append(nbformat.v4.new_code_cell(source))
+    return nbformat.writes(notebook)
+
+
+def _sources(notebook_json):
+    return [cell.source for cell in nbformat.reads(notebook_json, as_version=4).cells]
+
+
+def _match(file_renames=None, column_renames=None):
+    return {'file_renames': file_renames or {}, 'column_renames': column_renames or []}
+
+
+def test_file_renames_only_touch_whole_names_in_literals():
+    notebook = _notebook(
+        ('code', "df = pd.read_csv('a.csv')\nother = pd.read_csv('data.csv')  # a.csv is the main table"),
+        ('markdown', "Load `a.csv` first; a.csv has one row per order."),
+    )
+    sources = _sources(schema_cache.remap_notebook(notebook, _match({'a.csv': 'b.csv'})))
+    assert sources[0] == "df = pd.read_csv('b.csv')\nother = pd.read_csv('data.csv')  # a.csv is the main table"
+    assert sources[1] == "Load `b.csv` first; a.csv has one row per order."
+
+
+def test_file_renames_keep_the_directory_of_quoted_paths():
+    notebook = _notebook(('code', 'df = pd.read_csv("inputs/a.csv")\nold = pd.read_csv("inputs/data_a.csv")'))
+    sources = _sources(schema_cache.remap_notebook(notebook, _match({'a.csv': 'b.csv'})))
+    assert sources[0] == 'df = pd.read_csv("inputs/b.csv")\nold = pd.read_csv("inputs/data_a.csv")'
+
+
+def test_swapped_names_are_rewritten_once():
+    notebook = _notebook(('code', "x = pd.read_csv('a.csv')\ny = pd.read_csv('b.csv')\nz = df[['left', 'right']]"))
+    match = _match({'a.csv': 'b.csv', 'b.csv': 'a.csv'}, [{'left': 'right', 'right': 'left'}])
+    sources = _sources(schema_cache.remap_notebook(notebook, match))
+    assert sources[0] == "x = pd.read_csv('b.csv')\ny = pd.read_csv('a.csv')\nz = df[['right', 'left']]"
+
+
+def test_column_renames_skip_attributes_and_longer_names():
+    notebook = _notebook(('code', "df['price'].mean()\ndf.price\ndf['price_usd']"))
+    sources = _sources(schema_cache.remap_notebook(notebook, _match(column_renames=[{'price': 'unit_price'}])))
+    assert sources[0] == "df['unit_price'].mean()\ndf.price\ndf['price_usd']"
+
+
+def test_conflicting_column_renames_are_left_alone():
+    notebook = _notebook(('code', "orders['id']\ncustomers['name']"))
+    match = _match(column_renames=[{'id': 'order_id', 'name': 'full_name'}, {'id': 'customer_id'}])
+    sources = _sources(schema_cache.remap_notebook(notebook, match))
+    assert sources[0] == "orders['id']\ncustomers['full_name']"
+
+
+def test_previous_run_metadata_is_dropped():
+    notebook = nbformat.reads(_notebook(('code', "x = 1")), as_version=4)
+    notebook.metadata['ai_notebook_generator'] = {'validation': {'ok': True}}
+    remapped = nbformat.reads(schema_cache.remap_notebook(nbformat.writes(notebook), _match()), as_version=4)
+    assert 'ai_notebook_generator' not in remapped.metadata